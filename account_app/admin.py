@@ -1,6 +1,9 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, ContentDevice, PrivateNotification, PublicNotification, UserLoginLog
+
+from core_app.admin import LargeTableAdmin
+from .models import User, ContentDevice, PrivateNotification, PublicNotification, UserLoginLog, LedgerEntry, \
+    BalanceSnapshot
 
 
 @admin.register(User)
@@ -67,3 +70,29 @@ class UserLoginLogAdmin(admin.ModelAdmin):
     raw_id_fields = ('user',)
     readonly_fields = ('created_at',)
     list_per_page = 20
+
+
+@admin.register(LedgerEntry)
+class LedgerEntryAdmin(LargeTableAdmin):
+    list_display = ('id', 'reference', 'kind', 'account', 'user', 'currency', 'amount', 'created_at')
+    list_filter = ('kind', 'account')
+    search_fields = ('reference', 'user__username')
+    raw_id_fields = ('user', 'currency')
+    list_select_related = ('user', 'currency')
+
+    # دفتر فقط اضافه‌شدنی است
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(BalanceSnapshot)
+class BalanceSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('account', 'user', 'currency', 'balance', 'last_entry_id', 'created_at')
+    list_filter = ('account',)
+    search_fields = ('user__username',)
+    raw_id_fields = ('user', 'currency')
+    readonly_fields = ('created_at',)
+    list_per_page = 20
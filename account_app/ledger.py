@@ -0,0 +1,158 @@
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db.models import Max, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from account_app.models import LedgerEntry, BalanceSnapshot, Wallet
+from market_app.models import Order
+
+AMOUNT_QUANT = Decimal('0.00000001')
+ZERO = Decimal(0)
+BATCH_SIZE = 1000
+# ردیف‌های جوان‌تر از این هنوز ممکن است کنار ردیف‌های commit نشده با id کوچکتر باشند
+SNAPSHOT_LAG = timedelta(minutes=1)
+
+
+class UnbalancedEntry(ValueError):
+    pass
+
+
+def new_reference(prefix):
+    return f'{prefix}:{uuid.uuid4().hex}'
+
+
+def entries(reference, legs):
+    """
+    Ledger rows of one movement from its ``(kind, account, user_id, currency_id, amount)`` legs.
+    The legs of each currency must add up to zero.
+    """
+    totals = defaultdict(Decimal)
+    rows = []
+    for kind, account, user_id, currency_id, amount in legs:
+        totals[currency_id] += amount
+        rows.append(LedgerEntry(reference=reference, kind=kind, account=account, user_id=user_id,
+                                currency_id=currency_id, amount=amount))
+    unbalanced = {currency_id: total for currency_id, total in totals.items() if total}
+    if unbalanced:
+        raise UnbalancedEntry(f"Movement {reference} does not balance: {unbalanced}")
+    return rows
+
+
+def post(reference, legs):
+    return LedgerEntry.objects.bulk_create(entries(reference, legs))
+
+
+def deposit(user, currency, amount, reference=None):
+    return post(reference or new_reference(LedgerEntry.DEPOSIT), [
+        (LedgerEntry.DEPOSIT, LedgerEntry.WALLET, user.pk, currency.pk, amount),
+        (LedgerEntry.DEPOSIT, LedgerEntry.EXTERNAL, None, currency.pk, -amount),
+    ])
+
+
+def withdraw(user, currency, amount, reference=None):
+    return post(reference or new_reference(LedgerEntry.WITHDRAWAL), [
+        (LedgerEntry.WITHDRAWAL, LedgerEntry.WALLET, user.pk, currency.pk, -amount),
+        (LedgerEntry.WITHDRAWAL, LedgerEntry.EXTERNAL, None, currency.pk, amount),
+    ])
+
+
+def trade_entries(results, market):
+    """
+    Ledger rows for the fills of a batch of match results: base and quote legs between buyer and
+    seller, plus one leg per side moving its fee to the fees account. Buyers pay fees in base,
+    sellers in quote, like the engine charges them.
+    """
+    base, quote = market.base_currency_id, market.quote_currency_id
+    rows = []
+    for result in results:
+        for fill in result.fills:
+            buyer, seller = (fill.taker, fill.maker) if fill.taker.side == Order.BUY else (fill.maker, fill.taker)
+            notional = (fill.price * fill.amount).quantize(AMOUNT_QUANT, rounding=ROUND_HALF_UP)
+            legs = [
+                (LedgerEntry.TRADE, LedgerEntry.WALLET, buyer.user_id, base, fill.amount),
+                (LedgerEntry.TRADE, LedgerEntry.WALLET, seller.user_id, base, -fill.amount),
+                (LedgerEntry.TRADE, LedgerEntry.WALLET, buyer.user_id, quote, -notional),
+                (LedgerEntry.TRADE, LedgerEntry.WALLET, seller.user_id, quote, notional),
+            ]
+            for order, fee in ((fill.maker, fill.maker_fee), (fill.taker, fill.taker_fee)):
+                if fee:
+                    currency_id = base if order.side == Order.BUY else quote
+                    legs.append((LedgerEntry.FEE, LedgerEntry.WALLET, order.user_id, currency_id, -fee))
+                    legs.append((LedgerEntry.FEE, LedgerEntry.FEES, None, currency_id, fee))
+            rows.extend(entries(new_reference(LedgerEntry.TRADE), legs))
+    return rows
+
+
+def _account_filter(user_id, currency_id, account):
+    if user_id is None:
+        return {'user__isnull': True, 'currency_id': currency_id, 'account': account}
+    return {'user_id': user_id, 'currency_id': currency_id, 'account': account}
+
+
+def balance(user_id, currency_id, account=LedgerEntry.WALLET, upto=None):
+    """
+    Balance of an account after ledger row ``upto`` (default: now): the newest snapshot at or
+    before it plus the sum of the rows written since. Pass ``user_id=None`` for system accounts.
+    """
+    keys = _account_filter(user_id, currency_id, account)
+    snapshots = BalanceSnapshot.objects.filter(**keys)
+    tail = LedgerEntry.objects.filter(**keys)
+    if upto is not None:
+        snapshots = snapshots.filter(last_entry_id__lte=upto)
+        tail = tail.filter(id__lte=upto)
+    snapshot = snapshots.order_by('-last_entry_id').values_list('balance', 'last_entry_id').first()
+    start, after = snapshot if snapshot is not None else (ZERO, 0)
+    return start + (tail.filter(id__gt=after).aggregate(total=Sum('amount'))['total'] or ZERO)
+
+
+def last_snapshot_entry():
+    return BalanceSnapshot.objects.aggregate(last=Max('last_entry_id'))['last'] or 0
+
+
+def take_snapshots():
+    """
+    Snapshot every account that moved since the previous run and copy the new wallet balances to
+    ``Wallet.balance``. All snapshots of a run share the same ``last_entry_id``: the newest ledger
+    row older than SNAPSHOT_LAG, so rows of transactions still in flight are not skipped. Returns
+    how many snapshots were written.
+    """
+    previous = last_snapshot_entry()
+    upto = LedgerEntry.objects.filter(created_at__lte=timezone.now() - SNAPSHOT_LAG).aggregate(
+        last=Max('id'))['last']
+    if upto is None or upto <= previous:
+        return 0
+    moved = LedgerEntry.objects.filter(id__gt=previous, id__lte=upto).values('account', 'user_id', 'currency_id')
+    latest = BalanceSnapshot.objects.filter(account=OuterRef('account'), currency=OuterRef('currency_id')) \
+        .order_by('-last_entry_id').values('balance')
+    # حساب‌های سیستمی کاربر ندارند و برابری با NULL در زیرکوئری جواب نمی‌دهد
+    rows = list(moved.filter(user__isnull=False).annotate(
+        total=Sum('amount'), start=Subquery(latest.filter(user=OuterRef('user_id'))[:1])))
+    rows += list(moved.filter(user__isnull=True).annotate(
+        total=Sum('amount'), start=Subquery(latest.filter(user__isnull=True)[:1])))
+    snapshots = [
+        BalanceSnapshot(account=row['account'], user_id=row['user_id'], currency_id=row['currency_id'],
+                        balance=(row['start'] or ZERO) + row['total'], last_entry_id=upto)
+        for row in rows
+    ]
+    BalanceSnapshot.objects.bulk_create(snapshots, batch_size=BATCH_SIZE)
+    # Wallet.balance فقط کپی مانده دفتر است و همراه snapshot ها به‌روز می‌شود
+    wallets = [
+        Wallet(user_id=snapshot.user_id, currency_id=snapshot.currency_id, balance=snapshot.balance)
+        for snapshot in snapshots if snapshot.account == LedgerEntry.WALLET
+    ]
+    Wallet.objects.bulk_create(wallets, batch_size=BATCH_SIZE, update_conflicts=True,
+                               unique_fields=('user', 'currency'), update_fields=('balance', 'updated_at'))
+    return len(snapshots)
+
+
+def unbalanced_movements(start=None, end=None):
+    """Audit: movements among ledger rows ``(start, end]`` whose legs do not add up to zero."""
+    rows = LedgerEntry.objects.all()
+    if start is not None:
+        rows = rows.filter(id__gt=start)
+    if end is not None:
+        rows = rows.filter(id__lte=end)
+    return list(rows.values('reference', 'currency_id').annotate(total=Sum('amount')).exclude(total=0))
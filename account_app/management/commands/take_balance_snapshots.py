@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from account_app import ledger
+
+
+class Command(BaseCommand):
+    help = "Snapshot the balance of every ledger account that moved since the last run (run periodically)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--audit', action='store_true',
+                            help="Also list movements whose legs do not add up to zero since the last run")
+
+    def handle(self, *args, **options):
+        previous = ledger.last_snapshot_entry()
+        written = ledger.take_snapshots()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} balance snapshots."))
+        if options['audit']:
+            for row in ledger.unbalanced_movements(start=previous):
+                self.stdout.write(self.style.ERROR(
+                    f"Unbalanced movement {row['reference']}: currency {row['currency_id']} total {row['total']}"))
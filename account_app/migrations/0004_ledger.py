@@ -0,0 +1,84 @@
+# Generated by Django 5.2 on 2026-10-18 04:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+OPENING = 'opening'
+
+
+def post_opening_balances(apps, schema_editor):
+    """
+    Post the balance every wallet had before the ledger as a deposit from the external account,
+    so ledger balances start where the wallets were. Wallets that already have their opening
+    entry are skipped, so the migration can be run again after an interruption.
+    """
+    Wallet = apps.get_model('account_app', 'Wallet')
+    LedgerEntry = apps.get_model('account_app', 'LedgerEntry')
+    opened = set(LedgerEntry.objects.filter(reference__startswith=f'{OPENING}:').values_list('reference', flat=True))
+    wallets = Wallet.objects.exclude(is_deleted=True).exclude(balance=0).order_by('pk').values_list(
+        'pk', 'user_id', 'currency_id', 'balance')
+    rows = []
+    for wallet_id, user_id, currency_id, balance in wallets.iterator(chunk_size=BATCH_SIZE):
+        reference = f'{OPENING}:{wallet_id}'
+        if reference in opened:
+            continue
+        rows.append(LedgerEntry(reference=reference, kind='deposit', account='wallet', user_id=user_id,
+                                currency_id=currency_id, amount=balance))
+        rows.append(LedgerEntry(reference=reference, kind='deposit', account='external', user_id=None,
+                                currency_id=currency_id, amount=-balance))
+        if len(rows) >= BATCH_SIZE:
+            LedgerEntry.objects.bulk_create(rows)
+            rows = []
+    LedgerEntry.objects.bulk_create(rows)
+
+
+def remove_opening_balances(apps, schema_editor):
+    LedgerEntry = apps.get_model('account_app', 'LedgerEntry')
+    LedgerEntry.objects.filter(reference__startswith=f'{OPENING}:').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account_app', '0003_alter_user_managers'),
+        ('market_app', '0005_funding_payment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('account', models.CharField(choices=[('wallet', 'Wallet'), ('margin', 'Margin'), ('fees', 'Fees'), ('funding', 'Funding pool'), ('external', 'External')], max_length=10)),
+                ('balance', models.DecimalField(decimal_places=8, max_digits=30)),
+                ('last_entry_id', models.BigIntegerField()),
+                ('currency', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='balance_snapshots', to='market_app.currency')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='balance_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'balance_snapshot',
+                'indexes': [models.Index(fields=['user', 'currency', 'account', '-last_entry_id'], name='balance_snapshot_latest_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('reference', models.CharField(db_index=True, max_length=64)),
+                ('kind', models.CharField(choices=[('trade', 'Trade'), ('fee', 'Fee'), ('funding', 'Funding'), ('deposit', 'Deposit'), ('withdrawal', 'Withdrawal')], max_length=10)),
+                ('account', models.CharField(choices=[('wallet', 'Wallet'), ('margin', 'Margin'), ('fees', 'Fees'), ('funding', 'Funding pool'), ('external', 'External')], max_length=10)),
+                ('amount', models.DecimalField(decimal_places=8, max_digits=30)),
+                ('currency', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='ledger_entries', to='market_app.currency')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='ledger_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'ledger_entry',
+                'indexes': [models.Index(fields=['user', 'currency', 'account', 'id'], name='ledger_entry_balance_idx')],
+            },
+        ),
+        migrations.RunPython(post_opening_balances, remove_opening_balances),
+    ]
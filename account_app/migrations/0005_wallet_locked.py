@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 04:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account_app', '0004_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wallet',
+            name='locked',
+            field=models.DecimalField(decimal_places=8, default=0, max_digits=30),
+        ),
+    ]
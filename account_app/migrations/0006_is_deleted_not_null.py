@@ -0,0 +1,45 @@
+# Generated by Django 5.2 on 2026-10-18 04:57
+
+from django.db import migrations, models
+
+from core_app.migration_helpers import backfill_is_deleted
+
+
+class Migration(migrations.Migration):
+    # تکه‌های backfill هر کدام جدا commit می‌شوند
+    atomic = False
+
+    dependencies = [
+        ('account_app', '0005_wallet_locked'),
+    ]
+
+    operations = [
+        backfill_is_deleted(
+            'account_app', 'contentdevice', 'privatenotification', 'publicnotification', 'user', 'wallet',
+        ),
+        migrations.AlterField(
+            model_name='contentdevice',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='privatenotification',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='publicnotification',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='wallet',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
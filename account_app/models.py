@@ -73,7 +73,75 @@ class UserLoginLog(CreateMixin):
 class Wallet(CreateMixin, UpdateMixin, SoftDeleteMixin):
     user = models.ForeignKey(User, on_delete=models.PROTECT, related_name='user_wallets')
     currency = models.ForeignKey("market_app.Currency", on_delete=models.PROTECT, related_name='currency_wallets')
+    # کپی مانده دفتر تا آخرین snapshot؛ مانده فعلی را get_balance می‌دهد و این فیلد مستقیم تغییر نمی‌کند
     balance = models.DecimalField(max_digits=30, decimal_places=8, default=0)
+    locked = models.DecimalField(max_digits=30, decimal_places=8, default=0)  # رزرو شده برای سفارش‌های باز
+
+    def get_balance(self):
+        """Balance of this wallet from the ledger."""
+        from account_app import ledger
+
+        return ledger.balance(self.user_id, self.currency_id)
+
+    class Meta:
+        unique_together = ('user', 'currency')
+
+
+class LedgerEntry(CreateMixin):
+    """
+    یک ردیف از دفتر دوطرفه. هر حرکت مالی (reference) چند ردیف دارد که جمع مبلغشان در هر ارز صفر است.
+    ردیف‌ها فقط اضافه می‌شوند و هرگز ویرایش یا حذف نمی‌شوند.
+    """
+    WALLET = 'wallet'
+    MARGIN = 'margin'
+    FEES = 'fees'
+    FUNDING = 'funding'
+    EXTERNAL = 'external'
+    ACCOUNT_CHOICES = [
+        (WALLET, 'Wallet'),
+        (MARGIN, 'Margin'),
+        (FEES, 'Fees'),  # حساب سیستمی
+        (FUNDING, 'Funding pool'),  # حساب سیستمی
+        (EXTERNAL, 'External'),  # حساب سیستمی طرف واریز و برداشت
+    ]
+
+    TRADE = 'trade'
+    FEE = 'fee'
+    FUNDING_PAYMENT = 'funding'
+    DEPOSIT = 'deposit'
+    WITHDRAWAL = 'withdrawal'
+    KIND_CHOICES = [
+        (TRADE, 'Trade'),
+        (FEE, 'Fee'),
+        (FUNDING_PAYMENT, 'Funding'),
+        (DEPOSIT, 'Deposit'),
+        (WITHDRAWAL, 'Withdrawal'),
+    ]
+
+    reference = models.CharField(max_length=64, db_index=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    account = models.CharField(max_length=10, choices=ACCOUNT_CHOICES)
+    user = models.ForeignKey(User, on_delete=models.PROTECT, null=True, blank=True, related_name='ledger_entries')
+    currency = models.ForeignKey("market_app.Currency", on_delete=models.PROTECT, related_name='ledger_entries')
+    amount = models.DecimalField(max_digits=30, decimal_places=8)
+
+    class Meta:
+        db_table = 'ledger_entry'
+        indexes = [
+            models.Index(fields=('user', 'currency', 'account', 'id'), name='ledger_entry_balance_idx'),
+        ]
+
+
+class BalanceSnapshot(CreateMixin):
+    """مانده یک حساب تا ردیف last_entry_id دفتر؛ مانده فعلی = آخرین snapshot + جمع ردیف‌های بعد از آن"""
+    account = models.CharField(max_length=10, choices=LedgerEntry.ACCOUNT_CHOICES)
+    user = models.ForeignKey(User, on_delete=models.PROTECT, null=True, blank=True, related_name='balance_snapshots')
+    currency = models.ForeignKey("market_app.Currency", on_delete=models.PROTECT, related_name='balance_snapshots')
+    balance = models.DecimalField(max_digits=30, decimal_places=8)
+    last_entry_id = models.BigIntegerField()
 
     class Meta:
-        unique_together = ('user', 'currency')
\ No newline at end of file
+        db_table = 'balance_snapshot'
+        indexes = [
+            models.Index(fields=('user', 'currency', 'account', '-last_entry_id'), name='balance_snapshot_latest_idx'),
+        ]
@@ -1,3 +1,64 @@
+import importlib
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.apps import apps
 from django.test import TestCase
 
-# Create your tests here.
+from account_app import ledger
+from account_app.models import BalanceSnapshot, User, Wallet, LedgerEntry
+from market_app.models import Currency
+
+opening_balances = importlib.import_module('account_app.migrations.0004_ledger')
+
+
+class LedgerTests(TestCase):
+
+    def setUp(self):
+        self.btc = Currency.objects.create(symbol='BTC', name='Bitcoin')
+        self.user = User.objects.create(username='alice', phone='1')
+
+    def test_movements_must_balance(self):
+        with self.assertRaises(ledger.UnbalancedEntry):
+            ledger.post('manual:1', [(LedgerEntry.FEE, LedgerEntry.WALLET, self.user.pk, self.btc.pk, Decimal(1))])
+        self.assertFalse(LedgerEntry.objects.exists())
+
+    def test_balances_add_the_rows_after_the_last_snapshot(self):
+        [first, _] = ledger.deposit(self.user, self.btc, Decimal(5))
+        with mock.patch.object(ledger, 'SNAPSHOT_LAG', timedelta(0)):
+            self.assertEqual(ledger.take_snapshots(), 2)
+            self.assertEqual(ledger.take_snapshots(), 0)
+            ledger.withdraw(self.user, self.btc, Decimal('1.5'))
+            self.assertEqual(ledger.balance(self.user.pk, self.btc.pk), Decimal('3.5'))
+            self.assertEqual(ledger.take_snapshots(), 2)
+
+        self.assertEqual(BalanceSnapshot.objects.count(), 4)
+        self.assertEqual(ledger.balance(self.user.pk, self.btc.pk), Decimal('3.5'))
+        self.assertEqual(ledger.balance(self.user.pk, self.btc.pk, upto=first.pk + 1), Decimal(5))
+        self.assertEqual(ledger.balance(None, self.btc.pk, LedgerEntry.EXTERNAL), Decimal('-3.5'))
+        self.assertEqual(Wallet.objects.get(user=self.user, currency=self.btc).get_balance(), Decimal('3.5'))
+
+
+class OpeningBalanceTests(TestCase):
+
+    def setUp(self):
+        self.btc = Currency.objects.create(symbol='BTC', name='Bitcoin')
+        self.user = User.objects.create(username='alice', phone='1')
+
+    def test_wallet_balances_become_ledger_deposits(self):
+        Wallet.objects.create(user=self.user, currency=self.btc, balance=Decimal('2.5'))
+        opening_balances.post_opening_balances(apps, None)
+        opening_balances.post_opening_balances(apps, None)
+
+        self.assertEqual(ledger.balance(self.user.pk, self.btc.pk), Decimal('2.5'))
+        self.assertEqual(ledger.balance(None, self.btc.pk, LedgerEntry.EXTERNAL), Decimal('-2.5'))
+        self.assertEqual(ledger.unbalanced_movements(), [])
+
+    def test_snapshots_copy_the_balance_to_the_wallet(self):
+        ledger.deposit(self.user, self.btc, Decimal(3))
+        ledger.withdraw(self.user, self.btc, Decimal(1))
+        with mock.patch.object(ledger, 'SNAPSHOT_LAG', timedelta(0)):
+            ledger.take_snapshots()
+
+        self.assertEqual(Wallet.objects.get(user=self.user, currency=self.btc).balance, Decimal(2))
@@ -0,0 +1,126 @@
+import gc
+import random
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+from benchmarks.flow import PLACE
+from benchmarks.matching import flow_scale
+from market_app.engine.liquidation import PNL_PLACES, PositionColumns
+from market_app.models import FuturesPosition, Order
+
+FEE_QUANT = Decimal('0.00000001')
+
+
+class ArithmeticReport:
+    def __init__(self, name, operations, decimal_seconds, fixed_seconds):
+        self.name = name
+        self.operations = operations
+        self.decimal_seconds = decimal_seconds
+        self.fixed_seconds = fixed_seconds
+
+    @property
+    def speedup(self):
+        return self.decimal_seconds / self.fixed_seconds if self.fixed_seconds else 0
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'operations': self.operations,
+            'decimal_ns': round(self.decimal_seconds / self.operations * 1e9, 1),
+            'fixed_ns': round(self.fixed_seconds / self.operations * 1e9, 1),
+            'speedup': round(self.speedup, 2),
+        }
+
+    def __str__(self):
+        data = self.as_dict()
+        return (f"{data['name']}: {data['operations']} operations, Decimal {data['decimal_ns']}ns, "
+                f"fixed-point {data['fixed_ns']}ns per operation, {data['speedup']}x faster")
+
+
+def _timed(function, *args):
+    gc.collect()
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+
+def _fills(flow, count, seed):
+    """``(side, price, amount)`` of ``count`` fills at the prices and amounts of the flow's orders."""
+    rng = random.Random(seed)
+    specs = [spec for kind, spec in flow if kind == PLACE and spec.price is not None]
+    return [(spec.side, spec.price, spec.amount) for spec in (rng.choice(specs) for _ in range(count))]
+
+
+def _decimal_fees(fills, rate):
+    total_fee = notional_sum = Decimal(0)
+    for side, price, amount in fills:
+        notional = price * amount
+        base = amount if side == Order.BUY else notional
+        total_fee += (base * rate).quantize(FEE_QUANT, rounding=ROUND_HALF_UP)
+        notional_sum += notional
+    return total_fee, notional_sum
+
+
+def _fixed_fees(fills, rate, scale):
+    total_fee = notional_sum = 0
+    buy_fee, sell_fee = scale.buy_fee, scale.sell_fee
+    for side, price, amount in fills:
+        notional = price * amount
+        total_fee += buy_fee(amount, rate) if side == Order.BUY else sell_fee(notional, rate)
+        notional_sum += notional
+    return total_fee, notional_sum
+
+
+def _positions(fills):
+    """A futures position per fill: long for buys, short for sells, entered at the fill's price."""
+    return [
+        FuturesPosition(id=index + 1, side=FuturesPosition.LONG if side == Order.BUY else FuturesPosition.SHORT,
+                        amount=amount, entry_price=price, liquidation_price=0, maintenance_margin=0,
+                        unrealized_pnl=0)
+        for index, (side, price, amount) in enumerate(fills)
+    ]
+
+
+def _decimal_pnl(positions, mark):
+    pnl = []
+    for position in positions:
+        direction = 1 if position.side == FuturesPosition.LONG else -1
+        pnl.append((direction * (mark - position.entry_price) * position.amount).quantize(
+            FEE_QUANT, rounding=ROUND_HALF_UP))
+    return pnl
+
+
+def _columns_pnl(columns, mark):
+    return columns.pnl_changes(mark)[1].tolist()
+
+
+def run_arithmetic(flow, count=200000, seed=1, rate=Decimal('0.001')):
+    """
+    The fill math of the engine done once with Decimals and once with the fixed-point ints of the
+    flow's scale, and the unrealized PnL of a position per fill done once with Decimals and once
+    with the columns ``liquidation.flush_pnl`` uses, on the same values. Both runs must agree to
+    the last unit.
+    """
+    scale = flow_scale(flow)
+    fills = _fills(flow, count, seed)
+    fixed_fills = [(side, scale.price(price), scale.amount(amount)) for side, price, amount in fills]
+    mark = fills[len(fills) // 2][1]
+
+    decimal_seconds, decimal_result = _timed(_decimal_fees, fills, rate)
+    fixed_seconds, fixed_result = _timed(_fixed_fees, fixed_fills, scale.rate(rate), scale)
+    if (scale.to_fee(fixed_result[0]), scale.to_notional(fixed_result[1])) != decimal_result:
+        raise AssertionError("Fixed-point fees differ from the Decimal ones.")
+    reports = [ArithmeticReport('fees', count, decimal_seconds, fixed_seconds)]
+
+    positions = _positions(fills)
+    columns = PositionColumns(0, len(positions))
+    for position in positions:
+        columns.upsert(position)
+    decimal_seconds, decimal_result = _timed(_decimal_pnl, positions, mark)
+    fixed_seconds, fixed_result = _timed(_columns_pnl, columns, mark)
+    # pnl_changes فقط ردیف‌های تغییر کرده را برمی‌گرداند؛ ردیف‌هایی که صفر مانده‌اند کنار گذاشته می‌شوند
+    if sorted(Decimal(value).scaleb(-PNL_PLACES) for value in fixed_result) != sorted(
+            value for value in decimal_result if value):
+        raise AssertionError("Fixed-point PnL differs from the Decimal one.")
+    reports.append(ArithmeticReport('pnl', count, decimal_seconds, fixed_seconds))
+    return reports
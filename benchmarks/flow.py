@@ -0,0 +1,117 @@
+import random
+from decimal import Decimal
+
+from market_app.models import Order
+
+PLACE = 'place'
+CANCEL = 'cancel'
+
+DEFAULT_MIX = {
+    Order.LIMIT: 0.80,
+    Order.MARKET: 0.08,
+    Order.STOP_LIMIT: 0.04,
+    Order.STOP_MARKET: 0.02,
+    Order.TAKE_PROFIT_LIMIT: 0.02,
+    Order.TAKE_PROFIT_MARKET: 0.01,
+}
+MARKET_TYPES = (Order.MARKET, Order.STOP_MARKET, Order.TAKE_PROFIT_MARKET)
+DEFAULT_TIF = {
+    Order.GTC: 0.90,
+    Order.IOC: 0.07,
+    Order.FOK: 0.03,
+}
+
+
+class OrderSpec:
+    __slots__ = ('ref', 'user', 'side', 'order_type', 'time_in_force', 'amount', 'price', 'stop_price')
+
+    def __init__(self, ref, user, side, order_type, time_in_force, amount, price=None, stop_price=None):
+        self.ref = ref
+        self.user = user
+        self.side = side
+        self.order_type = order_type
+        self.time_in_force = time_in_force
+        self.amount = amount
+        self.price = price
+        self.stop_price = stop_price
+
+
+class OrderFlow:
+    """
+    Seeded generator of synthetic order flow for one market.
+
+    Prices follow a random walk of the mid price; limit prices are spread around the mid with a
+    normal distribution of ``price_spread`` ticks, so most orders rest near the top of the book and
+    a minority crosses it. ``burstiness`` is the chance that an order repeats the side of the
+    previous one, which produces runs of aggressive orders sweeping several levels.
+    ``cancel_ratio`` is the share of events that cancel one of the orders placed so far.
+
+    Iterating yields ``(PLACE, OrderSpec)`` and ``(CANCEL, ref)`` events, where ``ref`` is the
+    position of the cancelled order in the stream of placed orders. The same seed and settings
+    always give the same stream.
+    """
+
+    def __init__(self, events=10000, seed=1, users=100, mix=None, time_in_force=None, cancel_ratio=0.3,
+                 mid_price=Decimal('30000'), tick=Decimal('0.01'), price_spread=50, volatility=2,
+                 burstiness=0.3, min_amount=Decimal('0.001'), max_amount=Decimal('0.5'), amount_precision=6):
+        self.events = events
+        self.seed = seed
+        self.users = users
+        self.mix = mix or DEFAULT_MIX
+        self.time_in_force = time_in_force or DEFAULT_TIF
+        self.cancel_ratio = cancel_ratio
+        self.mid_price = mid_price
+        self.tick = tick
+        self.price_spread = price_spread
+        self.volatility = volatility
+        self.burstiness = burstiness
+        self.min_amount = min_amount
+        self.max_amount = max_amount
+        self.amount_quant = Decimal(1).scaleb(-amount_precision)
+
+    def __iter__(self):
+        rng = random.Random(self.seed)
+        order_types, type_weights = list(self.mix), list(self.mix.values())
+        tifs, tif_weights = list(self.time_in_force), list(self.time_in_force.values())
+        mid_ticks = int(self.mid_price / self.tick)
+        live = []
+        placed = 0
+        side = Order.BUY
+        for _ in range(self.events):
+            if live and rng.random() < self.cancel_ratio:
+                index = rng.randrange(len(live))
+                live[index], live[-1] = live[-1], live[index]
+                yield CANCEL, live.pop()
+                continue
+
+            mid_ticks = max(1, mid_ticks + round(rng.gauss(0, self.volatility)))
+            if rng.random() >= self.burstiness:
+                side = Order.BUY if rng.random() < 0.5 else Order.SELL
+            order_type = rng.choices(order_types, type_weights)[0]
+            amount = (self.min_amount + (self.max_amount - self.min_amount) * Decimal(rng.random()))
+            amount = amount.quantize(self.amount_quant)
+            spec = OrderSpec(placed, rng.randrange(self.users), side, order_type, rng.choices(tifs, tif_weights)[0],
+                             amount)
+
+            # خریدارها پایین‌تر و فروشنده‌ها بالاتر از قیمت میانی سفارش می‌گذارند
+            direction = -1 if side == Order.BUY else 1
+            if order_type not in MARKET_TYPES:
+                offset = round(rng.gauss(self.price_spread / 4, self.price_spread))
+                spec.price = (mid_ticks + direction * offset) * self.tick
+            if order_type in Order.TRIGGERED_TYPES:
+                distance = 1 + abs(round(rng.gauss(0, self.price_spread)))
+                is_stop = order_type in (Order.STOP_LIMIT, Order.STOP_MARKET)
+                spec.stop_price = (mid_ticks - direction * distance if is_stop else mid_ticks + direction * distance) \
+                    * self.tick
+                spec.stop_price = max(spec.stop_price, self.tick)
+                if spec.price is not None:
+                    spec.price = spec.stop_price - direction * self.price_spread * self.tick
+            if spec.price is not None:
+                spec.price = max(spec.price, self.tick)
+            if order_type in MARKET_TYPES:
+                spec.time_in_force = Order.GTC
+
+            if order_type != Order.MARKET and spec.time_in_force == Order.GTC:
+                live.append(placed)
+            placed += 1
+            yield PLACE, spec
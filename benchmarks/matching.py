@@ -0,0 +1,153 @@
+import gc
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.db import connection
+
+from benchmarks.flow import PLACE
+from market_app.engine import service
+from market_app.engine.book import BookOrder
+from market_app.engine.fixed import get_scale
+from market_app.engine.matching import MatchingEngine
+from market_app.models import Order
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Report:
+    def __init__(self, name, events, elapsed, latencies, retained_blocks_per_order=None,
+                 retained_bytes_per_order=None):
+        self.name = name
+        self.events = events
+        self.elapsed = elapsed
+        self.latencies = sorted(latencies)
+        self.retained_blocks_per_order = retained_blocks_per_order
+        self.retained_bytes_per_order = retained_bytes_per_order
+
+    @property
+    def throughput(self):
+        return self.events / self.elapsed if self.elapsed else 0
+
+    def as_dict(self):
+        us = 1e-3
+        return {
+            'name': self.name,
+            'events': self.events,
+            'seconds': round(self.elapsed, 3),
+            'orders_per_second': round(self.throughput),
+            'p50_us': round(percentile(self.latencies, 0.50) * us, 1),
+            'p99_us': round(percentile(self.latencies, 0.99) * us, 1),
+            'p999_us': round(percentile(self.latencies, 0.999) * us, 1),
+            'retained_blocks_per_order': self.retained_blocks_per_order,
+            'retained_bytes_per_order': self.retained_bytes_per_order,
+        }
+
+    def __str__(self):
+        data = self.as_dict()
+        text = (f"{data['name']}: {data['events']} events in {data['seconds']}s, "
+                f"{data['orders_per_second']} orders/s, match latency p50 {data['p50_us']}us "
+                f"p99 {data['p99_us']}us p999 {data['p999_us']}us")
+        if self.retained_blocks_per_order is not None:
+            text += (f", {self.retained_blocks_per_order} blocks / {self.retained_bytes_per_order} bytes "
+                     f"retained per order")
+        return text
+
+
+def flow_scale(flow):
+    """The fixed-point scale matching the flow's tick and amount precision."""
+    return get_scale(-flow.tick.as_tuple().exponent, -flow.amount_quant.as_tuple().exponent)
+
+
+def _book_order(spec, order_id, scale):
+    return BookOrder(order_id, spec.user, spec.side, spec.order_type, scale.amount(spec.amount),
+                     price=scale.price(spec.price), stop_price=scale.price(spec.stop_price),
+                     time_in_force=spec.time_in_force)
+
+
+def run_engine(flow, maker_fee=Decimal('0.001'), taker_fee=Decimal('0.002')):
+    """
+    Drive a bare MatchingEngine with the flow: matching cost only, nothing is stored. Latency
+    includes turning each order's Decimals into the engine's units.
+    """
+    scale = flow_scale(flow)
+    engine = MatchingEngine(0, maker_fee, taker_fee, scale)
+    events = list(flow)
+    latencies = []
+    clock = time.perf_counter_ns
+    gc.collect()
+    started = time.perf_counter()
+    for kind, payload in events:
+        begin = clock()
+        if kind == PLACE:
+            engine.place(_book_order(payload, payload.ref, scale))
+        else:
+            engine.cancel(payload)
+        latencies.append(clock() - begin)
+    elapsed = time.perf_counter() - started
+    return Report('engine', len(events), elapsed, latencies)
+
+
+def measure_retained(flow, maker_fee=Decimal('0.001'), taker_fee=Decimal('0.002')):
+    """
+    Memory blocks and bytes still held per placed order after running the flow through a bare
+    engine, from the difference of two tracemalloc snapshots. These are net numbers, not
+    allocation counts: garbage freed along the way is not counted.
+    """
+    scale = flow_scale(flow)
+    engine = MatchingEngine(0, maker_fee, taker_fee, scale)
+    events = list(flow)
+    placed = sum(1 for kind, _ in events if kind == PLACE) or 1
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        for kind, payload in events:
+            if kind == PLACE:
+                engine.place(_book_order(payload, payload.ref, scale))
+            else:
+                engine.cancel(payload)
+        gc.collect()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    # حافظه خود tracemalloc و snapshot اول جزو موتور حساب نمی‌شود
+    ignore = (tracemalloc.Filter(False, tracemalloc.__file__),)
+    differences = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), 'filename')
+    blocks = sum(difference.count_diff for difference in differences)
+    size = sum(difference.size_diff for difference in differences)
+    return round(blocks / placed, 2), round(size / placed, 1)
+
+
+def run_database(flow, market, users):
+    """
+    Drive the full service path: every order is inserted, then placed through the journaled
+    engine and its outcome stored. Latency covers ``place_order``/``cancel_order`` only.
+    """
+    orders = {}
+    latencies = []
+    clock = time.perf_counter_ns
+    events = list(flow)
+    gc.collect()
+    started = time.perf_counter()
+    for kind, payload in events:
+        if kind == PLACE:
+            order = Order.objects.create(
+                user=users[payload.user], market=market, side=payload.side, order_type=payload.order_type,
+                time_in_force=payload.time_in_force, amount=payload.amount, price=payload.price,
+                stop_price=payload.stop_price,
+            )
+            orders[payload.ref] = order
+            begin = clock()
+            service.place_order(order)
+        else:
+            begin = clock()
+            service.cancel_order(orders[payload])
+        latencies.append(clock() - begin)
+    elapsed = time.perf_counter() - started
+    return Report(f'database ({connection.vendor})', len(events), elapsed, latencies)
@@ -0,0 +1,96 @@
+import random
+import time
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Q
+
+from market_app.models import Order, Trade
+
+LIVE = (Order.OPEN, Order.PARTIALLY_FILLED)
+CLOSED = (Order.FILLED, Order.CANCELLED, Order.EXPIRED)
+# شرط قبلی SoftManager وقتی is_deleted می‌توانست NULL باشد
+NULLABLE_LIVE = Q(is_deleted=False) | Q(is_deleted=None)
+BATCH_SIZE = 5000
+
+
+class PlanReport:
+    def __init__(self, name, predicate, plan, seconds):
+        self.name = name
+        self.predicate = predicate
+        self.plan = plan
+        self.seconds = seconds
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'predicate': self.predicate,
+            'plan': self.plan,
+            'query_us': round(self.seconds * 1e6, 1),
+        }
+
+    def __str__(self):
+        return f"{self.name} [{self.predicate}]: {self.seconds * 1e6:.1f}us, {' / '.join(self.plan)}"
+
+
+def populate(market, users, rows, live_ratio=0.05, seed=1):
+    """
+    ``rows`` orders of ``users`` on ``market``, mostly closed as on a long-running exchange, with
+    one trade per filled order. Returns one filled order to look trades up by.
+    """
+    rng = random.Random(seed)
+    orders = []
+    for _ in range(rows):
+        status = rng.choice(LIVE) if rng.random() < live_ratio else rng.choice(CLOSED)
+        orders.append(Order(
+            user=rng.choice(users), market=market, order_type=Order.LIMIT, side=rng.choice((Order.BUY, Order.SELL)),
+            amount=Decimal(rng.randint(1, 1000)) / 100, price=Decimal(rng.randint(9000, 11000)), status=status,
+        ))
+    Order.objects.bulk_create(orders, batch_size=BATCH_SIZE)
+    filled = list(Order.objects.filter(market=market, status=Order.FILLED, price__isnull=False).values_list(
+        'pk', 'price', 'amount'))
+    Trade.objects.bulk_create([
+        Trade(order_id=order_id, price=price, amount=amount, fee=0, fee_currency_id=market.quote_currency_id)
+        for order_id, price, amount in filled
+    ], batch_size=BATCH_SIZE)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return filled[len(filled) // 2][0]
+
+
+def _plan(queryset):
+    lines = [line.strip() for line in queryset.explain().splitlines()]
+    return [line for line in lines if 'Scan' in line or 'SCAN' in line or 'SEARCH' in line] or lines
+
+
+def _timed(queryset, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        list(queryset.all())
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_plans(market, users, rows=100000, repeat=20):
+    """
+    Plan and best time of the hot ``order`` and ``trade`` queries, once with the old nullable
+    soft-delete predicate and once with ``is_deleted = false``. Only the latter implies the
+    condition of the partial indexes, so the former has to use another index or scan the table.
+    """
+    order_id = populate(market, users, rows)
+    user = users[0]
+    queries = [
+        ('order book side', Order, Q(market=market, side=Order.SELL, status__in=LIVE), ('price',), 50),
+        ('user live orders', Order, Q(user=user, market=market, status__in=LIVE), (), None),
+        ('trades of order', Trade, Q(order_id=order_id), ('created_at',), None),
+    ]
+    reports = []
+    for name, model, condition, ordering, limit in queries:
+        for predicate, live in (('nullable', NULLABLE_LIVE), ('not null', Q(is_deleted=False))):
+            queryset = model._base_manager.filter(live, condition).order_by(*ordering)
+            if limit is not None:
+                queryset = queryset[:limit]
+            reports.append(PlanReport(name, predicate, _plan(queryset), _timed(queryset, repeat)))
+    return reports
@@ -1,6 +1,9 @@
 from django.contrib import admin
 from django.utils import timezone
 from django.utils.html import format_html
+
+from core_app import bulk_actions
+from core_app.admin import background_action
 from .models import BlogCategory, BlogTag, BlogPost, BlogComment, BlogView
 
 
@@ -80,15 +83,10 @@ class BlogPostAdmin(admin.ModelAdmin):
         return obj.views
     view_count.short_description = 'Views'
 
-    def publish_posts(self, request, queryset):
-        updated = queryset.update(status=BlogPost.PUBLISHED, published_at=timezone.now())
-        self.message_user(request, f'{updated} posts published successfully.')
-    publish_posts.short_description = "Publish selected posts"
-
-    def unpublish_posts(self, request, queryset):
-        updated = queryset.update(status=BlogPost.DRAFT, published_at=None)
-        self.message_user(request, f'{updated} posts unpublished.')
-    unpublish_posts.short_description = "Unpublish selected posts"
+    publish_posts = background_action('blog_app.publish_posts', "Publish selected posts",
+                                      '{} posts published successfully.')
+    unpublish_posts = background_action('blog_app.unpublish_posts', "Unpublish selected posts",
+                                        '{} posts unpublished.')
 
     def feature_posts(self, request, queryset):
         updated = queryset.update(is_featured=True)
@@ -101,6 +99,17 @@ class BlogPostAdmin(admin.ModelAdmin):
     unfeature_posts.short_description = "Unfeature selected posts"
 
 
+@bulk_actions.register('blog_app.publish_posts')
+def publish_posts(queryset):
+    now = timezone.now()
+    return queryset.update(status=BlogPost.PUBLISHED, published_at=now, updated_at=now)
+
+
+@bulk_actions.register('blog_app.unpublish_posts')
+def unpublish_posts(queryset):
+    return queryset.update(status=BlogPost.DRAFT, published_at=None, updated_at=timezone.now())
+
+
 @admin.register(BlogComment)
 class BlogCommentAdmin(admin.ModelAdmin):
     list_display = ('content', 'post', 'user', 'status', 'created_at')
@@ -0,0 +1,43 @@
+# Generated by Django 5.2 on 2026-10-18 04:57
+
+from django.db import migrations, models
+
+from core_app.migration_helpers import backfill_is_deleted
+
+
+class Migration(migrations.Migration):
+    # تکه‌های backfill هر کدام جدا commit می‌شوند
+    atomic = False
+
+    dependencies = [
+        ('blog_app', '0001_initial'),
+    ]
+
+    operations = [
+        backfill_is_deleted('blog_app', 'blogcategory', 'blogcomment', 'blogpost', 'blogtag', 'blogview'),
+        migrations.AlterField(
+            model_name='blogcategory',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='blogcomment',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='blogpost',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='blogtag',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='blogview',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
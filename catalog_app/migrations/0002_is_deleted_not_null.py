@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 04:57
+
+from django.db import migrations, models
+
+from core_app.migration_helpers import backfill_is_deleted
+
+
+class Migration(migrations.Migration):
+    # تکه‌های backfill هر کدام جدا commit می‌شوند
+    atomic = False
+
+    dependencies = [
+        ('catalog_app', '0001_initial'),
+    ]
+
+    operations = [
+        backfill_is_deleted('catalog_app', 'image'),
+        migrations.AlterField(
+            model_name='image',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -1,3 +1,93 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList, ORDER_VAR, PAGE_VAR
+from django.urls import reverse
+from django.utils.html import format_html
 
-# Register your models here.
+from core_app import bulk_actions
+from core_app.models import BulkActionJob
+from core_app.paginators import EstimatedCountPaginator
+
+KEYSET_VAR = 'id__lt'
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Change list that also offers keyset navigation while rows are in the default newest-first
+    order: the "older" link filters on ``id__lt`` the last id shown instead of using an OFFSET,
+    so deep pages cost the same as the first one.
+    """
+
+    def get_results(self, request):
+        super().get_results(request)
+        self.next_keyset_url = None
+        self.first_keyset_url = None
+        if ORDER_VAR in self.params or set(self.queryset.query.order_by) != {'-pk'}:
+            return
+        rows = list(self.result_list)
+        if len(rows) >= self.list_per_page:
+            self.next_keyset_url = self.get_query_string({KEYSET_VAR: rows[-1].pk}, remove=[PAGE_VAR])
+        if KEYSET_VAR in self.params:
+            self.first_keyset_url = self.get_query_string(remove=[KEYSET_VAR, PAGE_VAR])
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Base admin for tables with millions of rows: estimated counts, no second count of the
+    unfiltered table and keyset links next to the page numbers. Subclasses should also set
+    ``list_select_related`` for every relation shown in ``list_display``.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    # ترتیب پیش‌فرض مدل‌ها created_at است که ایندکس ندارد؛ id همان ترتیب را با ایندکس کلید اصلی می‌دهد
+    ordering = ('-pk',)
+    change_list_template = 'admin/keyset_change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+
+def background_action(name, description, done_message):
+    """
+    Admin action handing the selection to the bulk action ``name``. ``done_message`` is formatted
+    with the number of changed rows when the selection was small enough to finish in the request.
+    """
+    def action(modeladmin, request, queryset):
+        job = bulk_actions.submit(name, queryset, request.user)
+        if job.status == BulkActionJob.DONE:
+            modeladmin.message_user(request, done_message.format(job.affected))
+        elif job.status == BulkActionJob.FAILED:
+            modeladmin.message_user(request, f"{description} failed: {job.error}", level=messages.ERROR)
+        else:
+            url = reverse('admin:core_app_bulkactionjob_change', args=[job.pk])
+            modeladmin.message_user(request, format_html(
+                '{} runs in the background, follow it in <a href="{}">job #{}</a>.', description, url, job.pk))
+
+    action.__name__ = name.rsplit('.', 1)[-1]
+    action.short_description = description
+    return action
+
+
+@admin.register(BulkActionJob)
+class BulkActionJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'action', 'content_type', 'status', 'progress_display', 'affected', 'created_by',
+                    'created_at', 'finished_at')
+    list_filter = ('status', 'action')
+    list_select_related = ('content_type', 'created_by')
+    raw_id_fields = ('created_by',)
+    readonly_fields = ('action', 'content_type', 'status', 'progress_display', 'total', 'processed', 'affected',
+                       'last_pk', 'error', 'created_by', 'created_at', 'updated_at', 'started_at', 'finished_at')
+    exclude = ('pks',)
+    list_per_page = 20
+
+    def progress_display(self, obj):
+        total = '?' if obj.total is None else obj.total
+        return f"{obj.progress}% ({obj.processed}/{total})"
+
+    progress_display.short_description = 'Progress'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,137 @@
+import threading
+from bisect import bisect_right
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core_app.models import BulkActionJob
+
+# تعداد ردیف‌هایی که در هر تراکنش پردازش می‌شوند؛ انتخاب‌های کوچک‌تر همان‌جا در درخواست اجرا می‌شوند
+CHUNK_SIZE = 1000
+# کاری که این مدت پیشرفتی ثبت نکرده رها شده حساب می‌شود و پروسه دیگری ادامه‌اش می‌دهد
+STALE_AFTER = timedelta(minutes=5)
+
+_handlers = {}
+
+
+def register(name, atomic=True):
+    """
+    Register ``function(queryset)`` as the bulk action ``name``. It gets one chunk of the selection
+    at a time and returns how many rows it changed; it should do so with set-based updates. With
+    ``atomic=False`` the chunk is not wrapped in a transaction, for handlers that have to wait on
+    another process (the matching engine) and commit on their own.
+    """
+    def decorator(function):
+        function.atomic = atomic
+        _handlers[name] = function
+        return function
+    return decorator
+
+
+def get_handler(name):
+    try:
+        return _handlers[name]
+    except KeyError:
+        raise LookupError(f"Unknown bulk action {name!r}.")
+
+
+def selection(job):
+    """The pks of the job's selection still to be handled, after ``last_pk``, in order."""
+    if job.last_pk is None:
+        return job.pks
+    return job.pks[bisect_right(job.pks, job.last_pk):]
+
+
+def submit(name, queryset, user=None, background=True):
+    """
+    Record ``queryset`` as a job of the bulk action ``name``. A selection of at most one chunk is
+    handled right away; a larger one is left to a background thread started once the transaction
+    commits (and to ``run_bulk_actions`` if that thread does not finish it).
+    """
+    get_handler(name)
+    # خود pkها نگه داشته می‌شوند نه کوئری، تا کار بعد از تغییر کد هم قابل اجرا بماند
+    pks = list(queryset.order_by('pk').values_list('pk', flat=True))
+    job = BulkActionJob.objects.create(
+        action=name,
+        content_type=ContentType.objects.get_for_model(queryset.model),
+        pks=pks,
+        total=len(pks),
+        created_by=user,
+    )
+    if len(pks) <= CHUNK_SIZE:
+        run_job(job)
+    elif background:
+        transaction.on_commit(lambda: _start(job.pk))
+    return job
+
+
+def _start(job_pk):
+    threading.Thread(target=_run_in_thread, args=(job_pk,), daemon=True).start()
+
+
+def _run_in_thread(job_pk):
+    try:
+        job = claim(BulkActionJob.objects.filter(pk=job_pk))
+        if job is not None:
+            run_job(job)
+    finally:
+        close_old_connections()
+
+
+def claim(queryset=None):
+    """
+    Take the next pending job, or a running one nobody has moved on for STALE_AFTER, and mark it
+    running. None when there is nothing to do.
+    """
+    if queryset is None:
+        queryset = BulkActionJob.objects.all()
+    stale = timezone.now() - STALE_AFTER
+    with transaction.atomic():
+        job = (queryset
+               .filter(Q(status=BulkActionJob.PENDING) | Q(status=BulkActionJob.RUNNING, updated_at__lt=stale))
+               .order_by('pk')
+               .select_for_update(skip_locked=True)
+               .first())
+        if job is None:
+            return None
+        job.status = BulkActionJob.RUNNING
+        job.started_at = job.started_at or timezone.now()
+        job.save(update_fields=['status', 'started_at', 'updated_at'])
+    return job
+
+
+def run_job(job, chunk_size=CHUNK_SIZE):
+    """
+    Work through the job's selection after ``last_pk``, committing each chunk together with the
+    job's progress. A failing chunk is rolled back and marks the job failed.
+    """
+    handler = get_handler(job.action)
+    manager = job.content_type.model_class()._default_manager
+    remaining = selection(job)
+    BulkActionJob.objects.filter(pk=job.pk).update(
+        status=BulkActionJob.RUNNING, started_at=job.started_at or timezone.now(), updated_at=timezone.now())
+    try:
+        for start in range(0, len(remaining), chunk_size):
+            pks = remaining[start:start + chunk_size]
+            with transaction.atomic() if handler.atomic else nullcontext():
+                # ردیف‌هایی که از زمان ثبت کار حذف شده‌اند در کوئری نمی‌آیند
+                affected = handler(manager.filter(pk__in=pks))
+                BulkActionJob.objects.filter(pk=job.pk).update(
+                    processed=F('processed') + len(pks), affected=F('affected') + affected, last_pk=pks[-1],
+                    updated_at=timezone.now())
+            job.processed += len(pks)
+            job.affected += affected
+            job.last_pk = pks[-1]
+    except Exception as error:
+        job.status = BulkActionJob.FAILED
+        job.error = f"{type(error).__name__}: {error}"
+    else:
+        job.status = BulkActionJob.DONE
+    job.finished_at = timezone.now()
+    BulkActionJob.objects.filter(pk=job.pk).update(
+        status=job.status, error=job.error, finished_at=job.finished_at, updated_at=job.finished_at)
+    return job
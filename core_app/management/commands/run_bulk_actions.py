@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core_app import bulk_actions
+
+
+class Command(BaseCommand):
+    help = ("Run pending bulk admin actions, and the ones whose background thread stopped, until none is "
+            "left. Each chunk is committed with the job's progress, so an interrupted run picks up where "
+            "it stopped.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=bulk_actions.CHUNK_SIZE,
+                            help="Rows per transaction")
+
+    def handle(self, *args, **options):
+        while True:
+            job = bulk_actions.claim()
+            if job is None:
+                break
+            started = time.perf_counter()
+            job = bulk_actions.run_job(job, options['chunk_size'])
+            message = (f"#{job.pk} {job.action}: {job.processed} rows, {job.affected} changed "
+                       f"in {time.perf_counter() - started:.2f}s")
+            if job.status == job.FAILED:
+                self.stdout.write(self.style.ERROR(f"{message}, failed: {job.error}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(message))
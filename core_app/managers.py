@@ -1,4 +1,4 @@
-from django.db.models import QuerySet, Manager, Q
+from django.db.models import QuerySet, Manager
 from django.utils import timezone
 from django.contrib.auth.models import UserManager
 
@@ -10,4 +10,4 @@ class SoftQuerySet(QuerySet):
 
 class SoftManager(Manager):
     def get_queryset(self):
-        return SoftQuerySet(self.model, using=self._db).filter(Q(is_deleted=False) | Q(is_deleted=None))
+        return SoftQuerySet(self.model, using=self._db).filter(is_deleted=False)
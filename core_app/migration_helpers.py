@@ -0,0 +1,74 @@
+from django.db import NotSupportedError, migrations
+from django.db.models import Max
+
+# هر تکه در تراکنش جدا به‌روز می‌شود تا جدول‌های بزرگ مدت طولانی قفل نمانند
+BACKFILL_CHUNK_SIZE = 10000
+
+
+def backfill_is_deleted(app_label, *model_names):
+    """
+    RunPython operation setting ``is_deleted`` to False on the rows where it is still NULL, walking
+    each table in pk ranges of BACKFILL_CHUNK_SIZE. Meant for a migration with ``atomic = False``,
+    ahead of the AlterField that makes the column NOT NULL.
+    """
+    def forwards(apps, schema_editor):
+        for model_name in model_names:
+            manager = apps.get_model(app_label, model_name)._base_manager.using(schema_editor.connection.alias)
+            last_pk = manager.aggregate(last=Max('pk'))['last'] or 0
+            for start in range(0, last_pk + 1, BACKFILL_CHUNK_SIZE):
+                manager.filter(pk__gte=start, pk__lt=start + BACKFILL_CHUNK_SIZE,
+                               is_deleted__isnull=True).update(is_deleted=False)
+
+    return migrations.RunPython(forwards, migrations.RunPython.noop)
+
+
+def _concurrently(operation, schema_editor):
+    """Whether ``operation`` should build or drop its index concurrently on this connection."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return False
+    if schema_editor.connection.in_atomic_block:
+        raise NotSupportedError(
+            f"{type(operation).__name__} can not run inside a transaction (set atomic = False on the migration).")
+    return True
+
+
+class AddIndexConcurrently(migrations.AddIndex):
+    """
+    AddIndex that builds the index with CREATE INDEX CONCURRENTLY on PostgreSQL, so the table takes
+    writes while the index is built, and falls back to a plain CREATE INDEX elsewhere. The
+    migration needs ``atomic = False``.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if not _concurrently(self, schema_editor):
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.add_index(model, self.index, concurrently=True)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if not _concurrently(self, schema_editor):
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index, concurrently=True)
+
+
+class RemoveIndexConcurrently(migrations.RemoveIndex):
+    """RemoveIndex counterpart of AddIndexConcurrently, using DROP INDEX CONCURRENTLY on PostgreSQL."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if not _concurrently(self, schema_editor):
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            index = from_state.models[app_label, self.model_name_lower].get_index_by_name(self.name)
+            schema_editor.remove_index(model, index, concurrently=True)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if not _concurrently(self, schema_editor):
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            index = to_state.models[app_label, self.model_name_lower].get_index_by_name(self.name)
+            schema_editor.add_index(model, index, concurrently=True)
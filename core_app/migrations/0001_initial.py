@@ -0,0 +1,43 @@
+# Generated by Django 5.2 on 2026-10-18 04:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BulkActionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('action', models.CharField(max_length=100)),
+                ('query', models.BinaryField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('total', models.PositiveIntegerField(blank=True, null=True)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('affected', models.PositiveIntegerField(default=0)),
+                ('last_pk', models.BigIntegerField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bulk_action_jobs', to='contenttypes.contenttype')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bulk_action_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'core_bulk_action_job',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'updated_at'], name='core_bulk_a_status_a589c3_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-18 07:40
+
+from django.db import migrations, models
+
+
+def fail_unfinished_jobs(apps, schema_editor):
+    # انتخاب کارهای ناتمام فقط به شکل کوئری pickle‌شده ذخیره شده و دیگر خوانده نمی‌شود
+    BulkActionJob = apps.get_model('core_app', 'BulkActionJob')
+    BulkActionJob.objects.filter(status__in=('pending', 'running')).update(
+        status='failed', error='The selection was stored as a query; run the action again.')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkactionjob',
+            name='pks',
+            field=models.JSONField(default=list, editable=False),
+        ),
+        migrations.RunPython(fail_unfinished_jobs, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='bulkactionjob',
+            name='query',
+        ),
+    ]
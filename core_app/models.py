@@ -21,7 +21,7 @@ class UpdateMixin(models.Model):
 
 class SoftDeleteMixin(models.Model):
     deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
-    is_deleted = models.BooleanField(null=True, blank=True, editable=False)
+    is_deleted = models.BooleanField(default=False, editable=False)
 
     def delete(self, using=None, keep_parents=False):
         self.deleted_at = timezone.now()
@@ -31,4 +31,54 @@ class SoftDeleteMixin(models.Model):
     objects = SoftManager()
 
     class Meta:
-        abstract = True
\ No newline at end of file
+        abstract = True
+
+
+class BulkActionJob(CreateMixin, UpdateMixin):
+    """
+    An admin action over a selection that may be too large for one request. The selection is kept
+    as its sorted pks and worked through in order, one chunk per transaction, so the job can be
+    resumed from ``last_pk`` after an interruption.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    action = models.CharField(max_length=100)
+    content_type = models.ForeignKey('contenttypes.ContentType', on_delete=models.CASCADE,
+                                     related_name='bulk_action_jobs')
+    pks = models.JSONField(default=list, editable=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    processed = models.PositiveIntegerField(default=0)
+    affected = models.PositiveIntegerField(default=0)
+    last_pk = models.BigIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey('account_app.User', on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='bulk_action_jobs')
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'core_bulk_action_job'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.action} ({self.get_status_display()})"
+
+    @property
+    def progress(self):
+        if not self.total:
+            return 100 if self.status == self.DONE else 0
+        return min(100, self.processed * 100 // self.total)
@@ -0,0 +1,44 @@
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+# زیر این تعداد شمارش دقیق ارزان است و تخمین لازم نیست
+EXACT_COUNT_LIMIT = 100000
+
+
+def estimate_count(queryset):
+    """
+    Row count of ``queryset`` from PostgreSQL's planner statistics: ``pg_class.reltuples`` for a
+    whole table, the planner's row estimate otherwise. None on other databases or when the table
+    has never been analyzed.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    if not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                           [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        estimate = row[0] if row else None
+    else:
+        plan = json.loads(queryset.order_by().explain(format='json'))
+        estimate = plan[0]['Plan']['Plan Rows']
+    return estimate if estimate is not None and estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for very large tables: above EXACT_COUNT_LIMIT rows the count comes from the
+    planner instead of a ``COUNT(*)`` over the whole table. The number of pages is then only
+    approximate.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is None or estimate < EXACT_COUNT_LIMIT:
+            return super().count
+        return estimate
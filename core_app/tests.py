@@ -1,3 +1,28 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
-# Create your tests here.
+from market_app.models import Currency
+
+
+class SoftDeleteTests(TestCase):
+
+    def setUp(self):
+        self.btc = Currency.objects.create(symbol='BTC', name='Bitcoin')
+        self.usdt = Currency.objects.create(symbol='USDT', name='Tether')
+
+    def test_deleted_rows_are_hidden(self):
+        self.btc.delete()
+        Currency.objects.filter(pk=self.usdt.pk).delete()
+
+        self.assertFalse(Currency.objects.exists())
+        self.assertEqual(Currency._base_manager.filter(is_deleted=True, deleted_at__isnull=False).count(), 2)
+
+    def test_live_rows_are_filtered_with_a_single_predicate(self):
+        with CaptureQueriesContext(connection) as queries:
+            list(Currency.objects.all())
+
+        # شرط IS NULL جلوی استفاده از ایندکس‌های جزئی را می‌گیرد
+        [query] = queries.captured_queries
+        self.assertIn('"is_deleted"', query['sql'])
+        self.assertNotIn('IS NULL', query['sql'])
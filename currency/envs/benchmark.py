@@ -0,0 +1,30 @@
+from currency.settings import *
+
+# Settings for `manage.py bench_matching`:
+#   DJANGO_SETTINGS_MODULE=currency.envs.benchmark python manage.py bench_matching
+SECRET_KEY = 'benchmark-only'
+
+BENCH_DATABASE = config('BENCH_DATABASE', default='sqlite')
+
+if BENCH_DATABASE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('BENCH_DB_NAME', default='currency_bench'),
+            'USER': config('BENCH_DB_USER', default='postgres'),
+            'PASSWORD': config('BENCH_DB_PASSWORD', default=''),
+            'HOST': config('BENCH_DB_HOST', default='localhost'),
+            'PORT': config('BENCH_DB_PORT', default=5432, cast=int),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': ':memory:',
+        }
+    }
+
+MATCHING_ENGINE_OWNER = True
+# The benchmark runs in a single process, so a process-local cache is enough
+SILENCED_SYSTEM_CHECKS = ['market_app.E001']
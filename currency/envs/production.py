@@ -2,4 +2,7 @@ from currency.settings import *
 
 SECRET_KEY = config('PROD_SECRET_KEY', cast=str)
 
+# Every process has to see the same cache; there is no local fallback in production
+CACHES['default']['BACKEND'] = config('CACHE_BACKEND', cast=str)
+
 # ALLOWED_HOSTS = []
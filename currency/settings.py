@@ -102,4 +102,34 @@ MEDIA_ROOT = BASE_DIR / 'media'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
-AUTH_USER_MODEL = "account_app.User"
\ No newline at end of file
+AUTH_USER_MODEL = "account_app.User"
+
+# کش بین همه پروسه‌ها (وب، workerها و run_matching_engine) مشترک است؛ کش فایلی پیش‌فرض فقط برای
+# یک میزبان کافی است و با چند میزبان باید Redis یا Memcached تنظیم شود
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('CACHE_LOCATION', default=str(BASE_DIR / 'var' / 'cache')),
+    }
+}
+
+
+# Matching engine
+MATCHING_ENGINE_DIR = config('MATCHING_ENGINE_DIR', default=str(BASE_DIR / 'var' / 'matching'))
+MATCHING_SNAPSHOT_EVERY = config('MATCHING_SNAPSHOT_EVERY', default=10000, cast=int)
+MATCHING_JOURNAL_SYNC_EVERY = config('MATCHING_JOURNAL_SYNC_EVERY', default=100, cast=int)
+# Only the run_matching_engine process opens engines; other processes send it EngineCommands
+MATCHING_ENGINE_OWNER = config('MATCHING_ENGINE_OWNER', default=False, cast=bool)
+MATCHING_COMMAND_TIMEOUT = config('MATCHING_COMMAND_TIMEOUT', default=5.0, cast=float)
+
+# Mark price: index price plus the basis smoothed over MARK_BASIS_SECONDS
+MARK_BASIS_SECONDS = config('MARK_BASIS_SECONDS', default=60.0, cast=float)
+MARK_PNL_FLUSH_INTERVAL = config('MARK_PNL_FLUSH_INTERVAL', default=1.0, cast=float)
+
+# Cold archive: closed orders and their trades older than ARCHIVE_AFTER_DAYS move to files per market and month
+ARCHIVE_DIR = config('ARCHIVE_DIR', default=str(BASE_DIR / 'var' / 'archive'))
+ARCHIVE_AFTER_DAYS = config('ARCHIVE_AFTER_DAYS', default=90, cast=int)
+
+# Holds: locked balances are copied to Wallet.locked at most every HOLDS_FLUSH_INTERVAL seconds
+HOLDS_FLUSH_INTERVAL = config('HOLDS_FLUSH_INTERVAL', default=1.0, cast=float)
+HOLDS_MARKET_BUFFER = config('HOLDS_MARKET_BUFFER', default=0.05, cast=float)
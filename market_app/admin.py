@@ -1,6 +1,19 @@
+from collections import defaultdict
+from functools import partial
+
+from django import forms
 from django.contrib import admin
+from django.db import transaction
+from django.db.models import DecimalField, F, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.utils.html import format_html
-from .models import Currency, Market, Order, Trade, FuturesPosition, FundingRate, Liquidation
+
+from core_app import bulk_actions
+from core_app.admin import LargeTableAdmin, background_action
+from market_app.engine import liquidation, service
+from .models import Currency, Market, Order, Trade, FuturesPosition, FundingRate, Liquidation, \
+    FundingPayment, FeeTier, UserDailyVolume
 
 
 @admin.register(Currency)
@@ -26,14 +39,37 @@ class CurrencyAdmin(admin.ModelAdmin):
     )
 
 
+class MarketAdminForm(forms.ModelForm):
+    class Meta:
+        model = Market
+        fields = '__all__'
+
+    def clean(self):
+        cleaned_data = super().clean()
+        changed = {'price_precision', 'amount_precision'} & set(self.changed_data)
+        # موتور در حال اجرا مقادیر دفتر را با واحدهای دقت قبلی نگه می‌دارد
+        if changed and self.instance.pk and service.engine_running(self.instance):
+            raise forms.ValidationError(
+                "The precision can not change while the market's matching engine runs. Stop run_matching_engine "
+                "first; the book is rebuilt with the new precision when it starts again.")
+        return cleaned_data
+
+
 @admin.register(Market)
 class MarketAdmin(admin.ModelAdmin):
+    form = MarketAdminForm
     list_display = ('market_pair', 'market_type', 'is_active', 'price_precision', 'amount_precision')
     list_filter = ('market_type', 'is_active', 'base_currency', 'quote_currency')
     search_fields = ('base_currency__symbol', 'quote_currency__symbol')
     list_editable = ('is_active', 'price_precision', 'amount_precision')
     raw_id_fields = ('base_currency', 'quote_currency')
 
+    list_select_related = ('base_currency', 'quote_currency')
+
+    def get_changelist_form(self, request, **kwargs):
+        kwargs.setdefault('form', MarketAdminForm)
+        return super().get_changelist_form(request, **kwargs)
+
     def market_pair(self, obj):
         return f"{obj.base_currency.symbol}/{obj.quote_currency.symbol}"
 
@@ -67,12 +103,14 @@ class TradeInline(admin.TabularInline):
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(LargeTableAdmin):
     list_display = ('order_id', 'user', 'market', 'side', 'order_type', 'amount_price', 'status', 'created_at')
+    list_select_related = ('user', 'market')
     list_filter = ('status', 'side', 'order_type', 'market__market_type')
     search_fields = (
     'user__username', 'market__base_currency__symbol', 'market__quote_currency__symbol', 'client_order_id')
-    readonly_fields = ('created_at', 'updated_at', 'filled_amount', 'avg_fill_price', 'fee', 'fee_currency')
+    readonly_fields = ('created_at', 'updated_at', 'filled_amount', 'avg_fill_price', 'fee', 'fee_currency',
+                       'triggered_at')
     raw_id_fields = ('user', 'market', 'fee_currency')
     inlines = [TradeInline]
     actions = ['cancel_orders', 'force_fill_orders']
@@ -94,7 +132,7 @@ class OrderAdmin(admin.ModelAdmin):
             'fields': ('user', 'market', 'order_type', 'side', 'status')
         }),
         ('Order Details', {
-            'fields': ('amount', 'price', 'stop_price', 'filled_amount', 'avg_fill_price')
+            'fields': ('amount', 'price', 'stop_price', 'triggered_at', 'filled_amount', 'avg_fill_price')
         }),
         ('Advanced', {
             'fields': ('time_in_force', 'reduce_only', 'close_position', 'client_order_id'),
@@ -106,29 +144,17 @@ class OrderAdmin(admin.ModelAdmin):
         }),
     )
 
-    def cancel_orders(self, request, queryset):
-        updated = queryset.filter(status=Order.OPEN).update(status=Order.CANCELLED)
-        self.message_user(request, f'{updated} orders cancelled.')
-
-    cancel_orders.short_description = "Cancel selected orders"
+    cancel_orders = background_action('market_app.cancel_orders', "Cancel selected orders", '{} orders cancelled.')
 
-    def force_fill_orders(self, request, queryset):
-        # این اکشن فقط برای اهداف تستی استفاده شود
-        updated = 0
-        for order in queryset.filter(status=Order.OPEN):
-            order.filled_amount = order.amount
-            order.avg_fill_price = order.price or order.market.get_current_price()
-            order.status = Order.FILLED
-            order.save()
-            updated += 1
-        self.message_user(request, f'{updated} orders force filled.')
-
-    force_fill_orders.short_description = "Force fill orders (TEST ONLY)"
+    # این اکشن فقط برای اهداف تستی استفاده شود
+    force_fill_orders = background_action('market_app.force_fill_orders', "Force fill orders (TEST ONLY)",
+                                          '{} orders force filled.')
 
 
 @admin.register(Trade)
-class TradeAdmin(admin.ModelAdmin):
+class TradeAdmin(LargeTableAdmin):
     list_display = ('trade_id', 'order', 'side', 'price_amount', 'fee_display', 'created_at')
+    list_select_related = ('order', 'fee_currency')
     list_filter = ('order__market', 'is_maker')
     raw_id_fields = ('order', 'fee_currency')
     readonly_fields = ('created_at', 'updated_at')
@@ -154,9 +180,24 @@ class TradeAdmin(admin.ModelAdmin):
     fee_display.short_description = 'Fee'
 
 
+@admin.register(FeeTier)
+class FeeTierAdmin(admin.ModelAdmin):
+    list_display = ('level', 'name', 'min_volume', 'maker_fee', 'taker_fee')
+    readonly_fields = ('created_at', 'updated_at')
+
+
+@admin.register(UserDailyVolume)
+class UserDailyVolumeAdmin(admin.ModelAdmin):
+    list_display = ('user', 'day', 'quote_volume', 'trade_count')
+    list_filter = ('day',)
+    search_fields = ('user__username',)
+    raw_id_fields = ('user',)
+
+
 @admin.register(FuturesPosition)
-class FuturesPositionAdmin(admin.ModelAdmin):
+class FuturesPositionAdmin(LargeTableAdmin):
     list_display = ('position_id', 'user', 'market', 'side_leverage', 'entry_mark_price', 'pnl_display', 'status')
+    list_select_related = ('user', 'market')
     list_filter = ('status', 'side', 'market')
     search_fields = ('user__username', 'market__base_currency__symbol')
     readonly_fields = ('created_at', 'updated_at', 'unrealized_pnl', 'realized_pnl', 'mark_price')
@@ -207,28 +248,31 @@ class FuturesPositionAdmin(admin.ModelAdmin):
     )
 
     def close_positions(self, request, queryset):
-        updated = queryset.filter(status=FuturesPosition.OPEN).update(status=FuturesPosition.CLOSED)
+        by_market = defaultdict(list)
+        for position_id, market_id in queryset.filter(status=FuturesPosition.OPEN).values_list('pk', 'market_id'):
+            by_market[market_id].append(position_id)
+        updated = FuturesPosition.objects.filter(
+            pk__in=[position_id for ids in by_market.values() for position_id in ids], status=FuturesPosition.OPEN
+        ).update(status=FuturesPosition.CLOSED, updated_at=timezone.now())
+        # UPDATE سیگنال post_save نمی‌فرستد؛ پوزیشن‌ها جدا از ستون‌های لیکوئید شدن حذف می‌شوند
+        for market_id, position_ids in by_market.items():
+            liquidation.remove_positions(market_id, position_ids)
         self.message_user(request, f'{updated} positions closed.')
 
     close_positions.short_description = "Close selected positions"
 
-    def force_liquidate(self, request, queryset):
-        # این اکشن فقط برای اهداف تستی استفاده شود
-        updated = 0
-        for position in queryset.filter(status=FuturesPosition.OPEN):
-            position.status = FuturesPosition.LIQUIDATED
-            position.save()
-            updated += 1
-        self.message_user(request, f'{updated} positions liquidated (TEST ONLY).')
-
-    force_liquidate.short_description = "Force liquidate (TEST ONLY)"
+    # این اکشن فقط برای اهداف تستی استفاده شود
+    force_liquidate = background_action('market_app.force_liquidate', "Force liquidate (TEST ONLY)",
+                                        '{} positions liquidated (TEST ONLY).')
 
 
 @admin.register(FundingRate)
 class FundingRateAdmin(admin.ModelAdmin):
-    list_display = ('market', 'rate_percent', 'next_funding_time', 'created_at')
+    list_display = ('market', 'rate_percent', 'next_funding_time', 'settled_at', 'created_at')
+    list_select_related = ('market',)
     list_filter = ('market',)
     raw_id_fields = ('market',)
+    readonly_fields = ('settled_at',)
 
     def rate_percent(self, obj):
         return f"{float(obj.rate) * 100:.4f}%"
@@ -236,8 +280,63 @@ class FundingRateAdmin(admin.ModelAdmin):
     rate_percent.short_description = 'Rate'
 
 
+@admin.register(FundingPayment)
+class FundingPaymentAdmin(LargeTableAdmin):
+    list_display = ('position', 'user', 'funding_rate', 'mark_price', 'amount', 'currency', 'created_at')
+    list_select_related = ('position', 'user', 'funding_rate', 'currency')
+    raw_id_fields = ('position', 'funding_rate', 'user', 'currency')
+    readonly_fields = ('created_at',)
+
+
 @admin.register(Liquidation)
-class LiquidationAdmin(admin.ModelAdmin):
+class LiquidationAdmin(LargeTableAdmin):
     list_display = ('position', 'price', 'amount', 'realized_pnl', 'created_at')
+    list_select_related = ('position',)
     raw_id_fields = ('position',)
-    readonly_fields = ('created_at', 'updated_at')
\ No newline at end of file
+    readonly_fields = ('created_at', 'updated_at')
+
+
+@bulk_actions.register('market_app.cancel_orders', atomic=False)
+def cancel_orders(queryset):
+    by_market = defaultdict(list)
+    live = queryset.filter(status__in=(Order.OPEN, Order.PARTIALLY_FILLED))
+    for order_id, market_id in live.values_list('pk', 'market_id'):
+        by_market[market_id].append(order_id)
+    cancelled = 0
+    # لغو از موتور تطبیق می‌گذرد تا سفارش از دفتر حذف و وجه رزروشده آزاد شود
+    for market in Market.objects.filter(pk__in=by_market):
+        cancelled += len(service.cancel_orders(market, by_market[market.pk]))
+    return cancelled
+
+
+@bulk_actions.register('market_app.force_fill_orders', atomic=False)
+def fill_orders(queryset):
+    by_market = defaultdict(list)
+    for order_id, market_id in queryset.filter(status=Order.OPEN).values_list('pk', 'market_id'):
+        by_market[market_id].append(order_id)
+    now = timezone.now()
+    updated = 0
+    for market in Market.objects.filter(pk__in=by_market):
+        order_ids = by_market[market.pk]
+        # اول از دفتر موتور برداشته می‌شوند تا دوباره معامله نشوند و وجه رزروشده‌شان آزاد شود
+        service.cancel_orders(market, order_ids)
+        # سفارش‌های بازار قیمت ندارند و با قیمت فعلی بازار خودشان پر می‌شوند
+        current_price = Value(market.get_current_price(), output_field=DecimalField())
+        updated += Order.objects.filter(pk__in=order_ids, status__in=(Order.OPEN, Order.CANCELLED)).update(
+            filled_amount=F('amount'), avg_fill_price=Coalesce('price', current_price), status=Order.FILLED,
+            updated_at=now)
+    return updated
+
+
+@bulk_actions.register('market_app.force_liquidate')
+def liquidate_positions(queryset):
+    by_market = defaultdict(list)
+    for position_id, market_id in queryset.filter(status=FuturesPosition.OPEN).values_list('pk', 'market_id'):
+        by_market[market_id].append(position_id)
+    updated = FuturesPosition.objects.filter(
+        pk__in=[position_id for ids in by_market.values() for position_id in ids], status=FuturesPosition.OPEN
+    ).update(status=FuturesPosition.LIQUIDATED, updated_at=timezone.now())
+    # ستون‌های حافظه فقط وقتی عوض می‌شوند که این تکه commit شده باشد
+    for market_id, position_ids in by_market.items():
+        transaction.on_commit(partial(liquidation.remove_positions, market_id, position_ids))
+    return updated
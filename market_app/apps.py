@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MarketAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'market_app'
+
+    def ready(self):
+        from market_app import checks, signals  # noqa: F401
@@ -0,0 +1,254 @@
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import TruncMonth
+
+from market_app.models import Order, OrderClientId, Trade
+from market_app.partitions import add_months, month_start
+
+ARCHIVED_STATUSES = (Order.FILLED, Order.CANCELLED, Order.EXPIRED)
+BATCH_SIZE = 5000
+DECIMAL_PLACES = 8
+NULL = np.iinfo(np.int64).min
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# ستون‌ها و نوع ذخیره هر کدام؛ ردیف‌های هر فایل بر اساس (user_id, created_at, id) مرتب هستند
+ORDER_COLUMNS = (
+    ('id', 'int'), ('user_id', 'int'), ('order_type', 'str'), ('side', 'str'), ('status', 'str'),
+    ('time_in_force', 'str'), ('amount', 'decimal'), ('price', 'decimal'), ('stop_price', 'decimal'),
+    ('filled_amount', 'decimal'), ('avg_fill_price', 'decimal'), ('fee', 'decimal'), ('fee_currency_id', 'int'),
+    ('reduce_only', 'bool'), ('close_position', 'bool'), ('client_order_id', 'str'), ('is_deleted', 'bool'),
+    ('created_at', 'datetime'), ('updated_at', 'datetime'), ('triggered_at', 'datetime'),
+)
+TRADE_COLUMNS = (
+    ('id', 'int'), ('order_id', 'int'), ('user_id', 'int'), ('side', 'str'), ('price', 'decimal'),
+    ('amount', 'decimal'), ('fee', 'decimal'), ('fee_currency_id', 'int'), ('is_maker', 'bool'),
+    ('is_deleted', 'bool'), ('created_at', 'datetime'),
+)
+ORDERS = 'orders'
+TRADES = 'trades'
+COLUMNS = {ORDERS: ORDER_COLUMNS, TRADES: TRADE_COLUMNS}
+
+
+def archive_dir(market_id):
+    return os.path.join(settings.ARCHIVE_DIR, f'market-{market_id}')
+
+
+def archive_path(market_id, month, kind, part=None):
+    """
+    The file of ``kind`` rows of a market and month. Every archived batch gets its own part file,
+    named after the first order id of the batch; ``part`` None is the single file older runs wrote.
+    """
+    name = f'{month:%Y-%m}-{kind}' if part is None else f'{month:%Y-%m}-{kind}-{part:020d}'
+    return os.path.join(archive_dir(market_id), f'{name}.npz')
+
+
+def _micros(moment):
+    delta = moment - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 10 ** 6 + delta.microseconds
+
+
+def _encode(values, kind):
+    if kind == 'str':
+        return np.array(['' if value is None else value for value in values], dtype=str)
+    if kind == 'bool':
+        return np.array([bool(value) for value in values], dtype=bool)
+    if kind == 'int':
+        return np.array([NULL if value is None else value for value in values], dtype=np.int64)
+    if kind == 'datetime':
+        return np.array([NULL if value is None else _micros(value) for value in values], dtype=np.int64)
+    units = [None if value is None else int(value.scaleb(DECIMAL_PLACES)) for value in values]
+    if all(unit is None or NULL < unit < -NULL for unit in units):
+        return np.array([NULL if unit is None else unit for unit in units], dtype=np.int64)
+    # مقدارهایی که در int64 جا نمی‌شوند به صورت متن نگه داشته می‌شوند
+    return np.array(['' if value is None else str(value) for value in values], dtype=str)
+
+
+def _decode(array, kind):
+    if kind == 'bool':
+        return [bool(value) for value in array]
+    if array.dtype.kind == 'U':
+        if kind == 'decimal':
+            return [Decimal(value) if value else None for value in array]
+        return [value or None for value in array.tolist()]
+    values = array.tolist()
+    if kind == 'int':
+        return [None if value == NULL else value for value in values]
+    if kind == 'datetime':
+        return [None if value == NULL else EPOCH + timedelta(microseconds=value) for value in values]
+    return [None if value == NULL else Decimal(value).scaleb(-DECIMAL_PLACES) for value in values]
+
+
+def write_archive(path, kind, rows):
+    """
+    Write ``rows`` to the archive file at ``path``, sorted by user and time. The file is written
+    next to its final name and renamed into place, so writing the same batch again after an
+    interruption just replaces it. Existing files are never read back and merged.
+    """
+    ordered = sorted(rows, key=lambda row: (row['user_id'], row['created_at'], row['id']))
+    arrays = {name: _encode([row[name] for row in ordered], column_kind) for name, column_kind in COLUMNS[kind]}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as stream:
+        np.savez_compressed(stream, **arrays)
+        stream.flush()
+        os.fsync(stream.fileno())
+    os.replace(temporary, path)
+    return len(ordered)
+
+
+def _order_rows(orders):
+    return list(orders.values(*(name for name, _ in ORDER_COLUMNS)))
+
+
+def _trade_rows(trades, *extra):
+    # کاربر و جهت معامله از سفارشش می‌آیند تا فایل معاملات بدون فایل سفارش‌ها بر اساس کاربر خوانده شود
+    fields = [name for name, _ in TRADE_COLUMNS if name not in ('user_id', 'side')]
+    trades = trades.annotate(user_id=F('order__user_id'), side=F('order__side'))
+    return list(trades.values(*fields, 'user_id', 'side', *extra))
+
+
+def archive_closed_orders(before, market_id=None, batch_size=BATCH_SIZE):
+    """
+    Move filled, cancelled and expired orders last updated before ``before``, with their trades,
+    from the database into the archive files of their market and month, then delete them.
+    Orders are taken ``batch_size`` at a time in id order; each batch is written to its own part
+    files and deleted before the next one is read, so only one batch is ever held in memory.
+    Returns the archived order and trade counts.
+    """
+    closed = Order._base_manager.filter(status__in=ARCHIVED_STATUSES, updated_at__lt=before)
+    if market_id is not None:
+        closed = closed.filter(market_id=market_id)
+    groups = (closed.annotate(month=TruncMonth('created_at', tzinfo=dt_timezone.utc))
+              .values_list('market_id', 'month').distinct().order_by('market_id', 'month'))
+    archived_orders = archived_trades = 0
+    for group_market_id, month in list(groups):
+        orders = closed.filter(market_id=group_market_id, created_at__gte=month,
+                               created_at__lt=add_months(month, 1)).order_by('pk')
+        last_id = 0
+        while True:
+            batch = list(orders.filter(pk__gt=last_id).values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1]
+            order_rows = _order_rows(Order._base_manager.filter(pk__in=batch))
+            trade_rows = _trade_rows(Trade._base_manager.filter(order_id__in=batch))
+
+            # نام فایل‌ها از اولین سفارش دسته است تا اجرای دوباره همان دسته، همان فایل‌ها را جایگزین کند
+            write_archive(archive_path(group_market_id, month, ORDERS, batch[0]), ORDERS, order_rows)
+            by_month = {}
+            for row in trade_rows:
+                by_month.setdefault(month_start(row['created_at']), []).append(row)
+            for trade_month, rows in by_month.items():
+                write_archive(archive_path(group_market_id, trade_month, TRADES, batch[0]), TRADES, rows)
+
+            with transaction.atomic():
+                Trade._base_manager.filter(order_id__in=batch).delete()
+                Order._base_manager.filter(pk__in=batch).delete()
+                OrderClientId.objects.filter(order_id__in=batch).delete()
+            archived_orders += len(order_rows)
+            archived_trades += len(trade_rows)
+    return archived_orders, archived_trades
+
+
+def _archived_files(market_id, kind):
+    """The (month, path) of every archive file of ``kind`` of a market, by month."""
+    directory = archive_dir(market_id)
+    if not os.path.isdir(directory):
+        return []
+    files = []
+    for name in os.listdir(directory):
+        stem, extension = os.path.splitext(name)
+        parts = stem.split('-')
+        if extension != '.npz' or len(parts) not in (3, 4) or parts[2] != kind:
+            continue
+        month = datetime.strptime(f'{parts[0]}-{parts[1]}', '%Y-%m').replace(tzinfo=dt_timezone.utc)
+        files.append((month, os.path.join(directory, name)))
+    return sorted(files)
+
+
+def _archived_markets():
+    if not os.path.isdir(settings.ARCHIVE_DIR):
+        return []
+    return sorted(int(name[len('market-'):]) for name in os.listdir(settings.ARCHIVE_DIR)
+                  if name.startswith('market-') and name[len('market-'):].isdigit())
+
+
+def _select(users, created, user_id, start, end):
+    """Positions of the rows of ``user_id`` (of every user when None) created in [start, end)."""
+    if user_id is None:
+        mask = np.ones(len(users), dtype=bool)
+        if start is not None:
+            mask &= created >= _micros(start)
+        if end is not None:
+            mask &= created < _micros(end)
+        return np.flatnonzero(mask)
+    low, high = (int(position) for position in np.searchsorted(users, [user_id, user_id + 1]))
+    # داخل ردیف‌های یک کاربر created_at مرتب است
+    window = created[low:high]
+    first = int(np.searchsorted(window, _micros(start))) if start is not None else 0
+    last = int(np.searchsorted(window, _micros(end))) if end is not None else len(window)
+    return np.arange(low + first, low + last)
+
+
+def read_archive(kind, user_id=None, start=None, end=None, market_ids=None):
+    """
+    Archived orders or trades (``kind`` ORDERS or TRADES) as dicts, with ``market_id`` added.
+    Only the files of months overlapping [start, end) are opened; inside a file the rows of
+    ``user_id`` and the time range are found by binary search on the sorted columns, and only
+    those rows are decoded. A row found in more than one file is returned once, and
+    soft-deleted rows are left out.
+    """
+    rows = {}
+    for market_id in (market_ids if market_ids is not None else _archived_markets()):
+        for month, path in _archived_files(market_id, kind):
+            if (end is not None and month >= end) or (start is not None and add_months(month, 1) <= start):
+                continue
+            with np.load(path) as data:
+                selected = _select(data['user_id'], data['created_at'], user_id, start, end)
+                if not len(selected):
+                    continue
+                columns = {name: _decode(data[name][selected], column_kind) for name, column_kind in COLUMNS[kind]}
+            for row in zip(*columns.values()):
+                row = dict(zip(columns, row))
+                row['market_id'] = market_id
+                rows[row['id']] = row
+    return [row for row in rows.values() if not row['is_deleted']]
+
+
+def _merge(rows, archived):
+    # ردیفی که هنوز در پایگاه داده است (مثلاً وسط بایگانی قطع شده) بر نسخه بایگانی ترجیح دارد
+    ids = {row['id'] for row in rows}
+    rows += [row for row in archived if row['id'] not in ids]
+    return sorted(rows, key=lambda row: (row['created_at'], row['id']), reverse=True)
+
+
+def order_history(user_id, start=None, end=None, market_id=None):
+    """A user's orders, newest first, from the database and the archive alike."""
+    orders = Order.objects.filter(user_id=user_id)
+    if start is not None:
+        orders = orders.filter(created_at__gte=start)
+    if end is not None:
+        orders = orders.filter(created_at__lt=end)
+    if market_id is not None:
+        orders = orders.filter(market_id=market_id)
+    rows = list(orders.values(*(name for name, _ in ORDER_COLUMNS), 'market_id'))
+    return _merge(rows, read_archive(ORDERS, user_id, start, end, None if market_id is None else [market_id]))
+
+
+def trade_history(user_id, start=None, end=None, market_id=None):
+    """A user's trades, newest first, from the database and the archive alike."""
+    trades = Trade.objects.filter(order__user_id=user_id)
+    if start is not None:
+        trades = trades.filter(created_at__gte=start)
+    if end is not None:
+        trades = trades.filter(created_at__lt=end)
+    if market_id is not None:
+        trades = trades.filter(order__market_id=market_id)
+    rows = _trade_rows(trades.annotate(market_id=F('order__market_id')), 'market_id')
+    return _merge(rows, read_archive(TRADES, user_id, start, end, None if market_id is None else [market_id]))
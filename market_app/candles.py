@@ -0,0 +1,211 @@
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.core.cache import cache
+
+from market_app.models import Candle
+
+INTERVALS = [interval for interval, _ in Candle.INTERVAL_CHOICES]
+SECONDS = Candle.INTERVAL_SECONDS
+# هر بازه از کندل‌های بسته شده بازه کوچکتر قبلی ساخته می‌شود
+PARENT = dict(zip(INTERVALS, INTERVALS[1:]))
+BATCH_SIZE = 500
+
+_aggregators = {}
+_aggregators_lock = threading.Lock()
+
+
+def floor_time(timestamp, interval):
+    seconds = SECONDS[interval]
+    return int(timestamp) // seconds * seconds
+
+
+class Bar:
+    __slots__ = ('open_time', 'open', 'high', 'low', 'close', 'volume', 'quote_volume', 'trade_count')
+
+    def __init__(self, open_time, open, high, low, close, volume, quote_volume, trade_count):
+        self.open_time = open_time
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        self.quote_volume = quote_volume
+        self.trade_count = trade_count
+
+    @classmethod
+    def from_trade(cls, open_time, price, amount):
+        return cls(open_time, price, price, price, price, amount, price * amount, 1)
+
+    @classmethod
+    def from_list(cls, data):
+        return cls(data[0] // 1000, *(Decimal(value) for value in data[1:7]), data[7])
+
+    def add_trade(self, price, amount):
+        if price > self.high:
+            self.high = price
+        if price < self.low:
+            self.low = price
+        self.close = price
+        self.volume += amount
+        self.quote_volume += price * amount
+        self.trade_count += 1
+
+    def merge(self, later):
+        """Fold in a bar that covers the time right after this one."""
+        if later.high > self.high:
+            self.high = later.high
+        if later.low < self.low:
+            self.low = later.low
+        self.close = later.close
+        self.volume += later.volume
+        self.quote_volume += later.quote_volume
+        self.trade_count += later.trade_count
+
+    def copy(self, open_time=None):
+        return Bar(self.open_time if open_time is None else open_time, self.open, self.high, self.low, self.close,
+                   self.volume, self.quote_volume, self.trade_count)
+
+    def to_list(self):
+        return [self.open_time * 1000, str(self.open), str(self.high), str(self.low), str(self.close),
+                str(self.volume), str(self.quote_volume), self.trade_count]
+
+    def to_model(self, market_id, interval):
+        return Candle(
+            market_id=market_id,
+            interval=interval,
+            open_time=datetime.fromtimestamp(self.open_time, dt_timezone.utc),
+            open=self.open,
+            high=self.high,
+            low=self.low,
+            close=self.close,
+            volume=self.volume,
+            quote_volume=self.quote_volume,
+            trade_count=self.trade_count,
+        )
+
+
+class CandleAggregator:
+    """
+    Builds the candles of one market from its trades.
+
+    Only the 1m candle sees individual trades. When a candle's period is over it is queued for
+    the database and folded into the open candle of the next larger interval, so a 1d candle is
+    the sum of its 4h candles and so on. ``open[interval]`` therefore only holds the closed
+    children of the running period; ``current`` adds the still open children on top.
+    """
+
+    def __init__(self, market_id, open_bars=None):
+        self.market_id = market_id
+        self.open = open_bars or {}
+        self.closed = []
+
+    def add_trade(self, timestamp, price, amount):
+        self.advance(timestamp)
+        bar = self.open.get(Candle.ONE_MINUTE)
+        if bar is None:
+            self.open[Candle.ONE_MINUTE] = Bar.from_trade(floor_time(timestamp, Candle.ONE_MINUTE), price, amount)
+        else:
+            bar.add_trade(price, amount)
+
+    def advance(self, now):
+        """Close every open candle whose period ended before ``now``."""
+        for interval in INTERVALS:
+            bar = self.open.get(interval)
+            if bar is not None and bar.open_time + SECONDS[interval] <= now:
+                del self.open[interval]
+                self._close(interval, bar)
+
+    def current(self, interval):
+        """The running candle of ``interval`` including its open children, or None."""
+        position = INTERVALS.index(interval)
+        latest = next((self.open[iv] for iv in INTERVALS[:position + 1] if iv in self.open), None)
+        if latest is None:
+            return None
+        period = floor_time(latest.open_time, interval)
+        result = None
+        for iv in reversed(INTERVALS[:position + 1]):
+            bar = self.open.get(iv)
+            if bar is None or floor_time(bar.open_time, interval) != period:
+                continue
+            if result is None:
+                result = bar.copy(open_time=period)
+            else:
+                result.merge(bar)
+        return result
+
+    def flush(self):
+        if self.closed:
+            Candle.objects.bulk_create(self.closed, batch_size=BATCH_SIZE, ignore_conflicts=True)
+            self.closed = []
+
+    def state(self):
+        return {interval: bar.to_list() for interval, bar in self.open.items()}
+
+    def _close(self, interval, bar):
+        self.closed.append(bar.to_model(self.market_id, interval))
+        parent = PARENT.get(interval)
+        if parent is None:
+            return
+        parent_bar = self.open.get(parent)
+        if parent_bar is None:
+            self.open[parent] = bar.copy(open_time=floor_time(bar.open_time, parent))
+        else:
+            parent_bar.merge(bar)
+
+
+def _state_key(market_id):
+    return f'market:{market_id}:open_candles'
+
+
+def _load_state(market_id):
+    state = cache.get(_state_key(market_id)) or {}
+    return {interval: Bar.from_list(data) for interval, data in state.items()}
+
+
+def get_aggregator(market_id):
+    aggregator = _aggregators.get(market_id)
+    if aggregator is None:
+        with _aggregators_lock:
+            aggregator = _aggregators.get(market_id)
+            if aggregator is None:
+                aggregator = _aggregators[market_id] = CandleAggregator(market_id, _load_state(market_id))
+    return aggregator
+
+
+def record_trades(market_id, trades):
+    """
+    Feed persisted trades to the market's candles, store the candles they closed and publish the
+    open ones. Every fill is stored as a maker and a taker row; only the taker rows are counted.
+    """
+    aggregator = get_aggregator(market_id)
+    with _aggregators_lock:
+        for trade in trades:
+            if not trade.is_maker:
+                aggregator.add_trade(trade.created_at.timestamp(), trade.price, trade.amount)
+        aggregator.flush()
+        cache.set(_state_key(market_id), aggregator.state(), None)
+
+
+def close_stale(market_id, now=None):
+    """Close candles whose period ended without a new trade; meant to run periodically."""
+    aggregator = get_aggregator(market_id)
+    with _aggregators_lock:
+        aggregator.advance(time.time() if now is None else now)
+        aggregator.flush()
+        cache.set(_state_key(market_id), aggregator.state(), None)
+
+
+def reset_aggregators():
+    with _aggregators_lock:
+        _aggregators.clear()
+
+
+def open_candle(market_id, interval):
+    """
+    The newest candle of ``interval`` that is not in the database yet, read from the shared cache.
+    Its period may already be over if the market has not traded since.
+    """
+    return CandleAggregator(market_id, _load_state(market_id)).current(interval)
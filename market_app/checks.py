@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+from django.db import connections
+from django.utils import timezone
+
+from market_app.models import Order, Trade
+from market_app.partitions import add_months, month_start, partitioned_until
+
+# کش‌هایی که بین پروسه‌ها مشترک نیستند
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Prices, depth, tickers and the registry version are handed between processes through the
+    default cache, so it has to be one every process shares.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Error(
+        f"The default cache ({backend}) is not shared between processes.",
+        hint="Set CACHE_BACKEND and CACHE_LOCATION to a shared cache such as Redis or Memcached.",
+        id='market_app.E001',
+    )]
+
+
+@register(Tags.database)
+def check_partitions_ahead(app_configs, databases=None, **kwargs):
+    """
+    Inserts into the partitioned order and trade tables fail once a month has no partition, so
+    warn while fewer than the next month is covered. Only runs with ``check --database``.
+    """
+    needed = add_months(month_start(timezone.now()), 2)
+    warnings = []
+    for alias in databases or ():
+        for model in (Order, Trade):
+            until = partitioned_until(model, connections[alias])
+            if until is None or until >= needed:
+                continue
+            warnings.append(Warning(
+                f"{model._meta.db_table} only has partitions up to {until:%Y-%m-%d} on database {alias!r}.",
+                hint="Run manage_partitions daily; inserts fail for a month without a partition.",
+                id='market_app.W001',
+            ))
+    return warnings
@@ -0,0 +1,245 @@
+from bisect import bisect_left, insort
+from collections import OrderedDict, deque
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+
+from market_app.models import Order
+
+DELTA_HISTORY = 10000
+# field -> the Scale method that turns its Decimal value into units
+UNIT_FIELDS = {
+    'price': 'price', 'stop_price': 'price', 'amount': 'amount', 'filled': 'amount', 'notional': 'notional',
+    'fee': 'fee', 'maker_rate': 'rate', 'taker_rate': 'rate',
+}
+
+
+class BookOrder:
+    """
+    In-memory view of an Order while it is handled by the matching engine. Prices, amounts,
+    notional, fee and fee rates are ints in the units of the engine's ``fixed.Scale``.
+    ``maker_rate`` and ``taker_rate`` are the owner's fee rates fixed when the order was placed;
+    None means the market's flat rates. ``budget`` caps the notional a market buy may spend.
+    """
+    __slots__ = ('id', 'user_id', 'side', 'order_type', 'price', 'stop_price', 'amount', 'filled', 'notional',
+                 'fee', 'status', 'time_in_force', 'triggered_at', 'maker_rate', 'taker_rate', 'budget')
+
+    def __init__(self, id, user_id, side, order_type, amount, price=None, stop_price=None, filled=0,
+                 notional=0, fee=0, status=Order.OPEN, time_in_force=Order.GTC, triggered_at=None,
+                 maker_rate=None, taker_rate=None, budget=None):
+        self.id = id
+        self.user_id = user_id
+        self.side = side
+        self.order_type = order_type
+        self.price = price
+        self.stop_price = stop_price
+        self.amount = amount
+        self.filled = filled
+        self.notional = notional
+        self.fee = fee
+        self.status = status
+        self.time_in_force = time_in_force
+        self.triggered_at = triggered_at
+        self.maker_rate = maker_rate
+        self.taker_rate = taker_rate
+        self.budget = budget
+
+    @classmethod
+    def from_order(cls, order, scale):
+        """
+        Raises fixed.InexactValue when the order's price or amount is finer than the scale. The
+        stored notional is rebuilt from the rounded average price, so it is rounded too.
+        """
+        notional = order.filled_amount * order.avg_fill_price if order.avg_fill_price else 0
+        order_type = order.order_type
+        if order.triggered_at is not None:
+            order_type = Order.TRIGGERED_TYPES.get(order_type, order_type)
+        return cls(
+            id=order.pk,
+            user_id=order.user_id,
+            side=order.side,
+            order_type=order_type,
+            amount=scale.amount(order.amount),
+            price=scale.price(order.price),
+            stop_price=scale.price(order.stop_price),
+            filled=scale.amount(order.filled_amount),
+            notional=scale.notional(notional, ROUND_HALF_UP),
+            fee=scale.fee(order.fee, ROUND_HALF_UP),
+            status=order.status,
+            time_in_force=order.time_in_force,
+            triggered_at=order.triggered_at,
+        )
+
+    def to_dict(self):
+        data = {name: getattr(self, name) for name in self.__slots__}
+        if self.triggered_at is not None:
+            data['triggered_at'] = self.triggered_at.isoformat()
+        return data
+
+    @classmethod
+    def from_dict(cls, data, scale):
+        data = dict(data)
+        for name, kind in UNIT_FIELDS.items():
+            if isinstance(data.get(name), str):
+                # رکوردهای قدیمی ژورنال و snapshot مقادیر را به صورت رشته Decimal نگه داشته‌اند
+                data[name] = getattr(scale, kind)(Decimal(data[name]), ROUND_HALF_UP)
+        if data['triggered_at'] is not None:
+            data['triggered_at'] = datetime.fromisoformat(data['triggered_at'])
+        return cls(**data)
+
+    @property
+    def remaining(self):
+        return self.amount - self.filled
+
+    def __repr__(self):
+        return f"<BookOrder {self.id} {self.side} {self.remaining}@{self.price}>"
+
+
+class PriceLevel:
+    __slots__ = ('price', 'orders', 'size')
+
+    def __init__(self, price):
+        self.price = price
+        self.orders = OrderedDict()
+        self.size = 0
+
+    def first(self):
+        return next(iter(self.orders.values()))
+
+
+class OrderBook:
+    """
+    Resting limit orders of a single market, grouped in price levels.
+
+    Each side keeps a sorted list of level keys with the best level at the end, so reaching and
+    dropping the top of the book never shifts the list. Bids are keyed by price and asks by the
+    negated price. Orders inside a level keep their arrival order (time priority).
+
+    Every change of a level's aggregated size gets the next sequence number and is recorded as a
+    ``(sequence, side, price, size)`` delta, a size of zero meaning the level is gone.
+    """
+
+    def __init__(self):
+        self.levels = {Order.BUY: {}, Order.SELL: {}}
+        self.keys = {Order.BUY: [], Order.SELL: []}
+        self.orders = {}
+        self.by_user = {}
+        self.sequence = 0
+        self.deltas = deque(maxlen=DELTA_HISTORY)
+        self.listeners = []
+
+    @staticmethod
+    def _key(side, price):
+        return price if side == Order.BUY else -price
+
+    def __contains__(self, order_id):
+        return order_id in self.orders
+
+    def __len__(self):
+        return len(self.orders)
+
+    def best(self, side):
+        keys = self.keys[side]
+        if not keys:
+            return None
+        return self.levels[side][keys[-1]]
+
+    def best_price(self, side):
+        level = self.best(side)
+        return level.price if level is not None else None
+
+    def iter_levels(self, side):
+        """Yield the levels of ``side`` from the best price outwards."""
+        levels = self.levels[side]
+        for key in reversed(self.keys[side]):
+            yield levels[key]
+
+    def depth(self, limit):
+        """Aggregated ``(price, size)`` pairs of the best ``limit`` levels per side."""
+        return {
+            'sequence': self.sequence,
+            Order.BUY: self._top(Order.BUY, limit),
+            Order.SELL: self._top(Order.SELL, limit),
+        }
+
+    def deltas_since(self, sequence):
+        """
+        Deltas recorded after ``sequence``, or None when some of them already fell out of the
+        history, or ``sequence`` is ahead of the book (the engine restarted from an older state),
+        and the caller has to start over from a fresh snapshot.
+        """
+        if sequence == self.sequence:
+            return []
+        if sequence > self.sequence:
+            return None
+        if not self.deltas or self.deltas[0][0] > sequence + 1:
+            return None
+        return [delta for delta in self.deltas if delta[0] > sequence]
+
+    def add(self, order):
+        key = self._key(order.side, order.price)
+        levels = self.levels[order.side]
+        level = levels.get(key)
+        if level is None:
+            level = levels[key] = PriceLevel(order.price)
+            insort(self.keys[order.side], key)
+        level.orders[order.id] = order
+        self.orders[order.id] = order
+        self.by_user.setdefault(order.user_id, {})[order.id] = order
+        self._resize(order.side, level, order.remaining)
+
+    def remove(self, order_id):
+        order = self.orders.get(order_id)
+        if order is None:
+            return None
+        level = self.levels[order.side][self._key(order.side, order.price)]
+        self._resize(order.side, level, -order.remaining)
+        self._discard(order, level)
+        return order
+
+    def fill(self, order, amount):
+        """Reduce a resting order by ``amount`` and take it off the book once it is exhausted."""
+        order.filled += amount
+        level = self.levels[order.side][self._key(order.side, order.price)]
+        self._resize(order.side, level, -amount)
+        if not order.remaining:
+            self._discard(order, level)
+
+    def _top(self, side, limit):
+        levels = self.levels[side]
+        keys = self.keys[side]
+        return [(levels[key].price, levels[key].size) for key in keys[:-limit - 1:-1]] if limit > 0 else []
+
+    def _resize(self, side, level, change):
+        level.size += change
+        self.sequence += 1
+        delta = (self.sequence, side, level.price, level.size)
+        self.deltas.append(delta)
+        for listener in self.listeners:
+            listener(delta)
+
+    def user_orders(self, user_id, side=None):
+        """Resting orders of ``user_id``, oldest first, optionally only those on ``side``."""
+        orders = self.by_user.get(user_id, {}).values()
+        return [order for order in orders if side is None or order.side == side]
+
+    def _discard(self, order, level):
+        del self.orders[order.id]
+        unindex_user_order(self.by_user, order)
+        del level.orders[order.id]
+        if not level.orders:
+            self._drop_level(order.side, self._key(order.side, order.price))
+
+    def _drop_level(self, side, key):
+        keys = self.keys[side]
+        if keys[-1] == key:
+            keys.pop()
+        else:
+            del keys[bisect_left(keys, key)]
+        del self.levels[side][key]
+
+
+def unindex_user_order(by_user, order):
+    user_orders = by_user[order.user_id]
+    del user_orders[order.id]
+    if not user_orders:
+        del by_user[order.user_id]
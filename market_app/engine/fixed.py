@@ -0,0 +1,132 @@
+from decimal import Decimal
+from functools import lru_cache
+
+# نرخ کارمزد در مدل‌ها چهار رقم اعشار دارد و کارمزد مثل بقیه مقادیر هشت رقم
+RATE_PLACES = 4
+FEE_PLACES = 8
+
+
+class InexactValue(ValueError):
+    pass
+
+
+def to_units(value, places, rounding=None):
+    """
+    ``value`` as an int count of ``10 ** -places``. Without ``rounding`` the value must fit exactly,
+    otherwise InexactValue is raised.
+    """
+    if value is None:
+        return None
+    units = Decimal(value).scaleb(places)
+    if rounding is None:
+        if units != units.to_integral_value():
+            raise InexactValue(f"{value} has more than {places} decimal places.")
+        return int(units)
+    return int(units.to_integral_value(rounding=rounding))
+
+
+def from_units(units, places):
+    if units is None:
+        return None
+    return Decimal(units).scaleb(-places)
+
+
+def _fee_factors(places, fee_places):
+    """Multiplier and divisor taking a product with ``places`` decimal places to ``fee_places``."""
+    if places >= fee_places:
+        return 1, 10 ** (places - fee_places)
+    return 10 ** (fee_places - places), 1
+
+
+def _half_up(units, divisor):
+    # مثل ROUND_HALF_UP، نیمه‌ها از صفر دور می‌شوند
+    if units >= 0:
+        return (units + divisor // 2) // divisor
+    return -((divisor // 2 - units) // divisor)
+
+
+class Scale:
+    """
+    Fixed-point units of one market: prices count ``10 ** -price_places``, amounts
+    ``10 ** -amount_places``, notionals (price times amount) the product of both, fee rates
+    ``10 ** -RATE_PLACES`` and fees ``10 ** -FEE_PLACES``. Fees are rounded to the decimals of the
+    currency they are charged in, ``base_places`` for buyers and ``quote_places`` for sellers, but
+    still counted in FEE_PLACES units. The matching engine only adds, compares and multiplies these
+    ints; they become Decimals again when they are written to the database.
+    """
+    __slots__ = ('price_places', 'amount_places', 'notional_places', 'base_places', 'quote_places',
+                 '_buy_factor', '_buy_divisor', '_buy_unit', '_sell_factor', '_sell_divisor', '_sell_unit')
+
+    def __init__(self, price_places, amount_places, base_places=FEE_PLACES, quote_places=FEE_PLACES):
+        self.price_places = price_places
+        self.amount_places = amount_places
+        self.notional_places = price_places + amount_places
+        # ستون کارمزد در دیتابیس هشت رقم اعشار دارد
+        self.base_places = min(base_places, FEE_PLACES)
+        self.quote_places = min(quote_places, FEE_PLACES)
+        self._buy_factor, self._buy_divisor = _fee_factors(amount_places + RATE_PLACES, self.base_places)
+        self._buy_unit = 10 ** (FEE_PLACES - self.base_places)
+        self._sell_factor, self._sell_divisor = _fee_factors(self.notional_places + RATE_PLACES, self.quote_places)
+        self._sell_unit = 10 ** (FEE_PLACES - self.quote_places)
+
+    def __eq__(self, other):
+        return isinstance(other, Scale) and self.as_tuple() == other.as_tuple()
+
+    def __hash__(self):
+        return hash(self.as_tuple())
+
+    def __repr__(self):
+        return (f"<Scale price={self.price_places} amount={self.amount_places} base={self.base_places} "
+                f"quote={self.quote_places}>")
+
+    def as_tuple(self):
+        return self.price_places, self.amount_places, self.base_places, self.quote_places
+
+    def price(self, value, rounding=None):
+        return to_units(value, self.price_places, rounding)
+
+    def amount(self, value, rounding=None):
+        return to_units(value, self.amount_places, rounding)
+
+    def notional(self, value, rounding=None):
+        return to_units(value, self.notional_places, rounding)
+
+    def rate(self, value, rounding=None):
+        return to_units(value, RATE_PLACES, rounding)
+
+    def fee(self, value, rounding=None):
+        return to_units(value, FEE_PLACES, rounding)
+
+    def to_price(self, units):
+        return from_units(units, self.price_places)
+
+    def to_amount(self, units):
+        return from_units(units, self.amount_places)
+
+    def to_notional(self, units):
+        return from_units(units, self.notional_places)
+
+    def to_fee(self, units):
+        return from_units(units, FEE_PLACES)
+
+    def buy_fee(self, amount, rate):
+        """Fee of a buyer, charged in the base currency on the amount bought."""
+        return _half_up(amount * rate * self._buy_factor, self._buy_divisor) * self._buy_unit
+
+    def sell_fee(self, notional, rate):
+        """Fee of a seller, charged in the quote currency on the notional sold."""
+        return _half_up(notional * rate * self._sell_factor, self._sell_divisor) * self._sell_unit
+
+
+@lru_cache(maxsize=None)
+def get_scale(price_places, amount_places, base_places=FEE_PLACES, quote_places=FEE_PLACES):
+    return Scale(price_places, amount_places, base_places, quote_places)
+
+
+def market_scale(market):
+    from market_app import registry
+
+    # ارزهای بازار از رجیستری خوانده می‌شوند تا ساخت موتور کوئری اضافه نزند
+    base = registry.get_currency(market.base_currency_id) or market.base_currency
+    quote = registry.get_currency(market.quote_currency_id) or market.quote_currency
+    return get_scale(market.price_precision, market.amount_precision, base.decimals, quote.decimals)
@@ -0,0 +1,258 @@
+import threading
+import time
+from decimal import Decimal, ROUND_FLOOR, ROUND_HALF_UP
+from functools import partial
+
+from django.conf import settings
+
+from account_app import ledger
+from account_app.models import Wallet
+from market_app.models import Market, Order
+
+ZERO = Decimal(0)
+AMOUNT_QUANT = Decimal('0.00000001')
+TERMINAL = (Order.FILLED, Order.CANCELLED, Order.EXPIRED, Order.REJECTED)
+BATCH_SIZE = 1000
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+class Account:
+    """``total`` is the ledger balance of a wallet, ``locked`` the part reserved by open orders."""
+    __slots__ = ('total', 'locked')
+
+    def __init__(self, total, locked=ZERO):
+        self.total = total
+        self.locked = locked
+
+    @property
+    def available(self):
+        return self.total - self.locked
+
+
+class HoldBook:
+    """
+    Reserved balances of every user, kept in memory by the process that runs the matching engines.
+
+    Placing an order locks what it may spend (quote for buys, base for sells); fills move the locked
+    funds out and the proceeds in, and an order that stops being open gives back what is left of
+    its hold. Nothing here takes a database lock: ``flush`` copies the locked amounts that changed
+    to ``Wallet.locked`` in batches, and totals are only read from the ledger the first time an
+    account is used, or again before an order is rejected for lack of funds.
+    """
+
+    def __init__(self):
+        self.accounts = {}
+        # order_id -> [user_id, currency_id, held]
+        self.orders = {}
+        self.dirty = set()
+        self.flushed_at = None
+        self.lock = threading.RLock()
+
+    @classmethod
+    def load(cls):
+        """Rebuild the holds of every order that is still open on a spot market."""
+        book = cls()
+        orders = Order.objects.filter(
+            status__in=(Order.OPEN, Order.PARTIALLY_FILLED), market__market_type=Market.SPOT,
+        ).values_list('id', 'user_id', 'side', 'amount', 'filled_amount', 'price', 'stop_price',
+                      'market__base_currency_id', 'market__quote_currency_id')
+        for order_id, user_id, side, amount, filled, price, stop_price, base, quote in orders:
+            remaining = amount - filled
+            if side == Order.SELL:
+                book._lock_order(order_id, user_id, base, remaining)
+            else:
+                book._lock_order(order_id, user_id, quote, _buy_hold(remaining, price, stop_price))
+        return book
+
+    def account(self, user_id, currency_id):
+        key = (user_id, currency_id)
+        account = self.accounts.get(key)
+        if account is None:
+            account = self.accounts[key] = Account(ledger.balance(user_id, currency_id))
+        return account
+
+    def reserve_order(self, order, market, scale, book=None):
+        """
+        Lock the funds a new order may spend, or raise InsufficientFunds. ``scale`` is the engine's,
+        whose units the order is in, and ``book`` the market's order book, used to price market
+        buys at what they would pay right now.
+        """
+        if order.id in self.orders:
+            # سفارش قبل از رسیدن به موتور هنگام load از دیتابیس خوانده شده است
+            return
+        remaining = scale.to_amount(order.remaining)
+        if order.side == Order.SELL:
+            currency_id, amount = market.base_currency_id, remaining
+        else:
+            currency_id = market.quote_currency_id
+            if order.order_type == Order.MARKET and book is not None:
+                amount = _market_buy_cost(book, order.remaining, scale)
+            else:
+                amount = _buy_hold(remaining, scale.to_price(order.price), scale.to_price(order.stop_price))
+        with self.lock:
+            account = self.account(order.user_id, currency_id)
+            if account.available < amount:
+                # شاید از آخرین خواندن واریزی داشته است
+                account.total = ledger.balance(order.user_id, currency_id)
+                if account.available < amount:
+                    raise InsufficientFunds(
+                        f"Order needs {amount} but only {account.available} is available.")
+            self._lock_order(order.id, order.user_id, currency_id, amount)
+
+    def reserve_triggered(self, order, market, scale, book):
+        """
+        Reserve what a market buy whose condition just fired would pay against ``book`` now, in
+        place of the hold taken on its stop_price, as far as the available funds reach. Returns
+        the most the buy may spend, in notional units of ``scale``.
+        """
+        cost = _market_buy_cost(book, order.remaining, scale)
+        currency_id = market.quote_currency_id
+        with self.lock:
+            hold = self.orders.get(order.id)
+            if hold is None:
+                hold = self.orders[order.id] = [order.user_id, currency_id, ZERO]
+            account = self.account(order.user_id, currency_id)
+            if account.available < cost - hold[2]:
+                account.total = ledger.balance(order.user_id, currency_id)
+            amount = min(cost, hold[2] + max(account.available, ZERO))
+            account.locked += amount - hold[2]
+            hold[2] = amount
+            self.dirty.add((order.user_id, currency_id))
+        return scale.notional(amount, ROUND_FLOOR)
+
+    def settle(self, results, market):
+        """Apply the fills of stored match results and release the holds of closed orders."""
+        base, quote = market.base_currency_id, market.quote_currency_id
+        with self.lock:
+            known = set(self.accounts)
+            for result in results:
+                for fill in result.fills:
+                    notional = (fill.price * fill.amount).quantize(AMOUNT_QUANT, rounding=ROUND_HALF_UP)
+                    for order, fee in ((fill.maker, fill.maker_fee), (fill.taker, fill.taker_fee)):
+                        if order.side == Order.BUY:
+                            spent, received = (quote, notional), (base, fill.amount - fee)
+                        else:
+                            spent, received = (base, fill.amount), (quote, notional - fee)
+                        self._spend(order.id, order.user_id, *spent, known)
+                        self._receive(order.user_id, *received, known)
+                for order in result.touched_orders():
+                    if order.status in TERMINAL:
+                        self.release_order(order.id)
+
+    def release_order(self, order_id):
+        with self.lock:
+            hold = self.orders.pop(order_id, None)
+            if hold is None:
+                return
+            user_id, currency_id, held = hold
+            account = self.account(user_id, currency_id)
+            account.locked -= held
+            self.dirty.add((user_id, currency_id))
+
+    def flush(self, force=False):
+        """
+        Copy the locked amounts that changed to their wallets, at most once per HOLDS_FLUSH_INTERVAL.
+        Changes held back are written by the next call after the interval, see ``flush_holds``.
+        """
+        now = time.monotonic()
+        if not self.dirty:
+            return 0
+        if not force and self.flushed_at is not None and now - self.flushed_at < settings.HOLDS_FLUSH_INTERVAL:
+            return 0
+        with self.lock:
+            wallets = [
+                Wallet(user_id=user_id, currency_id=currency_id, locked=self.accounts[user_id, currency_id].locked)
+                for user_id, currency_id in self.dirty
+            ]
+            self.dirty = set()
+            self.flushed_at = now
+        Wallet.objects.bulk_create(wallets, batch_size=BATCH_SIZE, update_conflicts=True,
+                                   unique_fields=('user', 'currency'), update_fields=('locked', 'updated_at'))
+        return len(wallets)
+
+    def _lock_order(self, order_id, user_id, currency_id, amount):
+        self.orders[order_id] = [user_id, currency_id, amount]
+        self.account(user_id, currency_id).locked += amount
+        self.dirty.add((user_id, currency_id))
+
+    def _spend(self, order_id, user_id, currency_id, amount, known):
+        account = self.account(user_id, currency_id)
+        if (user_id, currency_id) in known:
+            # حساب‌هایی که همین حالا از دفتر خوانده شده‌اند این معامله را از قبل دارند
+            account.total -= amount
+        hold = self.orders.get(order_id)
+        if hold is not None:
+            used = min(hold[2], amount)
+            hold[2] -= used
+            account.locked -= used
+            self.dirty.add((user_id, currency_id))
+
+    def _receive(self, user_id, currency_id, amount, known):
+        account = self.account(user_id, currency_id)
+        if (user_id, currency_id) in known:
+            account.total += amount
+
+
+def _buy_hold(amount, price, stop_price):
+    if price is not None:
+        return (amount * price).quantize(AMOUNT_QUANT, rounding=ROUND_HALF_UP)
+    # قیمت اجرای سفارش‌های مارکت شرطی معلوم نیست؛ تا فعال شدن با کمی حاشیه روی stop_price نگه داشته می‌شود
+    # و هنگام فعال شدن reserve_triggered آن را با دفتر سفارش دوباره حساب می‌کند
+    reference = stop_price or ZERO
+    return (amount * reference * (1 + Decimal(str(settings.HOLDS_MARKET_BUFFER)))).quantize(
+        AMOUNT_QUANT, rounding=ROUND_HALF_UP)
+
+
+def _market_buy_cost(book, amount, scale):
+    cost = 0
+    for level in book.iter_levels(Order.SELL):
+        taken = min(amount, level.size)
+        cost += taken * level.price
+        amount -= taken
+        if not amount:
+            break
+    return scale.to_notional(cost).quantize(AMOUNT_QUANT, rounding=ROUND_HALF_UP)
+
+
+def attach(engine, market):
+    """Have the engine of a spot market reserve funds for market buys set off by their condition."""
+    if market.market_type == Market.SPOT:
+        engine.reserve = partial(_reserve_triggered, market)
+
+
+def _reserve_triggered(market, order, engine):
+    return get_holds().reserve_triggered(order, market, engine.scale, engine.book)
+
+
+_holds = None
+_holds_lock = threading.Lock()
+
+
+def get_holds():
+    global _holds
+    if _holds is None:
+        with _holds_lock:
+            if _holds is None:
+                _holds = HoldBook.load()
+    return _holds
+
+
+def reset_holds():
+    global _holds
+    with _holds_lock:
+        _holds = None
+
+
+def flush_holds(force=False):
+    """
+    Flush the holds of this process if it has loaded them. The engine process calls it between
+    commands, so changes held back by HOLDS_FLUSH_INTERVAL reach the wallets once the interval is
+    over even when no more orders come, and with ``force`` when it closes.
+    """
+    book = _holds
+    if book is None:
+        return 0
+    return book.flush(force)
@@ -0,0 +1,158 @@
+import json
+import mmap
+import os
+import re
+import struct
+import time
+import zlib
+
+# sequence, payload length, crc32 of the payload
+HEADER = struct.Struct('<QII')
+INITIAL_CAPACITY = 16 * 1024 * 1024
+JOURNAL_NAME = re.compile(r'^journal-(\d+)\.log$')
+# the single journal file used before the journal was split into segments
+LEGACY_NAME = 'journal.log'
+
+
+class Journal:
+    """
+    Append-only, memory-mapped log of one market's engine inputs and outputs.
+
+    Records are JSON payloads behind a fixed header carrying their sequence number, length and
+    checksum. The payload is written before its header, and reading stops at the first header
+    that is empty or does not match its payload, so a torn write at the tail is simply ignored.
+    Appends only copy into the mapping; the mapping is flushed to disk every ``sync_every``
+    records or ``sync_interval`` seconds, whichever comes first. A journal is one segment of the
+    market's log: its first record gets sequence ``start + 1``.
+    """
+
+    def __init__(self, path, sync_every=100, sync_interval=0.05, capacity=INITIAL_CAPACITY, start=0):
+        self.path = path
+        self.start = start
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+        if os.fstat(self._file.fileno()).st_size < capacity:
+            self._file.truncate(capacity)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self.offset, self.sequence = self._scan()
+        self.sequence = max(self.sequence, start)
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    def append(self, record):
+        payload = json.dumps(record, separators=(',', ':')).encode()
+        end = self.offset + HEADER.size + len(payload)
+        if end + HEADER.size > len(self._map):
+            self._grow(end + HEADER.size)
+        self.sequence += 1
+        self._map[self.offset + HEADER.size:end] = payload
+        HEADER.pack_into(self._map, self.offset, self.sequence, len(payload), zlib.crc32(payload))
+        self.offset = end
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every or time.monotonic() - self._synced_at >= self.sync_interval:
+            self.sync()
+        return self.sequence
+
+    def sync(self):
+        if self._unsynced:
+            self._map.flush()
+            self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    def read(self, after=0):
+        """Yield ``(sequence, record)`` for every record with a sequence above ``after``."""
+        for sequence, start, length in self._records():
+            if sequence > after:
+                yield sequence, json.loads(self._map[start:start + length])
+
+    def close(self):
+        self.sync()
+        self._map.close()
+        self._file.close()
+
+    def _records(self):
+        return _records(self._map)
+
+    def _scan(self):
+        offset, sequence = 0, 0
+        for sequence, start, length in self._records():
+            offset = start + length
+        return offset, sequence
+
+    def _grow(self, needed):
+        self._map.flush()
+        self._map.close()
+        self._file.truncate(max(needed, 2 * os.fstat(self._file.fileno()).st_size))
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+
+def _records(data):
+    offset = 0
+    size = len(data)
+    while offset + HEADER.size <= size:
+        sequence, length, checksum = HEADER.unpack_from(data, offset)
+        start = offset + HEADER.size
+        if not sequence or start + length > size or zlib.crc32(data[start:start + length]) != checksum:
+            return
+        yield sequence, start, length
+        offset = start + length
+
+
+def journal_path(directory, start):
+    return os.path.join(directory, f'journal-{start:020d}.log')
+
+
+def list_journals(directory):
+    """``(start, path)`` of the journal segments in ``directory``, oldest first."""
+    if not os.path.isdir(directory):
+        return []
+    found = []
+    for name in os.listdir(directory):
+        match = JOURNAL_NAME.match(name)
+        if match:
+            found.append((int(match.group(1)), os.path.join(directory, name)))
+    return sorted(found)
+
+
+def open_journal(directory, start=None, **options):
+    """
+    Open the segment of ``directory``'s journal that starts after sequence ``start`` for appending,
+    or the newest segment when ``start`` is None.
+    """
+    legacy = os.path.join(directory, LEGACY_NAME)
+    if os.path.exists(legacy) and not list_journals(directory):
+        os.replace(legacy, journal_path(directory, 0))
+    if start is None:
+        segments = list_journals(directory)
+        start = segments[-1][0] if segments else 0
+    return Journal(journal_path(directory, start), start=start, **options)
+
+
+def read_journal(path, after=0):
+    """Yield ``(sequence, record)`` of one segment above ``after``, without opening it for writing."""
+    with open(path, 'rb') as file:
+        if not os.fstat(file.fileno()).st_size:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for sequence, start, length in _records(data):
+                if sequence > after:
+                    yield sequence, json.loads(data[start:start + length])
+
+
+def read_journals(directory, after=0):
+    """Yield ``(sequence, record)`` for every record above ``after``, across all segments."""
+    segments = list_journals(directory)
+    for index, (start, path) in enumerate(segments):
+        if index + 1 < len(segments) and segments[index + 1][0] <= after:
+            continue
+        yield from read_journal(path, after)
+
+
+def prune_journals(directory, sequence):
+    """Delete the segments holding nothing after ``sequence``, the oldest snapshot kept."""
+    segments = list_journals(directory)
+    for (start, path), (next_start, _) in zip(segments, segments[1:]):
+        if next_start <= sequence:
+            os.remove(path)
@@ -0,0 +1,296 @@
+import threading
+import time
+from decimal import Decimal, ROUND_HALF_UP
+from functools import partial
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from market_app.engine.fixed import from_units, to_units
+from market_app.models import FuturesPosition, Liquidation
+
+LONG = 1
+SHORT = -1
+SIDES = {FuturesPosition.LONG: LONG, FuturesPosition.SHORT: SHORT}
+COLUMNS = ('side', 'amount', 'entry_price', 'liquidation_price', 'maintenance_margin', 'unrealized_pnl')
+# ستون‌هایی که PnL از آنها حساب می‌شود int64 با هشت رقم اعشار هستند، مثل ستون‌های دیتابیس
+UNIT_COLUMNS = ('amount', 'entry_price', 'unrealized_pnl')
+PNL_PLACES = 8
+# خطای نسبی PnL حساب شده با float64؛ ردیف‌هایی که تا این حد به مرز گرد کردن نزدیک‌اند با int دقیق حساب می‌شوند
+PNL_ERROR = 1e-15
+# قیمت‌های لیکوئید شدن در float نگه داشته می‌شوند؛ نزدیک مرز، شرط با Decimal های دیتابیس دوباره چک می‌شود
+TOLERANCE = 1e-9
+FEE_QUANT = Decimal('0.00000001')
+INITIAL_CAPACITY = 1024
+BATCH_SIZE = 1000
+# ستون‌ها حداقل هر این چند ثانیه از نو خوانده می‌شوند، برای تغییرهایی که نسخه را جلو نبرده‌اند
+RELOAD_INTERVAL = 60
+
+_columns = {}
+_columns_lock = threading.Lock()
+
+
+class PositionColumns:
+    """
+    The open positions of one futures market as parallel NumPy arrays, one row per position.
+
+    Rows ``[0, size)`` are live; removing a position moves the last row into its slot, so adds and
+    removes are O(1) and the arrays never hold gaps. ``rows`` maps a position id to its row.
+    ``version`` is the market's shared positions version the columns are up to date with.
+    """
+
+    def __init__(self, market_id, capacity=INITIAL_CAPACITY, version=0):
+        self.market_id = market_id
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.size = 0
+        self.rows = {}
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.side = np.zeros(capacity, dtype=np.int8)
+        self.amount = np.zeros(capacity, dtype=np.int64)
+        self.entry_price = np.zeros(capacity, dtype=np.int64)
+        self.liquidation_price = np.zeros(capacity)
+        self.maintenance_margin = np.zeros(capacity)
+        # آخرین PnL که در دیتابیس نوشته شده
+        self.unrealized_pnl = np.zeros(capacity, dtype=np.int64)
+
+    @classmethod
+    def load(cls, market_id, version=0):
+        rows = list(FuturesPosition.objects.filter(market_id=market_id, status=FuturesPosition.OPEN).values_list(
+            'id', *COLUMNS))
+        columns = cls(market_id, max(INITIAL_CAPACITY, len(rows)), version)
+        if rows:
+            count = len(rows)
+            ids, sides, *values = zip(*rows)
+            columns.ids[:count] = ids
+            columns.side[:count] = [SIDES[side] for side in sides]
+            for name, data in zip(COLUMNS[1:], values):
+                if name in UNIT_COLUMNS:
+                    getattr(columns, name)[:count] = [_units(value) for value in data]
+                else:
+                    getattr(columns, name)[:count] = np.array(data, dtype=np.float64)
+            columns.rows = {position_id: row for row, position_id in enumerate(ids)}
+            columns.size = count
+        return columns
+
+    def __len__(self):
+        return self.size
+
+    def upsert(self, position):
+        row = self.rows.get(position.id)
+        if row is None:
+            if self.size == len(self.ids):
+                self._grow()
+            row = self.rows[position.id] = self.size
+            self.size += 1
+        self.ids[row] = position.id
+        self.side[row] = SIDES[position.side]
+        self.amount[row] = _units(position.amount)
+        self.entry_price[row] = _units(position.entry_price)
+        self.liquidation_price[row] = position.liquidation_price
+        self.maintenance_margin[row] = position.maintenance_margin
+        self.unrealized_pnl[row] = _units(position.unrealized_pnl)
+
+    def remove(self, position_id):
+        row = self.rows.pop(position_id, None)
+        if row is None:
+            return
+        last = self.size - 1
+        if row != last:
+            for array in self._arrays():
+                array[row] = array[last]
+            self.rows[int(self.ids[row])] = row
+        self.size = last
+
+    def crossed(self, mark_price):
+        """
+        Ids of the positions whose liquidation price ``mark_price`` reached: at or below it for a
+        long, at or above it for a short. ``side * (liquidation - mark) >= 0`` covers both in one pass.
+        """
+        n = self.size
+        mark = float(mark_price)
+        liquidation = self.liquidation_price[:n]
+        distance = self.side[:n] * (liquidation - mark)
+        return self.ids[:n][distance >= -TOLERANCE * np.abs(liquidation)]
+
+    def pnl_changes(self, mark_price):
+        """
+        Recompute every row's unrealized PnL at ``mark_price`` and return the ids and new values, in
+        units of PNL_PLACES, of the rows whose PnL rounded half up to PNL_PLACES moved. The new
+        values become the stored ones.
+
+        The product of price and amount at 16 places does not fit int64, so it is taken in float64;
+        the few rows whose result lies within the float error of a rounding boundary are redone
+        with exact ints, which keeps the values equal to what Decimals give.
+        """
+        n = self.size
+        divisor = 10 ** PNL_PLACES
+        difference = self.side[:n] * (_units(mark_price) - self.entry_price[:n])
+        approximate = np.abs(difference.astype(np.float64) * self.amount[:n] / divisor)
+        whole = np.floor(approximate)
+        pnl = np.copysign(whole + (approximate - whole >= 0.5), difference).astype(np.int64)
+        unsure = np.flatnonzero(np.abs(approximate - whole - 0.5) <= approximate * PNL_ERROR + PNL_ERROR)
+        half = divisor // 2
+        for row in unsure.tolist():
+            exact = int(difference[row]) * int(self.amount[row])
+            pnl[row] = (exact + half) // divisor if exact >= 0 else -((half - exact) // divisor)
+        changed = np.flatnonzero(pnl != self.unrealized_pnl[:n])
+        self.unrealized_pnl[changed] = pnl[changed]
+        return self.ids[changed], pnl[changed]
+
+    def _arrays(self):
+        return [getattr(self, name) for name in ('ids',) + COLUMNS]
+
+    def _grow(self):
+        for name in ('ids',) + COLUMNS:
+            array = getattr(self, name)
+            grown = np.zeros(len(array) * 2, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            setattr(self, name, grown)
+
+
+def _units(value):
+    return to_units(value, PNL_PLACES, ROUND_HALF_UP)
+
+
+def version_key(market_id):
+    return f'market:{market_id}:positions_version'
+
+
+def _shared_version(market_id):
+    version = cache.get(version_key(market_id))
+    if version is None:
+        cache.add(version_key(market_id), 0, None)
+        version = cache.get(version_key(market_id), 0)
+    return version
+
+
+def publish_change(market_id, applied=True):
+    """
+    Move the market's shared positions version on once the current transaction commits, so every
+    process reloads its columns. ``applied`` tells that this process's columns already hold the
+    change; they keep their rows unless another change came in meanwhile.
+    """
+    transaction.on_commit(partial(_bump_version, market_id, applied))
+
+
+def _bump_version(market_id, applied):
+    cache.add(version_key(market_id), 0, None)
+    version = cache.incr(version_key(market_id))
+    columns = _columns.get(market_id)
+    if applied and columns is not None and columns.version == version - 1:
+        columns.version = version
+
+
+def get_positions(market_id):
+    """
+    The market's columns, reloaded when another process changed its positions (the shared version
+    moved on) or RELOAD_INTERVAL passed since they were read.
+    """
+    # نسخه قبل از خواندن ردیف‌ها گرفته می‌شود تا تغییری که وسط خواندن رسید بار بعد دیده شود
+    version = _shared_version(market_id)
+    columns = _columns.get(market_id)
+    if columns is None or columns.version != version or time.monotonic() - columns.loaded_at > RELOAD_INTERVAL:
+        with _columns_lock:
+            columns = _columns[market_id] = PositionColumns.load(market_id, version)
+    return columns
+
+
+def reset_positions():
+    with _columns_lock:
+        _columns.clear()
+
+
+def sync_position(position):
+    """Keep loaded columns in step with a saved position and let the other processes know."""
+    columns = _columns.get(position.market_id)
+    if columns is not None:
+        with _columns_lock:
+            if position.status == FuturesPosition.OPEN and not position.is_deleted:
+                columns.upsert(position)
+            else:
+                columns.remove(position.id)
+    publish_change(position.market_id)
+
+
+def remove_positions(market_id, position_ids):
+    """Drop positions closed by a set-based update, which sends no post_save to sync_position."""
+    if not position_ids:
+        return
+    columns = _columns.get(market_id)
+    if columns is not None:
+        with _columns_lock:
+            for position_id in position_ids:
+                columns.remove(position_id)
+    publish_change(market_id)
+
+
+def is_crossed(position, price):
+    if position.side == FuturesPosition.LONG:
+        return price <= position.liquidation_price
+    return price >= position.liquidation_price
+
+
+def liquidate(market, position_ids, price):
+    """
+    Close the given positions at ``price`` and record their liquidations. Each candidate is locked
+    and checked again with exact decimals, so positions closed meanwhile or only crossed within
+    float tolerance are left alone. Returns the liquidated positions.
+    """
+    if not len(position_ids):
+        return []
+    with transaction.atomic():
+        candidates = FuturesPosition.objects.select_for_update().filter(
+            id__in=[int(position_id) for position_id in position_ids], status=FuturesPosition.OPEN)
+        candidates = list(candidates)
+        positions = [position for position in candidates if is_crossed(position, price)]
+        now = timezone.now()
+        liquidations = []
+        for position in positions:
+            direction = 1 if position.side == FuturesPosition.LONG else -1
+            pnl = (direction * (price - position.entry_price) * position.amount).quantize(FEE_QUANT, ROUND_HALF_UP)
+            fee = (price * position.amount * market.taker_fee).quantize(FEE_QUANT, ROUND_HALF_UP)
+            position.status = FuturesPosition.LIQUIDATED
+            position.close_price = position.mark_price = price
+            position.unrealized_pnl = 0
+            position.realized_pnl += pnl
+            position.updated_at = now
+            liquidations.append(Liquidation(position=position, price=price, amount=position.amount,
+                                            realized_pnl=pnl, fee=fee))
+        FuturesPosition.objects.bulk_update(
+            positions, ('status', 'close_price', 'mark_price', 'unrealized_pnl', 'realized_pnl', 'updated_at'))
+        Liquidation.objects.bulk_create(liquidations)
+    # آنهایی که هنوز باز هستند و با مقایسه دقیق عبور نکرده‌اند در ستون‌ها می‌مانند
+    still_open = {position.id for position in candidates if position.status == FuturesPosition.OPEN}
+    remove_positions(market.pk, [int(position_id) for position_id in position_ids
+                                 if int(position_id) not in still_open])
+    return positions
+
+
+def flush_pnl(market, mark_price):
+    """
+    Write ``mark_price`` and the new unrealized PnL to the positions whose PnL changed, in batched
+    UPDATEs. PnL is computed with exact ints, so it matches what Decimals would give.
+    """
+    columns = get_positions(market.pk)
+    with _columns_lock:
+        ids, pnl = columns.pnl_changes(mark_price)
+    now = timezone.now()
+    positions = [
+        FuturesPosition(pk=int(position_id), mark_price=mark_price, unrealized_pnl=from_units(value, PNL_PLACES),
+                        updated_at=now)
+        for position_id, value in zip(ids.tolist(), pnl.tolist())
+    ]
+    FuturesPosition.objects.bulk_update(positions, ('mark_price', 'unrealized_pnl', 'updated_at'),
+                                        batch_size=BATCH_SIZE)
+    return len(positions)
+
+
+def scan(market, mark_price):
+    """Find and liquidate the market's positions crossed by a new mark price."""
+    columns = get_positions(market.pk)
+    with _columns_lock:
+        crossed = columns.crossed(mark_price)
+    return liquidate(market, crossed, mark_price)
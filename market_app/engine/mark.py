@@ -0,0 +1,103 @@
+import math
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+
+from market_app.engine import liquidation
+
+PRICE_QUANT = Decimal('0.00000001')
+ZERO = Decimal(0)
+
+_marks = {}
+_marks_lock = threading.Lock()
+
+
+class MarkPriceEngine:
+    """
+    Mark price of one futures market: the index price plus the basis (the market's own price minus
+    the index) smoothed with an exponential moving average. The weight of a new basis sample
+    depends on the time since the previous one, so irregular updates smooth over the same
+    ``basis_seconds`` horizon.
+    """
+
+    def __init__(self, market_id, basis_seconds):
+        self.market_id = market_id
+        self.basis_seconds = basis_seconds
+        self.basis = None
+        self.index_price = None
+        self.mark_price = None
+        self.updated = None
+        self.flushed = None
+        # (market, mark price) که refresh_pnl هنوز ننوشته است
+        self.pending = None
+
+    def update(self, index_price, reference_price=None, now=None):
+        now = time.monotonic() if now is None else now
+        if reference_price is not None:
+            basis = reference_price - index_price
+            if self.basis is None:
+                self.basis = basis
+            else:
+                weight = 1 - math.exp(-max(now - self.updated, 0) / self.basis_seconds)
+                self.basis += (basis - self.basis) * Decimal(f'{weight:.12f}')
+        self.index_price = index_price
+        self.updated = now
+        self.mark_price = (index_price + (self.basis or ZERO)).quantize(PRICE_QUANT)
+        return self.mark_price
+
+    def flush_due(self, now, interval):
+        if self.flushed is not None and now - self.flushed < interval:
+            return False
+        self.flushed = now
+        return True
+
+
+def get_mark_engine(market_id):
+    engine = _marks.get(market_id)
+    if engine is None:
+        with _marks_lock:
+            engine = _marks.get(market_id)
+            if engine is None:
+                engine = _marks[market_id] = MarkPriceEngine(market_id, settings.MARK_BASIS_SECONDS)
+    return engine
+
+
+def reset_marks():
+    with _marks_lock:
+        _marks.clear()
+
+
+def refresh_pnl(market, mark_price, now=None, force=False):
+    """
+    Push a new mark price to the market's open positions, at most once per
+    MARK_PNL_FLUSH_INTERVAL seconds. Skipped marks are not lost: the last one is kept for
+    ``flush_pending_pnl``, and every flush compares against what was last written. Returns the
+    number of positions written.
+    """
+    now = time.monotonic() if now is None else now
+    engine = get_mark_engine(market.pk)
+    if not engine.flush_due(now, settings.MARK_PNL_FLUSH_INTERVAL) and not force:
+        engine.pending = (market, mark_price)
+        return 0
+    engine.pending = None
+    return liquidation.flush_pnl(market, mark_price)
+
+
+def flush_pending_pnl(now=None, force=False):
+    """
+    Write the last mark price refresh_pnl held back on each market once its interval is over, or
+    right away with ``force``, so PnL does not stay stale when the marks stop coming. Returns the
+    number of positions written.
+    """
+    now = time.monotonic() if now is None else now
+    written = 0
+    for engine in list(_marks.values()):
+        if engine.pending is None:
+            continue
+        if engine.flush_due(now, settings.MARK_PNL_FLUSH_INTERVAL) or force:
+            market, mark_price = engine.pending
+            engine.pending = None
+            written += liquidation.flush_pnl(market, mark_price)
+    return written
@@ -0,0 +1,226 @@
+from decimal import ROUND_CEILING, ROUND_FLOOR
+
+from django.utils import timezone
+
+from market_app.engine.book import OrderBook
+from market_app.engine.fixed import market_scale
+from market_app.engine.triggers import TriggerIndex
+from market_app.models import Order
+
+
+class Fill:
+    """
+    One trade between a resting and an incoming order. The engine records it in units; ``price``,
+    ``amount`` and the fees are the Decimal values stored with the trade.
+    """
+    __slots__ = ('maker', 'taker', 'price_units', 'amount_units', 'maker_fee_units', 'taker_fee_units', 'scale')
+
+    def __init__(self, maker, taker, price_units, amount_units, maker_fee_units, taker_fee_units, scale):
+        self.maker = maker
+        self.taker = taker
+        self.price_units = price_units
+        self.amount_units = amount_units
+        self.maker_fee_units = maker_fee_units
+        self.taker_fee_units = taker_fee_units
+        self.scale = scale
+
+    @property
+    def price(self):
+        return self.scale.to_price(self.price_units)
+
+    @property
+    def amount(self):
+        return self.scale.to_amount(self.amount_units)
+
+    @property
+    def maker_fee(self):
+        return self.scale.to_fee(self.maker_fee_units)
+
+    @property
+    def taker_fee(self):
+        return self.scale.to_fee(self.taker_fee_units)
+
+
+class MatchResult:
+    __slots__ = ('order', 'fills', 'rested')
+
+    def __init__(self, order):
+        self.order = order
+        self.fills = []
+        self.rested = False
+
+    def touched_orders(self):
+        """The incoming order followed by every resting order it traded against."""
+        touched = {self.order.id: self.order}
+        for fill in self.fills:
+            touched.setdefault(fill.maker.id, fill.maker)
+        return list(touched.values())
+
+
+class MatchingEngine:
+    """
+    Price-time priority matching for one market.
+
+    The engine only touches in-memory state; writing the outcome to the database is left to
+    ``market_app.engine.persistence`` so a whole match can be stored in one go. Conditional orders
+    wait in ``triggers`` until the last traded price or a mark price tick reaches their stop_price.
+    All of its arithmetic is on ints in the units of ``scale``; the Decimal fee rates are converted
+    once here. ``reserve``, when set, is called with a market buy and the engine as the buy's
+    condition fires and returns the buy's budget, so what it spends can be reserved first.
+    """
+
+    def __init__(self, market_id, maker_fee, taker_fee, scale):
+        self.market_id = market_id
+        self.scale = scale
+        self.maker_fee = scale.rate(maker_fee)
+        self.taker_fee = scale.rate(taker_fee)
+        self.book = OrderBook()
+        self.triggers = TriggerIndex()
+        self.last_price = None
+        self.reserve = None
+
+    @classmethod
+    def for_market(cls, market, scale=None):
+        return cls(market.pk, market.maker_fee, market.taker_fee, scale or market_scale(market))
+
+    def place(self, order):
+        """
+        Match an order, or park it if it is conditional, then fire the conditional orders that the
+        resulting trades set off. Returns the match results in the order they happened.
+        """
+        if order.order_type in Order.TRIGGERED_TYPES:
+            if order.stop_price is None:
+                raise ValueError("Conditional orders need a stop_price.")
+            self.triggers.add(order)
+            results = []
+        else:
+            results = [self.submit(order)]
+        if self.last_price is not None:
+            results.extend(self.on_price(self.last_price))
+        return results
+
+    def on_price(self, price, ceiling=None):
+        """
+        Fire the conditional orders crossed by ``price`` and match them as live orders. ``ceiling``
+        is the price falling triggers are checked against, when it differs from ``price``.
+        """
+        results = []
+        triggered = self.triggers.pop_crossed(price, ceiling)
+        while triggered:
+            now = timezone.now()
+            for order in triggered:
+                order.order_type = Order.TRIGGERED_TYPES[order.order_type]
+                order.triggered_at = now
+                if self.reserve is not None and order.order_type == Order.MARKET and order.side == Order.BUY:
+                    order.budget = self.reserve(order, self)
+                results.append(self.submit(order))
+            # معاملات سفارش‌های فعال شده ممکن است سفارش‌های شرطی دیگری را فعال کنند
+            triggered = self.triggers.pop_crossed(self.last_price) if self.last_price is not None else []
+        return results
+
+    def on_tick(self, price):
+        """
+        ``on_price`` for a Decimal price from outside the book, such as a mark price, which may
+        fall between two ticks: rising triggers see it rounded down and falling ones rounded up,
+        so neither fires before the price really reaches it.
+        """
+        return self.on_price(self.scale.price(price, ROUND_FLOOR), self.scale.price(price, ROUND_CEILING))
+
+    def submit(self, order):
+        if order.order_type not in (Order.MARKET, Order.LIMIT):
+            raise ValueError(f"Order type {order.order_type!r} cannot be matched directly.")
+        if order.order_type == Order.LIMIT and order.price is None:
+            raise ValueError("Limit orders need a price.")
+
+        result = MatchResult(order)
+        if order.time_in_force == Order.FOK and not self.can_fill(order):
+            order.status = Order.EXPIRED
+            return result
+        self._match(order, result)
+
+        if not order.remaining:
+            order.status = Order.FILLED
+        elif order.order_type == Order.LIMIT and order.time_in_force == Order.GTC:
+            self.book.add(order)
+            result.rested = True
+            order.status = Order.PARTIALLY_FILLED if order.filled else Order.OPEN
+        else:
+            # سفارش مارکت و IOC در دفتر نمی‌ماند، باقیمانده منقضی می‌شود
+            order.status = Order.EXPIRED
+        return result
+
+    def can_fill(self, order):
+        """Read-only walk of the opposite side: could ``order`` be filled completely right now?"""
+        opposite = Order.SELL if order.side == Order.BUY else Order.BUY
+        needed = order.remaining
+        for level in self.book.iter_levels(opposite):
+            if not self._crosses(order, level.price):
+                break
+            needed -= level.size
+            if needed <= 0:
+                return True
+        return False
+
+    def cancel(self, order_id):
+        order = self.book.remove(order_id) or self.triggers.remove(order_id)
+        if order is not None:
+            order.status = Order.CANCELLED
+        return order
+
+    def cancel_many(self, order_ids):
+        """Cancel several orders at once; returns a result without fills for each one that was live."""
+        results = []
+        for order_id in order_ids:
+            order = self.cancel(order_id)
+            if order is not None:
+                results.append(MatchResult(order))
+        return results
+
+    def user_order_ids(self, user_id, side=None):
+        """Ids of the resting and conditional orders of ``user_id``, optionally only on ``side``."""
+        orders = self.book.user_orders(user_id, side) + self.triggers.user_orders(user_id, side)
+        return [order.id for order in orders]
+
+    def _crosses(self, order, price):
+        if order.order_type == Order.MARKET:
+            return True
+        if order.side == Order.BUY:
+            return price <= order.price
+        return price >= order.price
+
+    def _match(self, order, result):
+        book = self.book
+        opposite = Order.SELL if order.side == Order.BUY else Order.BUY
+        while order.remaining:
+            level = book.best(opposite)
+            if level is None or not self._crosses(order, level.price):
+                break
+            price = level.price
+            while order.remaining and level.orders:
+                maker = level.first()
+                amount = min(order.remaining, maker.remaining)
+                if order.budget is not None:
+                    # خرید مارکت بیشتر از مبلغ رزرو شده خرج نمی‌کند و باقیمانده منقضی می‌شود
+                    amount = min(amount, (order.budget - order.notional) // price)
+                    if amount <= 0:
+                        return
+                maker_fee = self._charge(maker, price, amount,
+                                         self.maker_fee if maker.maker_rate is None else maker.maker_rate)
+                taker_fee = self._charge(order, price, amount,
+                                         self.taker_fee if order.taker_rate is None else order.taker_rate)
+                order.filled += amount
+                book.fill(maker, amount)
+                maker.status = Order.FILLED if not maker.remaining else Order.PARTIALLY_FILLED
+                result.fills.append(Fill(maker, order, price, amount, maker_fee, taker_fee, self.scale))
+                self.last_price = price
+
+    def _charge(self, order, price, amount, rate):
+        # کارمزد خریدار به ارز پایه و کارمزد فروشنده به ارز مظنه محاسبه می‌شود
+        notional = price * amount
+        if order.side == Order.BUY:
+            fee = self.scale.buy_fee(amount, rate)
+        else:
+            fee = self.scale.sell_fee(notional, rate)
+        order.notional += notional
+        order.fee += fee
+        return fee
@@ -0,0 +1,137 @@
+import logging
+from decimal import Decimal
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+
+from account_app import ledger
+from account_app.models import LedgerEntry
+from market_app import fees
+from market_app.models import Order, Trade
+from market_app.signals import trades_persisted
+
+PRICE_QUANT = Decimal('0.00000001')
+ORDER_FIELDS = ('filled_amount', 'avg_fill_price', 'fee', 'fee_currency', 'status', 'triggered_at', 'updated_at')
+BATCH_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def fee_currency_id(market, side):
+    return market.base_currency_id if side == Order.BUY else market.quote_currency_id
+
+
+def order_values(order, market, scale):
+    filled = scale.to_amount(order.filled)
+    avg_price = (scale.to_notional(order.notional) / filled).quantize(PRICE_QUANT) if order.filled else None
+    return {
+        'filled_amount': filled,
+        'avg_fill_price': avg_price,
+        'fee': scale.to_fee(order.fee),
+        'fee_currency_id': fee_currency_id(market, order.side) if order.filled else None,
+        'status': order.status,
+        'triggered_at': order.triggered_at,
+    }
+
+
+def build_trades(results, market):
+    trades = []
+    for result in results:
+        for fill in result.fills:
+            trades.append(Trade(
+                order_id=fill.maker.id,
+                price=fill.price,
+                amount=fill.amount,
+                fee=fill.maker_fee,
+                fee_currency_id=fee_currency_id(market, fill.maker.side),
+                is_maker=True,
+            ))
+            trades.append(Trade(
+                order_id=fill.taker.id,
+                price=fill.price,
+                amount=fill.amount,
+                fee=fill.taker_fee,
+                fee_currency_id=fee_currency_id(market, fill.taker.side),
+                is_maker=False,
+            ))
+    return trades
+
+
+def changed_orders(results):
+    """
+    Every order touched by the batch, once, in its final state. A new order that simply rests in
+    the book is already stored as it is and is left out.
+    """
+    orders = {}
+    for result in results:
+        order = result.order
+        if result.fills or order.status != Order.OPEN or order.triggered_at is not None:
+            orders[order.id] = order
+        for fill in result.fills:
+            orders[fill.maker.id] = fill.maker
+    return list(orders.values())
+
+
+def persist(results, market, scale):
+    """
+    Write a batch of match results: all trades, their ledger rows and the users' daily volume with
+    bulk inserts and the final state of every touched order with batched UPDATEs, in a single
+    transaction. ``scale`` is the engine's, to turn the orders' units back into Decimals. Returns
+    how many orders were written.
+    """
+    trades = build_trades(results, market)
+    orders = changed_orders(results)
+    if not orders:
+        return 0
+    now = timezone.now()
+    if not trades and len(orders) == 1:
+        # بدون معامله فقط وضعیت خود سفارش تغییر می‌کند و نیازی به تراکنش نیست
+        return Order.objects.filter(pk=orders[0].id).update(updated_at=now, **order_values(orders[0], market, scale))
+    updates = [Order(pk=order.id, updated_at=now, **order_values(order, market, scale)) for order in orders]
+    entries = ledger.trade_entries(results, market)
+    # معمولا داخل تراکنش store اجرا می‌شود و savepoint جداگانه لازم ندارد
+    with transaction.atomic(savepoint=False):
+        Trade.objects.bulk_create(trades, batch_size=BATCH_SIZE)
+        LedgerEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE)
+        Order.objects.bulk_update(updates, ORDER_FIELDS, batch_size=BATCH_SIZE)
+        if trades:
+            fees.record_volume(market, trades, results)
+            transaction.on_commit(partial(notify_trades, market, trades, results))
+    return len(orders)
+
+
+def notify_trades(market, trades, results):
+    """
+    Send trades_persisted for a committed batch. A failing receiver does not stop the others and
+    is logged with its traceback.
+    """
+    responses = trades_persisted.send_robust(sender=Trade, market=market, trades=trades, results=results)
+    for receiver, response in responses:
+        if isinstance(response, Exception):
+            logger.error("trades_persisted receiver %r failed for market %s", receiver, market.pk,
+                         exc_info=(type(response), response, response.__traceback__))
+
+
+def persist_cancel(order_id):
+    return Order.objects.filter(pk=order_id, status__in=(Order.OPEN, Order.PARTIALLY_FILLED)).update(
+        status=Order.CANCELLED, updated_at=timezone.now())
+
+
+def persist_cancel_many(order_ids):
+    """Mark a batch of cancelled orders with a single UPDATE."""
+    if not order_ids:
+        return 0
+    return Order.objects.filter(pk__in=order_ids, status__in=(Order.OPEN, Order.PARTIALLY_FILLED)).update(
+        status=Order.CANCELLED, updated_at=timezone.now())
+
+
+def persist_reject(order_id):
+    """
+    Reject an order the engine can not take. One that was already partly filled keeps its trades
+    and has its remainder cancelled instead.
+    """
+    return Order.objects.filter(pk=order_id, status__in=(Order.OPEN, Order.PARTIALLY_FILLED)).update(
+        status=Case(When(status=Order.OPEN, then=Value(Order.REJECTED)), default=Value(Order.CANCELLED)),
+        updated_at=timezone.now())
@@ -0,0 +1,176 @@
+import os
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+
+from market_app import fees, prices
+from market_app.engine import holds
+from market_app.engine.book import BookOrder
+from market_app.engine.fixed import InexactValue, market_scale
+from market_app.engine.journal import read_journals
+from market_app.engine.matching import MatchingEngine
+from market_app.engine.persistence import changed_orders, persist, persist_cancel, persist_cancel_many, persist_reject
+from market_app.engine.snapshot import list_snapshots, read_snapshot, restore_engine, write_snapshot
+from market_app.models import EngineState, Order, Market
+
+PLACE = 'place'
+CANCEL = 'cancel'
+CANCEL_MANY = 'cancel_many'
+TICK = 'tick'
+COMMIT = 'commit'
+
+
+def place_record(order):
+    return {'op': PLACE, 'order': order.to_dict()}
+
+
+def cancel_record(order_id):
+    return {'op': CANCEL, 'order_id': order_id}
+
+
+def cancel_many_record(order_ids):
+    return {'op': CANCEL_MANY, 'order_ids': list(order_ids)}
+
+
+def tick_record(price):
+    return {'op': TICK, 'price': str(price)}
+
+
+def commit_record(sequence, results):
+    """Marks input ``sequence`` as stored in the database, along with the trades it produced."""
+    return {
+        'op': COMMIT,
+        'input': sequence,
+        'fills': [
+            [fill.maker.id, fill.taker.id, str(fill.price), str(fill.amount)]
+            for result in results
+            for fill in result.fills
+        ],
+    }
+
+
+def apply_input(engine, record):
+    op = record['op']
+    if op == PLACE:
+        return engine.place(BookOrder.from_dict(record['order'], engine.scale))
+    if op == CANCEL:
+        engine.cancel(record['order_id'])
+        return []
+    if op == CANCEL_MANY:
+        return engine.cancel_many(record['order_ids'])
+    if op == TICK:
+        return engine.on_tick(Decimal(record['price']))
+    raise ValueError(f"Unknown journal operation {op!r}.")
+
+
+def store(record, results, market, scale, sequence):
+    """
+    Write the outcome of journal input ``sequence`` and, in the same transaction, record it as the
+    market's last applied input.
+    """
+    if record['op'] in (PLACE, TICK) and not changed_orders(results):
+        # سفارشی که فقط در دفتر می‌نشیند چیزی برای نوشتن ندارد
+        return
+    with transaction.atomic():
+        if record['op'] == CANCEL:
+            written = persist_cancel(record['order_id'])
+        elif record['op'] == CANCEL_MANY:
+            written = persist_cancel_many([result.order.id for result in results])
+        else:
+            written = persist(results, market, scale)
+        if written:
+            EngineState.objects.filter(pk=market.pk).update(applied_sequence=sequence)
+
+
+def load_from_database(market):
+    """
+    Build an engine from the market's pending orders. They go through ``place`` in arrival order,
+    so an order that was saved but never matched before a crash is matched now instead of
+    leaving a crossed book. Orders finer than the market's precision are rejected, and so are
+    orders of a spot market that can not reserve what they may spend. Returns the engine, the
+    results to store and the loaded order ids.
+    """
+    engine = MatchingEngine.for_market(market)
+    holds.attach(engine, market)
+    engine.last_price = engine.scale.price(prices.get_last_price(market.pk), ROUND_HALF_UP)
+    pending = Order.objects.filter(
+        market=market,
+        status__in=(Order.OPEN, Order.PARTIALLY_FILLED),
+    ).order_by('created_at', 'pk')
+    hold_book = holds.get_holds() if market.market_type == Market.SPOT else None
+    if hold_book is not None:
+        # holds rebuilt from the database were never checked against the balance; they are
+        # reserved again below, oldest order first
+        for order_id in pending.values_list('pk', flat=True):
+            hold_book.release_order(order_id)
+    results, loaded = [], set()
+    for order in pending.iterator():
+        loaded.add(order.pk)
+        try:
+            book_order = fees.apply_rates(BookOrder.from_order(order, engine.scale), market, engine.scale)
+            if hold_book is not None:
+                hold_book.reserve_order(book_order, market, engine.scale, engine.book)
+        except (InexactValue, holds.InsufficientFunds):
+            persist_reject(order.pk)
+            continue
+        results.extend(engine.place(book_order))
+    return engine, results, loaded
+
+
+def _rebuild(market, journal, directory):
+    engine, results, loaded = load_from_database(market)
+    with transaction.atomic():
+        persist(results, market, engine.scale)
+        EngineState.objects.filter(pk=market.pk).update(applied_sequence=journal.sequence)
+    if market.market_type == Market.SPOT:
+        hold_book = holds.get_holds()
+        hold_book.settle(results, market)
+        hold_book.flush()
+    write_snapshot(engine, journal.sequence, directory)
+    return engine, journal.sequence, loaded
+
+
+def recover(market, journal, directory):
+    """
+    Restore a market's engine from its latest snapshot and the journal tail after it. Inputs that
+    were journaled but never committed are stored now, unless the database already has them
+    (it crashed between storing an input and journaling the commit). Without a snapshot, when
+    the journal lost inputs the database already holds, or when the market's precision changed
+    since the snapshot, the engine is loaded from the database and a new snapshot is written.
+    Returns the engine, the sequence of the snapshot it starts from and the ids of orders picked
+    up from the database.
+    """
+    state, _ = EngineState.objects.get_or_create(market=market)
+    snapshots = list_snapshots(directory)
+    if journal.sequence < state.applied_sequence:
+        # دفترچه از آنچه دیتابیس ذخیره کرده عقب است؛ snapshotهای آن دیگر قابل اعتماد نیستند
+        for _, path in snapshots:
+            os.replace(path, path + '.stale')
+        snapshots = []
+    if not snapshots:
+        return _rebuild(market, journal, directory)
+
+    sequence, path = snapshots[-1]
+    engine = restore_engine(read_snapshot(path), market)
+    holds.attach(engine, market)
+    uncommitted = {}
+    for input_sequence, record in read_journals(directory, after=sequence):
+        if record['op'] == COMMIT:
+            uncommitted.pop(record['input'], None)
+        else:
+            uncommitted[input_sequence] = (record, apply_input(engine, record))
+    # holds are read from the database before the missing inputs are stored, and settled after
+    hold_book = holds.get_holds() if market.market_type == Market.SPOT else None
+    stored = []
+    for input_sequence, (record, results) in uncommitted.items():
+        if input_sequence > state.applied_sequence:
+            store(record, results, market, engine.scale, input_sequence)
+            stored.extend(results)
+        journal.append(commit_record(input_sequence, results))
+    if hold_book is not None and stored:
+        hold_book.settle(stored, market)
+        hold_book.flush()
+    if engine.scale != market_scale(market):
+        # دقت بازار وقتی موتور خاموش بوده عوض شده؛ دفتر با واحدهای جدید از دیتابیس ساخته می‌شود
+        return _rebuild(market, journal, directory)
+    return engine, sequence, set()
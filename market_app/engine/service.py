@@ -0,0 +1,507 @@
+import fcntl
+import os
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from market_app import fees, prices
+from market_app.engine import holds, liquidation, mark
+from market_app.engine.book import BookOrder
+from market_app.engine.fixed import InexactValue
+from market_app.engine.journal import open_journal, prune_journals
+from market_app.engine.persistence import persist_cancel_many, persist_reject
+from market_app.engine.recovery import (apply_input, store, recover, place_record, cancel_record,
+                                        cancel_many_record, tick_record, commit_record)
+from market_app.engine.snapshot import list_snapshots, snapshot_dir, write_snapshot
+from market_app.models import EngineCommand, Order, Market
+
+LOCK_NAME = 'engine.lock'
+# عمق منتشر شده برای پروسه‌های دیگر؛ بیشترین limit که endpoint عمق قبول می‌کند
+DEPTH_LEVELS = 500
+# تعداد آخرین تغییرهای عمق که همراه آن منتشر می‌شوند تا کلاینت‌های پروسه‌های دیگر هم فقط تغییرها را بگیرند
+DEPTH_DELTAS = 1000
+COMMAND_BATCH = 100
+COMMAND_POLL_INTERVAL = 0.02
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+class EngineBusy(RuntimeError):
+    """Another process already runs the market's engine."""
+
+
+class EngineUnavailable(RuntimeError):
+    """This process does not run the engines and the one that does could not be reached."""
+
+
+def _lock_directory(directory):
+    os.makedirs(directory, exist_ok=True)
+    lock_file = open(os.path.join(directory, LOCK_NAME), 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        raise EngineBusy(f"The engine in {directory} is run by another process.")
+    return lock_file
+
+
+def engine_running(market):
+    """
+    Whether a process on this host holds the market's engine open. Only meant for checks made
+    outside the engine process, such as the admin refusing precision changes.
+    """
+    path = os.path.join(snapshot_dir(settings.MATCHING_ENGINE_DIR, market.pk), LOCK_NAME)
+    if not os.path.exists(path):
+        return False
+    with open(path) as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+    return False
+
+
+class EngineHandle:
+    """
+    A market's matching engine with its journal and the lock that serializes access to both.
+    Every input goes through ``execute`` so it is journaled before it touches the book. The
+    engine's directory stays locked with ``flock`` while the handle is open, so a second process
+    can not append to the same journal. Each snapshot starts a new journal segment, and segments
+    older than the oldest snapshot kept are deleted.
+    """
+
+    def __init__(self, market, engine, journal, directory, snapshot_sequence, loaded_ids=(), lock_file=None):
+        self.market = market
+        self.engine = engine
+        self.journal = journal
+        self.directory = directory
+        self.snapshot_sequence = snapshot_sequence
+        self.loaded_ids = set(loaded_ids)
+        self.lock_file = lock_file
+        self.published_sequence = None
+        self.published_deltas = deque(maxlen=DEPTH_DELTAS)
+        self.index_published = None
+        self.closed = False
+        self.lock = threading.Lock()
+
+    @classmethod
+    def open(cls, market):
+        directory = snapshot_dir(settings.MATCHING_ENGINE_DIR, market.pk)
+        lock_file = _lock_directory(directory)
+        try:
+            journal = open_journal(directory, sync_every=settings.MATCHING_JOURNAL_SYNC_EVERY)
+            engine, snapshot_sequence, loaded_ids = recover(market, journal, directory)
+        except BaseException:
+            lock_file.close()
+            raise
+        return cls(market, engine, journal, directory, snapshot_sequence, loaded_ids, lock_file)
+
+    def execute(self, record):
+        """
+        Journal, apply and store one input. When any step fails the book may hold what the
+        database does not, so the handle is discarded and the next use recovers the engine from
+        the journal.
+        """
+        if self.closed:
+            raise EngineUnavailable(f"The engine of market {self.market.pk} was closed; try again.")
+        try:
+            sequence = self.journal.append(record)
+            results = apply_input(self.engine, record)
+            store(record, results, self.market, self.engine.scale, sequence)
+            self.journal.append(commit_record(sequence, results))
+        except BaseException:
+            _discard(self)
+            raise
+        if self.journal.sequence - self.snapshot_sequence >= settings.MATCHING_SNAPSHOT_EVERY:
+            self.snapshot()
+        return results
+
+    def snapshot(self):
+        sequence = self.journal.sequence
+        self.journal.sync()
+        write_snapshot(self.engine, sequence, self.directory)
+        self.snapshot_sequence = sequence
+        if self.journal.start != sequence:
+            self.journal.close()
+            self.journal = open_journal(self.directory, sequence, sync_every=settings.MATCHING_JOURNAL_SYNC_EVERY)
+        prune_journals(self.directory, list_snapshots(self.directory)[0][0])
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.journal.close()
+        if self.lock_file is not None:
+            self.lock_file.close()
+
+
+def _discard(handle):
+    with _engines_lock:
+        if _engines.get(handle.market.pk) is handle:
+            del _engines[handle.market.pk]
+    handle.close()
+    if handle.market.market_type == Market.SPOT:
+        # holds of the failed input may be reserved or settled already; they are rebuilt from the orders
+        holds.reset_holds()
+
+
+def is_owner():
+    """Whether this process runs the matching engines (MATCHING_ENGINE_OWNER)."""
+    return settings.MATCHING_ENGINE_OWNER
+
+
+def get_engine(market):
+    handle = _engines.get(market.pk)
+    if handle is None:
+        if not is_owner():
+            raise EngineUnavailable("This process does not run the matching engines (MATCHING_ENGINE_OWNER).")
+        with _engines_lock:
+            handle = _engines.get(market.pk)
+            if handle is None:
+                handle = _engines[market.pk] = EngineHandle.open(market)
+    return handle
+
+
+def open_engines():
+    return list(_engines.values())
+
+
+def flush_pending(force=False):
+    """
+    Write the holds and mark PnL held back by their flush intervals. The engine process calls it
+    between commands, and ``reset_engines`` with ``force`` before closing the engines.
+    """
+    holds.flush_holds(force)
+    mark.flush_pending_pnl(force=force)
+
+
+def reset_engines():
+    try:
+        flush_pending(force=True)
+    finally:
+        with _engines_lock:
+            for handle in _engines.values():
+                handle.close()
+            _engines.clear()
+
+
+def place_order(order):
+    """
+    Hand a freshly saved Order to its market's engine and store the outcome. Returns the match
+    results, including those of conditional orders set off by the new trades. An order finer than
+    the market's precision is rejected; on a spot market the order also has to reserve what it may
+    spend first, and without enough funds it is rejected and not matched. A process that does not
+    run the engine only learns the order's new status and gets no results.
+    """
+    if order.status != Order.OPEN:
+        raise ValueError(f"Only open orders can be placed, got {order.status!r}.")
+    if not is_owner():
+        send_command(order.market, EngineCommand.PLACE_ORDER, {'order_id': order.pk})
+        order.refresh_from_db(fields=('status', 'filled_amount'))
+        return []
+    handle = get_engine(order.market)
+    with handle.lock:
+        if order.pk in handle.loaded_ids:
+            # the engine was loaded after the order was saved and already handled it
+            handle.loaded_ids.discard(order.pk)
+            order.refresh_from_db(fields=('status',))
+            return []
+        scale = handle.engine.scale
+        try:
+            book_order = fees.apply_rates(BookOrder.from_order(order, scale), handle.market, scale)
+            if handle.market.market_type == Market.SPOT:
+                holds.get_holds().reserve_order(book_order, handle.market, scale, handle.engine.book)
+        except (InexactValue, holds.InsufficientFunds):
+            persist_reject(order.pk)
+            order.status = Order.REJECTED
+            return []
+        return _settle(handle, handle.execute(place_record(book_order)))
+
+
+def on_price_tick(market, price):
+    """Feed a last or mark price update to the market's conditional orders."""
+    handle = get_engine(market)
+    with handle.lock:
+        return _settle(handle, handle.execute(tick_record(price)))
+
+
+def on_mark_price(market, price):
+    """
+    Publish a market's new mark price, feed it to the conditional orders and, on a futures market,
+    liquidate the positions it crossed.
+    """
+    prices.set_mark_price(market.pk, price)
+    results = on_price_tick(market, price)
+    if market.market_type == Market.FUTURES:
+        liquidation.scan(market, price)
+        mark.refresh_pnl(market, price)
+    return results
+
+
+def on_index_price(market, index_price):
+    """
+    Turn a new index price into the market's mark price, using the middle of the book (or the last
+    trade) as the market's own price for the basis, and apply it like any mark price update.
+    """
+    handle = get_engine(market)
+    with handle.lock:
+        engine = handle.engine
+        bid, ask = engine.book.best_price(Order.BUY), engine.book.best_price(Order.SELL)
+        if bid is not None and ask is not None:
+            reference = engine.scale.to_price(bid + ask) / 2
+        else:
+            reference = engine.scale.to_price(engine.last_price)
+    price = mark.get_mark_engine(market.pk).update(index_price, reference)
+    on_mark_price(market, price)
+    return price
+
+
+def apply_index_prices(handles):
+    """
+    Feed the index prices published with ``prices.set_index_price`` since the last call to
+    ``on_index_price`` of the handles' futures markets. Returns the markets that got one.
+    """
+    futures = [handle for handle in handles if handle.market.market_type == Market.FUTURES]
+    if not futures:
+        return []
+    updates = prices.get_index_prices([handle.market.pk for handle in futures])
+    applied = []
+    for handle in futures:
+        update = updates.get(handle.market.pk)
+        if update is None or update[1] == handle.index_published:
+            continue
+        handle.index_published = update[1]
+        on_index_price(handle.market, update[0])
+        applied.append(handle.market)
+    return applied
+
+
+def cancel_order(order):
+    if not is_owner():
+        cancel_orders(order.market, [order.pk])
+        return
+    handle = get_engine(order.market)
+    with handle.lock:
+        handle.execute(cancel_record(order.pk))
+        if handle.market.market_type == Market.SPOT:
+            hold_book = holds.get_holds()
+            hold_book.release_order(order.pk)
+            hold_book.flush()
+
+
+def cancel_orders(market, order_ids):
+    """
+    Cancel the given orders of one market in a single journaled input, stored with one UPDATE.
+    Orders still live in the database but not in the book, such as ones saved while the engine
+    was down and never placed, are cancelled with one more UPDATE. Returns the ids of the orders
+    that were still live.
+    """
+    if not is_owner():
+        return send_command(market, EngineCommand.CANCEL_ORDERS, {'order_ids': list(order_ids)})
+    handle = get_engine(market)
+    with handle.lock:
+        cancelled = _cancel_many(handle, order_ids)
+        leftover = set(order_ids).difference(cancelled)
+        if leftover:
+            leftover = list(Order.objects.filter(
+                pk__in=leftover, market=market, status__in=(Order.OPEN, Order.PARTIALLY_FILLED)
+            ).values_list('pk', flat=True))
+            persist_cancel_many(leftover)
+        return cancelled + list(leftover)
+
+
+def cancel_user_orders(user_id, market=None, side=None):
+    """
+    Cancel every live order of a user on ``market``, or on every market with live orders of the
+    user when it is None, optionally only those on ``side``. Each market's orders go through one
+    journaled input and one UPDATE; a process that does not run the engines sends a single command
+    for all of them. Returns the ids of the cancelled orders.
+    """
+    if not is_owner():
+        return send_command(market, EngineCommand.CANCEL_USER_ORDERS, {'user_id': user_id, 'side': side})
+    if market is None:
+        live = Order.objects.filter(user_id=user_id, status__in=(Order.OPEN, Order.PARTIALLY_FILLED))
+        markets = Market.objects.filter(pk__in=live.values('market_id'))
+    else:
+        markets = [market]
+    cancelled = []
+    for market in markets:
+        handle = get_engine(market)
+        with handle.lock:
+            cancelled.extend(_cancel_many(handle, handle.engine.user_order_ids(user_id, side)))
+    return cancelled
+
+
+def _cancel_many(handle, order_ids):
+    if not order_ids:
+        return []
+    results = _settle(handle, handle.execute(cancel_many_record(order_ids)))
+    return [result.order.id for result in results]
+
+
+def send_command(market, action, payload):
+    """
+    Hand an EngineCommand to the engine process and wait up to MATCHING_COMMAND_TIMEOUT seconds
+    for its result. Must be called outside of a transaction, or the engine process would not see
+    the command until the caller commits.
+    """
+    if transaction.get_connection().in_atomic_block:
+        raise RuntimeError("Engine commands can not be sent inside a transaction.")
+    command = EngineCommand.objects.create(market=market, action=action, payload=payload)
+    commands = EngineCommand.objects.filter(pk=command.pk)
+    deadline = time.monotonic() + settings.MATCHING_COMMAND_TIMEOUT
+    while True:
+        status, result, error = commands.values_list('status', 'result', 'error').get()
+        if status in (EngineCommand.DONE, EngineCommand.FAILED):
+            commands.delete()
+            if status == EngineCommand.FAILED:
+                raise RuntimeError(f"The matching engine could not {command.get_action_display().lower()}: {error}")
+            return result
+        # فرمانی که هنوز شروع نشده پس گرفته می‌شود؛ فرمان در حال اجرا تا آخر صبر می‌خواهد
+        if time.monotonic() >= deadline and commands.filter(status=EngineCommand.PENDING).update(
+                status=EngineCommand.EXPIRED, updated_at=timezone.now()):
+            commands.delete()
+            engine = 'matching engine' if market is None else f'matching engine of market {market.pk}'
+            raise EngineUnavailable(f"The {engine} did not answer in time.")
+        time.sleep(COMMAND_POLL_INTERVAL)
+
+
+def _run_command(command):
+    payload = command.payload
+    if command.action == EngineCommand.PLACE_ORDER:
+        order = Order.objects.select_related('market').get(pk=payload['order_id'])
+        return [result.order.id for result in place_order(order)]
+    if command.action == EngineCommand.CANCEL_ORDERS:
+        return cancel_orders(command.market, payload['order_ids'])
+    if command.action == EngineCommand.CANCEL_USER_ORDERS:
+        return cancel_user_orders(payload['user_id'], command.market, payload.get('side'))
+    raise ValueError(f"Unknown engine command {command.action!r}.")
+
+
+def run_commands(limit=COMMAND_BATCH):
+    """
+    Carry out up to ``limit`` pending commands of other processes, oldest first. A command is
+    claimed with a conditional UPDATE, so one the sender gave up on is never run. Returns how
+    many commands ran.
+    """
+    ran = 0
+    for command in EngineCommand.objects.filter(status=EngineCommand.PENDING).select_related('market') \
+            .order_by('pk')[:limit]:
+        commands = EngineCommand.objects.filter(pk=command.pk)
+        if not commands.filter(status=EngineCommand.PENDING).update(
+                status=EngineCommand.RUNNING, updated_at=timezone.now()):
+            continue
+        try:
+            result = _run_command(command)
+        except Exception as error:
+            commands.update(status=EngineCommand.FAILED, error=f"{type(error).__name__}: {error}",
+                            updated_at=timezone.now())
+        else:
+            commands.update(status=EngineCommand.DONE, result=result, updated_at=timezone.now())
+        ran += 1
+    return ran
+
+
+def _settle(handle, results):
+    if handle.market.market_type == Market.SPOT:
+        hold_book = holds.get_holds()
+        hold_book.settle(results, handle.market)
+        hold_book.flush()
+    return results
+
+
+def _format_levels(levels, scale):
+    return [[str(scale.to_price(price)), str(scale.to_amount(size))] for price, size in levels]
+
+
+def _depth_key(market_id):
+    return f'market:{market_id}:depth'
+
+
+def _format_depth(depth, scale):
+    return {
+        'sequence': depth['sequence'],
+        'bids': _format_levels(depth[Order.BUY], scale),
+        'asks': _format_levels(depth[Order.SELL], scale),
+    }
+
+
+def _local_depth(handle, limit):
+    with handle.lock:
+        depth = handle.engine.book.depth(limit)
+    return _format_depth(depth, handle.engine.scale)
+
+
+def _format_deltas(deltas, scale):
+    return [[sequence, side, str(scale.to_price(price)), str(scale.to_amount(size))]
+            for sequence, side, price, size in deltas]
+
+
+def publish_depth(handle):
+    """
+    Put the top DEPTH_LEVELS of a book and its last DEPTH_DELTAS deltas in the shared cache for the
+    processes that do not run the engine, unless it did not change since the last time. Returns
+    whether it was published.
+    """
+    book, scale = handle.engine.book, handle.engine.scale
+    if book.sequence == handle.published_sequence:
+        return False
+    # عمق و تغییرها با هم خوانده می‌شوند تا بین آنها تغییری از قلم نیفتد
+    with handle.lock:
+        deltas = None if handle.published_sequence is None else book.deltas_since(handle.published_sequence)
+        depth = book.depth(DEPTH_LEVELS)
+    if deltas is None:
+        # تغییرهای منتشر نشده دیگر در تاریخچه دفتر نیستند؛ دنباله از اینجا از نو شروع می‌شود
+        handle.published_deltas.clear()
+    else:
+        handle.published_deltas.extend(_format_deltas(deltas, scale))
+    depth = _format_depth(depth, scale)
+    depth['deltas'] = list(handle.published_deltas)
+    cache.set(_depth_key(handle.market.pk), depth, None)
+    handle.published_sequence = depth['sequence']
+    return True
+
+
+def _published_depth(market):
+    depth = cache.get(_depth_key(market.pk))
+    if depth is None:
+        raise EngineUnavailable(f"No depth published for market {market.pk} yet.")
+    return depth
+
+
+def depth_snapshot(market, limit=20):
+    """
+    Top ``limit`` levels of the market's book, in the market's precision. Processes that do not run
+    the engine read what the engine process last published.
+    """
+    if not is_owner():
+        depth = _published_depth(market)
+        return {'sequence': depth['sequence'], 'bids': depth['bids'][:limit], 'asks': depth['asks'][:limit]}
+    return _local_depth(get_engine(market), limit)
+
+
+def depth_deltas(market, since):
+    """
+    Level changes after sequence ``since``; None means the client must reload the snapshot.
+    Processes that do not run the engine answer from the deltas published with the depth.
+    """
+    if not is_owner():
+        depth = _published_depth(market)
+        if since == depth['sequence']:
+            return []
+        published = depth.get('deltas')
+        if since > depth['sequence'] or not published or published[0][0] > since + 1:
+            return None
+        return [delta for delta in published if delta[0] > since]
+    handle = get_engine(market)
+    with handle.lock:
+        deltas = handle.engine.book.deltas_since(since)
+    if deltas is None:
+        return None
+    return _format_deltas(deltas, handle.engine.scale)
@@ -0,0 +1,82 @@
+import json
+import os
+import re
+from decimal import Decimal, ROUND_HALF_UP
+
+from market_app.engine.book import BookOrder
+from market_app.engine.fixed import get_scale
+from market_app.engine.matching import MatchingEngine
+
+SNAPSHOT_NAME = re.compile(r'^snapshot-(\d+)\.json$')
+
+
+def snapshot_dir(base_dir, market_id):
+    return os.path.join(base_dir, f'market-{market_id}')
+
+
+def list_snapshots(directory):
+    """``(sequence, path)`` of the snapshots in ``directory``, oldest first."""
+    if not os.path.isdir(directory):
+        return []
+    found = []
+    for name in os.listdir(directory):
+        match = SNAPSHOT_NAME.match(name)
+        if match:
+            found.append((int(match.group(1)), os.path.join(directory, name)))
+    return sorted(found)
+
+
+def write_snapshot(engine, sequence, directory, keep=5):
+    """
+    Store the engine state as of journal record ``sequence``. The file is written next to its
+    final name and renamed into place, so a crash never leaves a half written snapshot behind.
+    """
+    os.makedirs(directory, exist_ok=True)
+    book = engine.book
+    state = {
+        'market_id': engine.market_id,
+        'sequence': sequence,
+        'book_sequence': book.sequence,
+        # مقادیر به واحدهای این scale هستند، حتی اگر دقت بازار بعدا عوض شود
+        'scale': engine.scale.as_tuple(),
+        'last_price': engine.last_price,
+        # به ترتیب اولویت قیمت و زمان تا بازسازی دفتر همان صف‌ها را بسازد
+        'book': [
+            order.to_dict()
+            for side in book.levels
+            for level in book.iter_levels(side)
+            for order in level.orders.values()
+        ],
+        'triggers': [order.to_dict() for order in engine.triggers.orders.values()],
+    }
+    path = os.path.join(directory, f'snapshot-{sequence:020d}.json')
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(state, file, separators=(',', ':'))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    for _, old_path in list_snapshots(directory)[:-keep]:
+        os.remove(old_path)
+    return path
+
+
+def read_snapshot(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def restore_engine(state, market):
+    scale = get_scale(*state['scale']) if 'scale' in state else None
+    engine = MatchingEngine.for_market(market, scale)
+    for data in state['book']:
+        engine.book.add(BookOrder.from_dict(data, engine.scale))
+    for data in state['triggers']:
+        engine.triggers.add(BookOrder.from_dict(data, engine.scale))
+    engine.book.sequence = state['book_sequence']
+    engine.book.deltas.clear()
+    last_price = state['last_price']
+    if isinstance(last_price, str):
+        last_price = engine.scale.price(Decimal(last_price), ROUND_HALF_UP)
+    engine.last_price = last_price
+    return engine
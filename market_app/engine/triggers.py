@@ -0,0 +1,92 @@
+from heapq import heappush, heappop, heapify
+from itertools import count
+
+from market_app.engine.book import unindex_user_order
+from market_app.models import Order
+
+RISING = 'rising'
+FALLING = 'falling'
+
+
+def trigger_direction(order):
+    """
+    Stop orders fire when the price moves against the position they protect (buy stops on the way
+    up, sell stops on the way down); take-profit orders fire on the opposite move.
+    """
+    is_stop = order.order_type in (Order.STOP_LIMIT, Order.STOP_MARKET)
+    return RISING if (order.side == Order.BUY) == is_stop else FALLING
+
+
+class TriggerIndex:
+    """
+    Conditional orders of one market waiting for their stop_price, in one heap per side and
+    direction. The heap head is always the next order to fire, so a price tick only pops the
+    orders that actually crossed instead of scanning all of them. Cancelled orders are dropped
+    from ``orders`` right away and from the heaps lazily.
+    """
+
+    def __init__(self):
+        self.heaps = {
+            (side, direction): []
+            for side in (Order.BUY, Order.SELL)
+            for direction in (RISING, FALLING)
+        }
+        self.orders = {}
+        self.by_user = {}
+        self._arrival = count()
+        self._entries = 0
+
+    def __contains__(self, order_id):
+        return order_id in self.orders
+
+    def __len__(self):
+        return len(self.orders)
+
+    def add(self, order):
+        if order.stop_price is None:
+            raise ValueError(f"Order {order.id} has no stop_price.")
+        direction = trigger_direction(order)
+        key = order.stop_price if direction == RISING else -order.stop_price
+        heappush(self.heaps[(order.side, direction)], (key, next(self._arrival), order))
+        self.orders[order.id] = order
+        self.by_user.setdefault(order.user_id, {})[order.id] = order
+        self._entries += 1
+
+    def remove(self, order_id):
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return None
+        unindex_user_order(self.by_user, order)
+        if self._entries > 2 * len(self.orders) + 64:
+            self._compact()
+        return order
+
+    def user_orders(self, user_id, side=None):
+        """Waiting orders of ``user_id``, oldest first, optionally only those on ``side``."""
+        orders = self.by_user.get(user_id, {}).values()
+        return [order for order in orders if side is None or order.side == side]
+
+    def pop_crossed(self, price, ceiling=None):
+        """
+        Take out every order whose stop_price was reached by ``price``, oldest first. Falling
+        triggers are checked against ``ceiling`` instead when it is given.
+        """
+        crossed = []
+        falling = -(price if ceiling is None else ceiling)
+        for (side, direction), heap in self.heaps.items():
+            limit = price if direction == RISING else falling
+            while heap and heap[0][0] <= limit:
+                _, arrival, order = heappop(heap)
+                self._entries -= 1
+                if self.orders.get(order.id) is order:
+                    del self.orders[order.id]
+                    unindex_user_order(self.by_user, order)
+                    crossed.append((arrival, order))
+        crossed.sort(key=lambda entry: entry[0])
+        return [order for _, order in crossed]
+
+    def _compact(self):
+        for heap in self.heaps.values():
+            heap[:] = [entry for entry in heap if self.orders.get(entry[2].id) is entry[2]]
+            heapify(heap)
+        self._entries = len(self.orders)
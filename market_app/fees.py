@@ -0,0 +1,123 @@
+import threading
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from functools import partial
+
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from market_app import registry
+from market_app.models import FeeTier, UserDailyVolume
+
+WINDOW_DAYS = 30
+VOLUME_QUANT = Decimal('0.00000001')
+
+UPSERT_VOLUME = f"""
+INSERT INTO {UserDailyVolume._meta.db_table} (user_id, day, quote_volume, trade_count)
+VALUES (%s, %s, %s, %s)
+ON CONFLICT (user_id, day) DO UPDATE SET
+    quote_volume = {UserDailyVolume._meta.db_table}.quote_volume + excluded.quote_volume,
+    trade_count = {UserDailyVolume._meta.db_table}.trade_count + excluded.trade_count
+"""
+
+_tiers = None
+# user_id -> (tier or None, day the tier was resolved on)
+_user_tiers = {}
+_lock = threading.Lock()
+
+
+def get_tiers():
+    """Fee tiers from the highest volume threshold down."""
+    global _tiers
+    if _tiers is None:
+        with _lock:
+            if _tiers is None:
+                _tiers = list(FeeTier.objects.order_by('-min_volume'))
+    return _tiers
+
+
+def reset_tiers():
+    global _tiers
+    with _lock:
+        _tiers = None
+        _user_tiers.clear()
+
+
+def tier_for(volume):
+    for tier in get_tiers():
+        if volume >= tier.min_volume:
+            return tier
+    return None
+
+
+def _window_start(today):
+    return today - timedelta(days=WINDOW_DAYS - 1)
+
+
+def resolve(user_ids, today=None):
+    """Recompute the tiers of ``user_ids`` from their last 30 daily rollup rows, in one query."""
+    today = today or timezone.now().date()
+    volumes = dict(UserDailyVolume.objects.filter(
+        user_id__in=user_ids, day__gte=_window_start(today),
+    ).values('user_id').annotate(total=Sum('quote_volume')).values_list('user_id', 'total'))
+    _user_tiers.update({user_id: (tier_for(volumes.get(user_id) or 0), today) for user_id in user_ids})
+
+
+def get_user_tier(user_id):
+    """
+    The user's tier, from memory. It is resolved again once a day, when the oldest day leaves
+    the 30-day window, and whenever new trades of the user are rolled up.
+    """
+    entry = _user_tiers.get(user_id)
+    today = timezone.now().date()
+    if entry is None or entry[1] != today:
+        resolve([user_id], today)
+        entry = _user_tiers[user_id]
+    return entry[0]
+
+
+def user_rates(user_id, market):
+    """Maker and taker fee rates of a user on a market: their tier's, or the market's flat rates."""
+    tier = get_user_tier(user_id)
+    if tier is None:
+        return market.maker_fee, market.taker_fee
+    return tier.maker_fee, tier.taker_fee
+
+
+def apply_rates(order, market, scale):
+    maker_rate, taker_rate = user_rates(order.user_id, market)
+    order.maker_rate, order.taker_rate = scale.rate(maker_rate), scale.rate(taker_rate)
+    return order
+
+
+def record_volume(market, trades, results):
+    """
+    Add the quote volume of a batch to both sides' rollup rows of the day and resolve their tiers
+    again once it commits. Called in the transaction that stores the trades, so the volume is
+    counted exactly when they are. Only markets quoted in a stable coin count, so thresholds are
+    in dollars.
+    """
+    quote = registry.get_currency(market.quote_currency_id) or market.quote_currency
+    if not quote.is_stable_coin:
+        return
+    # حجم‌ها به واحد notional موتور جمع می‌شوند و فقط یک بار به Decimal برمی‌گردند
+    volumes = defaultdict(lambda: [0, 0])
+    scale = None
+    for result in results:
+        for fill in result.fills:
+            scale = fill.scale
+            notional = fill.price_units * fill.amount_units
+            for user_id in (fill.maker.user_id, fill.taker.user_id):
+                volumes[user_id][0] += notional
+                volumes[user_id][1] += 1
+    if not volumes:
+        return
+    day = trades[0].created_at.date()
+    with connection.cursor() as cursor:
+        cursor.executemany(UPSERT_VOLUME, [
+            (user_id, day, scale.to_notional(notional).quantize(VOLUME_QUANT), count)
+            for user_id, (notional, count) in volumes.items()
+        ])
+    transaction.on_commit(partial(resolve, list(volumes)))
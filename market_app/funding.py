@@ -0,0 +1,109 @@
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from account_app.models import LedgerEntry
+from market_app.engine import liquidation
+from market_app.models import FuturesPosition, FundingRate, FundingPayment
+
+CHUNK_SIZE = 50000
+
+# یک ردیف پرداخت برای هر پوزیشن باز در این بازه از id؛ لانگ‌ها با نرخ مثبت پرداخت می‌کنند و شورت‌ها دریافت
+INSERT_PAYMENTS = f"""
+INSERT INTO {FundingPayment._meta.db_table}
+    (created_at, position_id, funding_rate_id, user_id, currency_id, rate, mark_price, amount)
+SELECT %s, p.id, %s, p.user_id, %s, %s, p.mark_price,
+       ROUND(CASE WHEN p.side = %s THEN 1 ELSE -1 END * p.amount * p.mark_price * %s, 8)
+FROM {FuturesPosition._meta.db_table} p
+WHERE p.market_id = %s AND p.status = %s AND p.is_deleted = %s
+  AND p.id > %s AND p.id <= %s AND p.created_at <= %s
+  AND (p.last_funding_time IS NULL OR p.last_funding_time < %s)
+  AND NOT EXISTS (
+      SELECT 1 FROM {FundingPayment._meta.db_table} f WHERE f.position_id = p.id AND f.funding_rate_id = %s
+  )
+"""
+
+# هر پرداخت دو ردیف در دفتر دارد: از مارجین صاحب پوزیشن به صندوق funding (یا برعکس برای مقدار منفی)
+INSERT_LEDGER = f"""
+INSERT INTO {LedgerEntry._meta.db_table} (created_at, reference, kind, account, user_id, currency_id, amount)
+SELECT %s, %s || f.id, %s, %s, f.user_id, f.currency_id, -f.amount
+FROM {FundingPayment._meta.db_table} f
+WHERE f.funding_rate_id = %s AND f.position_id > %s AND f.position_id <= %s AND f.created_at = %s
+UNION ALL
+SELECT %s, %s || f.id, %s, %s, NULL, f.currency_id, f.amount
+FROM {FundingPayment._meta.db_table} f
+WHERE f.funding_rate_id = %s AND f.position_id > %s AND f.position_id <= %s AND f.created_at = %s
+"""
+
+
+def due_rates(now=None):
+    """Funding rates whose time has come and that were not fully settled yet, oldest first."""
+    return FundingRate.objects.filter(
+        next_funding_time__lte=now or timezone.now(), settled_at__isnull=True,
+    ).select_related('market').order_by('next_funding_time', 'pk')
+
+
+def chunk_bounds(funding_rate, chunk_size=CHUNK_SIZE):
+    """
+    ``(lower, upper]`` id ranges covering the market's open positions, ``chunk_size`` ids each.
+    Only one id per chunk is read, from the primary key index.
+    """
+    positions = FuturesPosition.objects.filter(market_id=funding_rate.market_id, status=FuturesPosition.OPEN)
+    lower = 0
+    while True:
+        upper = positions.filter(pk__gt=lower).order_by('pk').values_list('pk', flat=True)[chunk_size - 1:chunk_size]
+        upper = next(iter(upper), None)
+        if upper is None:
+            last = positions.order_by('-pk').values_list('pk', flat=True).first()
+            if last is not None and last > lower:
+                yield lower, last
+            return
+        yield lower, upper
+        lower = upper
+
+
+def settle_chunk(funding_rate, lower, upper):
+    """
+    Charge one id range of positions in a single transaction: insert their payments and the
+    matching ledger rows with INSERT ... SELECT and move their margin with one UPDATE that reads
+    the amounts back. A range already settled finds nothing to do, so a run cut short can simply
+    be started again.
+    """
+    market = funding_rate.market
+    funding_time = funding_rate.next_funding_time
+    now = timezone.now()
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(INSERT_PAYMENTS, [
+                now, funding_rate.pk, market.quote_currency_id, funding_rate.rate, FuturesPosition.LONG,
+                funding_rate.rate, market.pk, FuturesPosition.OPEN, False, lower, upper, funding_time,
+                funding_time, funding_rate.pk,
+            ])
+            reference = f'{LedgerEntry.FUNDING_PAYMENT}:'
+            cursor.execute(INSERT_LEDGER, [
+                now, reference, LedgerEntry.FUNDING_PAYMENT, LedgerEntry.MARGIN, funding_rate.pk, lower, upper, now,
+                now, reference, LedgerEntry.FUNDING_PAYMENT, LedgerEntry.FUNDING, funding_rate.pk, lower, upper, now,
+            ])
+        payment = FundingPayment.objects.filter(funding_rate=funding_rate, position=OuterRef('pk')).values('amount')
+        return FuturesPosition.objects.filter(
+            Q(last_funding_time__isnull=True) | Q(last_funding_time__lt=funding_time),
+            pk__in=FundingPayment.objects.filter(
+                funding_rate=funding_rate, position__gt=lower, position__lte=upper).values('position'),
+        ).update(
+            margin=F('margin') - Subquery(payment[:1]),
+            funding_rate=funding_rate.rate,
+            last_funding_time=funding_time,
+            updated_at=now,
+        )
+
+
+def settle(funding_rate, chunk_size=CHUNK_SIZE):
+    """Apply a funding rate to every open position of its market; returns the positions charged."""
+    settled = 0
+    for lower, upper in chunk_bounds(funding_rate, chunk_size):
+        settled += settle_chunk(funding_rate, lower, upper)
+    # حاشیه پوزیشن‌ها با UPDATE عوض شده است؛ ستون‌های لیکوئید شدن در همه پروسه‌ها از نو خوانده می‌شوند
+    liquidation.publish_change(funding_rate.market_id, applied=False)
+    funding_rate.settled_at = timezone.now()
+    funding_rate.save(update_fields=('settled_at', 'updated_at'))
+    return settled
@@ -0,0 +1,28 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from market_app import archive
+
+
+class Command(BaseCommand):
+    help = ("Move filled, cancelled and expired orders, and their trades, that have not changed for --days "
+            "days into the compressed archive files under ARCHIVE_DIR and delete them from the database. "
+            "Safe to run again after an interruption.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ARCHIVE_AFTER_DAYS,
+                            help="Archive orders last updated more than this many days ago")
+        parser.add_argument('--market', type=int, default=None, help="Only archive this market")
+        parser.add_argument('--batch-size', type=int, default=archive.BATCH_SIZE, help="Rows per query and delete")
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['days'])
+        started = time.perf_counter()
+        orders, trades = archive.archive_closed_orders(before, options['market'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {orders} orders and {trades} trades closed before {before:%Y-%m-%d %H:%M} "
+            f"in {time.perf_counter() - started:.2f}s"))
@@ -0,0 +1,89 @@
+import json
+import tempfile
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from account_app import ledger
+from account_app.models import User
+from benchmarks.fixed_point import run_arithmetic
+from benchmarks.flow import OrderFlow
+from benchmarks.matching import run_engine, run_database, measure_retained
+from benchmarks.soft_delete import run_plans
+from market_app.engine import service
+from market_app.models import Currency, Market
+
+
+class Command(BaseCommand):
+    help = ("Benchmark order matching with seeded synthetic order flow. Run it with "
+            "DJANGO_SETTINGS_MODULE=currency.envs.benchmark and BENCH_DATABASE=sqlite (in memory) or postgres.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=20000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--cancel-ratio', type=float, default=0.3)
+        parser.add_argument('--burstiness', type=float, default=0.3)
+        parser.add_argument('--price-spread', type=int, default=50, help="Spread of limit prices around mid, in ticks")
+        parser.add_argument('--engine-only', action='store_true', help="Skip the database run")
+        parser.add_argument('--arithmetic', action='store_true',
+                            help="Also compare the engine's fixed-point fee and PnL math with Decimal")
+        parser.add_argument('--plans', type=int, default=0, metavar='ROWS',
+                            help="Also compare the plans of the hot order and trade queries under the nullable and "
+                                 "the NOT NULL soft-delete predicate, on ROWS generated orders")
+        parser.add_argument('--json', action='store_true', help="Print the reports as JSON")
+
+    def flow(self, options):
+        return OrderFlow(
+            events=options['events'], seed=options['seed'], users=options['users'],
+            cancel_ratio=options['cancel_ratio'], burstiness=options['burstiness'],
+            price_spread=options['price_spread'],
+        )
+
+    def handle(self, *args, **options):
+        # ژورنال و snapshot موتورها فقط در طول همین اجرا لازم‌اند
+        with tempfile.TemporaryDirectory(prefix='matching-bench-') as directory, \
+                override_settings(MATCHING_ENGINE_DIR=directory):
+            try:
+                reports = self.run(options)
+            finally:
+                service.reset_engines()
+
+        if options['json']:
+            self.stdout.write(json.dumps([report.as_dict() for report in reports], indent=2))
+        else:
+            for report in reports:
+                self.stdout.write(str(report))
+
+    def run(self, options):
+        reports = []
+        engine_report = run_engine(self.flow(options))
+        engine_report.retained_blocks_per_order, engine_report.retained_bytes_per_order = \
+            measure_retained(self.flow(options))
+        reports.append(engine_report)
+        if options['arithmetic']:
+            reports.extend(run_arithmetic(self.flow(options)))
+
+        if not options['engine_only']:
+            call_command('migrate', verbosity=0)
+            market, users = self.setup_market(options['users'])
+            reports.append(run_database(self.flow(options), market, users))
+            if options['plans']:
+                reports.extend(run_plans(market, users, options['plans']))
+        return reports
+
+    def setup_market(self, user_count):
+        base, _ = Currency.objects.get_or_create(symbol='BENCH', defaults={'name': 'Benchmark coin'})
+        quote, _ = Currency.objects.get_or_create(symbol='BUSD', defaults={'name': 'Benchmark dollar'})
+        market = Market.objects.create(base_currency=base, quote_currency=quote, min_order_amount=Decimal('0.0001'))
+        users = [
+            User.objects.create(username=f'bench-{market.pk}-{index}', phone=f'bench-{market.pk}-{index}')
+            for index in range(user_count)
+        ]
+        # بدون موجودی سفارش‌ها در رزرو موجودی رد می‌شوند
+        for user in users:
+            ledger.deposit(user, base, Decimal(10 ** 9))
+            ledger.deposit(user, quote, Decimal(10 ** 12))
+        return market, users
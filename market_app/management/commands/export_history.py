@@ -0,0 +1,32 @@
+import csv
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand
+
+from market_app import archive
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=dt_timezone.utc)
+
+
+class Command(BaseCommand):
+    help = "Write a user's orders or trades as CSV, from the database and the archive alike."
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', type=int)
+        parser.add_argument('--trades', action='store_true', help="Export trades instead of orders")
+        parser.add_argument('--start', type=parse_date, default=None, metavar='YYYY-MM-DD')
+        parser.add_argument('--end', type=parse_date, default=None, metavar='YYYY-MM-DD',
+                            help="First day not included")
+        parser.add_argument('--market', type=int, default=None)
+
+    def handle(self, *args, **options):
+        history = archive.trade_history if options['trades'] else archive.order_history
+        columns = archive.TRADE_COLUMNS if options['trades'] else archive.ORDER_COLUMNS
+        rows = history(options['user'], options['start'], options['end'], options['market'])
+        writer = csv.writer(self.stdout, lineterminator='\n')
+        fields = ['market_id'] + [name for name, _ in columns if name != 'is_deleted']
+        writer.writerow(fields)
+        for row in rows:
+            writer.writerow(['' if row[field] is None else row[field] for field in fields])
@@ -0,0 +1,46 @@
+import sys
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+
+from market_app import prices, registry
+from market_app.models import Market
+
+
+class Command(BaseCommand):
+    help = ("Publish index prices of futures markets for run_matching_engine, which turns them into mark "
+            "prices, liquidates the positions they cross and refreshes their PnL. Prices are given as "
+            "MARKET_ID=PRICE arguments or, without arguments, read one per line from stdin so an index "
+            "feed can be piped in.")
+    stealth_options = ('stdin',)
+
+    def add_arguments(self, parser):
+        parser.add_argument('prices', nargs='*', metavar='MARKET_ID=PRICE')
+
+    def handle(self, *args, **options):
+        if options['prices']:
+            for entry in options['prices']:
+                prices.set_index_price(*self.parse(entry))
+            return
+        for line in options.get('stdin', sys.stdin):
+            line = line.strip()
+            if not line:
+                continue
+            # یک خط خراب نباید فید را متوقف کند
+            try:
+                prices.set_index_price(*self.parse(line))
+            except CommandError as error:
+                self.stderr.write(str(error))
+
+    def parse(self, entry):
+        market_id, _, price = entry.partition('=')
+        try:
+            market_id, price = int(market_id), Decimal(price)
+        except (ValueError, InvalidOperation):
+            raise CommandError(f"Expected MARKET_ID=PRICE, got {entry!r}.")
+        if not price.is_finite() or price <= 0:
+            raise CommandError(f"Index price of market {market_id} must be positive, got {price}.")
+        market = registry.get_market(market_id)
+        if market is None or market.market_type != Market.FUTURES:
+            raise CommandError(f"Market {market_id} is not an active futures market.")
+        return market.pk, price
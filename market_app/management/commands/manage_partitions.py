@@ -0,0 +1,48 @@
+import argparse
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from market_app import partitions
+from market_app.models import Order, Trade
+
+PARTITIONED_MODELS = (Order, Trade)
+
+
+def parse_month(value):
+    try:
+        return datetime.strptime(value, '%Y-%m').replace(tzinfo=dt_timezone.utc)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a month as YYYY-MM, got {value!r}")
+
+
+class Command(BaseCommand):
+    help = ("Create the monthly partitions of the order and trade tables ahead of time and detach old "
+            "ones. Run it daily; inserts fail for a month that has no partition yet. PostgreSQL only.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=partitions.MONTHS_AHEAD,
+                            help="Months after the current one that must have a partition")
+        parser.add_argument('--detach-before', type=parse_month, default=None, metavar='YYYY-MM',
+                            help="Detach the partitions that only hold rows created before this month")
+        parser.add_argument('--list', action='store_true', help="Only list the partitions")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING("Partitioning is only used on PostgreSQL, nothing to do."))
+            return
+        for model in PARTITIONED_MODELS:
+            table = model._meta.db_table
+            if not partitions.is_partitioned(model):
+                self.stdout.write(self.style.WARNING(f"{table} is not partitioned, run the migrations first."))
+                continue
+            if not options['list']:
+                with transaction.atomic():
+                    for name in partitions.create_partitions(model, options['ahead']):
+                        self.stdout.write(self.style.SUCCESS(f"{table}: created {name}"))
+                    if options['detach_before'] is not None:
+                        for name in partitions.detach_partitions(model, options['detach_before']):
+                            self.stdout.write(self.style.SUCCESS(f"{table}: detached {name}"))
+            for name, upper in partitions.list_partitions(model):
+                self.stdout.write(f"{table}: {name} up to {upper:%Y-%m-%d}" if upper else f"{table}: {name}")
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from market_app import candles, ticker
+from market_app.models import Market
+
+
+class Command(BaseCommand):
+    help = "Close candles whose period is over and move the 24h tickers of quiet markets forward (run every minute)"
+
+    def handle(self, *args, **options):
+        market_ids = list(Market.objects.filter(is_active=True).values_list('pk', flat=True))
+        now = time.time()
+        for market_id in market_ids:
+            candles.close_stale(market_id, now)
+            ticker.refresh(market_id, now)
+        self.stdout.write(self.style.SUCCESS(f"Refreshed {len(market_ids)} markets."))
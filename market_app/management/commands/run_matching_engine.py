@@ -0,0 +1,51 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from market_app import registry
+from market_app.engine import service
+
+
+class Command(BaseCommand):
+    help = ("Run the matching engines of the active markets: carry out the engine commands other processes "
+            "send, publish each book's depth for them and turn the index prices feed_index_prices publishes "
+            "into mark prices. Only one process may run a market's engine; a second one stops with an error.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--market', type=int, action='append', dest='markets',
+                            help="Only run this market's engine (repeatable)")
+        parser.add_argument('--poll-interval', type=float, default=0.01,
+                            help="Seconds to sleep when there is no command to run")
+        parser.add_argument('--index-interval', type=float, default=0.5,
+                            help="Seconds between reads of the published index prices")
+
+    def handle(self, *args, **options):
+        if not settings.MATCHING_ENGINE_OWNER:
+            raise CommandError("Set MATCHING_ENGINE_OWNER for the process that runs the matching engines.")
+        market_ids = options['markets'] or registry.active_market_ids()
+        markets = [registry.get_market(market_id) for market_id in market_ids]
+        if None in markets:
+            raise CommandError("Only active markets can be run.")
+        try:
+            handles = [service.get_engine(market) for market in markets]
+        except service.EngineBusy as error:
+            service.reset_engines()
+            raise CommandError(str(error))
+        self.stdout.write(f"Running {len(handles)} matching engines.")
+        index_due = 0
+        try:
+            while True:
+                ran = service.run_commands()
+                if time.monotonic() >= index_due:
+                    service.apply_index_prices(handles)
+                    index_due = time.monotonic() + options['index_interval']
+                for handle in handles:
+                    service.publish_depth(handle)
+                service.flush_pending()
+                if not ran:
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            service.reset_engines()
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from market_app import funding
+
+
+class Command(BaseCommand):
+    help = ("Settle every funding rate whose next_funding_time has passed. Safe to run again after an "
+            "interruption: positions already charged for a rate are skipped.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=funding.CHUNK_SIZE,
+                            help="Positions per transaction")
+        parser.add_argument('--market', type=int, default=None, help="Only settle this market")
+
+    def handle(self, *args, **options):
+        rates = funding.due_rates()
+        if options['market'] is not None:
+            rates = rates.filter(market_id=options['market'])
+        for funding_rate in rates:
+            started = time.perf_counter()
+            settled = funding.settle(funding_rate, options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f"{funding_rate.market}: rate {funding_rate.rate} at {funding_rate.next_funding_time:%Y-%m-%d %H:%M} "
+                f"charged to {settled} positions in {time.perf_counter() - started:.2f}s"))
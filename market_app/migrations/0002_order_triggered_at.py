@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 04:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='triggered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 04:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market_app', '0002_order_triggered_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='time_in_force',
+            field=models.CharField(choices=[('GTC', 'Good Till Cancel'), ('IOC', 'Immediate Or Cancel'), ('FOK', 'Fill Or Kill')], default='GTC', max_length=10),
+        ),
+    ]
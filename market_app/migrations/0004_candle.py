@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-18 04:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market_app', '0003_order_time_in_force_choices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Candle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.CharField(choices=[('1m', '1 Minute'), ('5m', '5 Minutes'), ('15m', '15 Minutes'), ('1h', '1 Hour'), ('4h', '4 Hours'), ('1d', '1 Day')], max_length=3)),
+                ('open_time', models.DateTimeField()),
+                ('open', models.DecimalField(decimal_places=8, max_digits=30)),
+                ('high', models.DecimalField(decimal_places=8, max_digits=30)),
+                ('low', models.DecimalField(decimal_places=8, max_digits=30)),
+                ('close', models.DecimalField(decimal_places=8, max_digits=30)),
+                ('volume', models.DecimalField(decimal_places=8, max_digits=30)),
+                ('quote_volume', models.DecimalField(decimal_places=8, max_digits=30)),
+                ('trade_count', models.PositiveIntegerField(default=0)),
+                ('market', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='candles', to='market_app.market')),
+            ],
+            options={
+                'db_table': 'candle',
+                'unique_together': {('market', 'interval', 'open_time')},
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-18 04:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market_app', '0004_candle'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fundingrate',
+            name='settled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='FundingPayment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('rate', models.DecimalField(decimal_places=8, max_digits=10)),
+                ('mark_price', models.DecimalField(decimal_places=8, max_digits=30)),
+                ('amount', models.DecimalField(decimal_places=8, max_digits=30)),
+                ('currency', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='funding_payments', to='market_app.currency')),
+                ('funding_rate', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='payments', to='market_app.fundingrate')),
+                ('position', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='funding_payments', to='market_app.futuresposition')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='user_funding_payments', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'funding_payment',
+                'unique_together': {('position', 'funding_rate')},
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2 on 2026-10-18 04:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market_app', '0005_funding_payment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeeTier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('deleted_at', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('is_deleted', models.BooleanField(blank=True, editable=False, null=True)),
+                ('level', models.PositiveSmallIntegerField(unique=True)),
+                ('name', models.CharField(max_length=50)),
+                ('min_volume', models.DecimalField(decimal_places=8, max_digits=30)),
+                ('maker_fee', models.DecimalField(decimal_places=4, max_digits=5)),
+                ('taker_fee', models.DecimalField(decimal_places=4, max_digits=5)),
+            ],
+            options={
+                'db_table': 'fee_tier',
+                'ordering': ('level',),
+            },
+        ),
+        migrations.CreateModel(
+            name='UserDailyVolume',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('quote_volume', models.DecimalField(decimal_places=8, default=0, max_digits=30)),
+                ('trade_count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='daily_volumes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'user_daily_volume',
+                'unique_together': {('user', 'day')},
+            },
+        ),
+    ]
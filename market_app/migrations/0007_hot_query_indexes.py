@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-18 04:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from core_app.migration_helpers import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # ایندکس‌ها روی PostgreSQL به‌صورت CONCURRENTLY ساخته می‌شوند که داخل تراکنش ممکن نیست
+    atomic = False
+
+    dependencies = [
+        ('market_app', '0006_fee_tiers'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='trade',
+            index=models.Index(fields=['order', 'created_at'], name='trade_order_created_idx'),
+        ),
+        migrations.AlterField(
+            model_name='trade',
+            name='order',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='trades', to='market_app.order'),
+        ),
+        AddIndexConcurrently(
+            model_name='futuresposition',
+            index=models.Index(condition=models.Q(('status', 'open')), fields=['market', 'liquidation_price'], name='position_open_liq_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status__in', ('open', 'partially_filled'))), fields=['market', 'side', 'price'], name='order_live_book_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status__in', ('open', 'partially_filled'))), fields=['user', 'market', 'side'], name='order_live_user_idx'),
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 5.2 on 2026-10-18 04:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+from core_app.migration_helpers import AddIndexConcurrently, RemoveIndexConcurrently, backfill_is_deleted
+
+
+class Migration(migrations.Migration):
+    # تکه‌های backfill هر کدام جدا commit می‌شوند و ایندکس‌ها CONCURRENTLY از نو ساخته می‌شوند
+    atomic = False
+
+    dependencies = [
+        ('market_app', '0007_hot_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        backfill_is_deleted(
+            'market_app', 'currency', 'feetier', 'fundingrate', 'futuresposition', 'liquidation', 'market', 'order',
+            'trade',
+        ),
+        migrations.AlterField(
+            model_name='currency',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='feetier',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='fundingrate',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='futuresposition',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='liquidation',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='market',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='trade',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        RemoveIndexConcurrently(
+            model_name='futuresposition',
+            name='position_open_liq_idx',
+        ),
+        AddIndexConcurrently(
+            model_name='futuresposition',
+            index=models.Index(condition=models.Q(('is_deleted', False), ('status', 'open')), fields=['market', 'liquidation_price'], name='position_open_liq_idx'),
+        ),
+        RemoveIndexConcurrently(
+            model_name='order',
+            name='order_live_book_idx',
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_deleted', False), ('status__in', ('open', 'partially_filled'))), fields=['market', 'side', 'price'], name='order_live_book_idx'),
+        ),
+        RemoveIndexConcurrently(
+            model_name='order',
+            name='order_live_user_idx',
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_deleted', False), ('status__in', ('open', 'partially_filled'))), fields=['user', 'market', 'side'], name='order_live_user_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 05:02
+
+from django.db import migrations
+
+from market_app.partitions import partition_table
+
+
+def partition_order_and_trade(apps, schema_editor):
+    # روی پایگاه‌داده‌های غیر از PostgreSQL کاری انجام نمی‌شود؛ قید کلید خارجی trade به order همین‌جا برداشته می‌شود
+    for model_name in ('order', 'trade'):
+        partition_table(apps.get_model('market_app', model_name), schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+    # هر جدول در چند مرحله جدا commit می‌شود تا قفل ACCESS EXCLUSIVE کوتاه بماند:
+    # - افزودن قید بازه با NOT VALID: قفل لحظه‌ای
+    # - VALIDATE CONSTRAINT: یک اسکن کامل با قفل SHARE UPDATE EXCLUSIVE، خواندن و نوشتن ادامه دارد
+    # - تغییر نام، ساخت جدول والد و attach در یک تراکنش: قفل ACCESS EXCLUSIVE بدون اسکن جدول؛
+    #   ایندکس‌های جدول قدیمی هنگام attach به ایندکس‌های والد وصل می‌شوند و دوباره ساخته نمی‌شوند
+    atomic = False
+
+    dependencies = [
+        ('market_app', '0008_is_deleted_not_null'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_order_and_trade),
+    ]
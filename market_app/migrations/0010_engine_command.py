@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-18 05:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market_app', '0009_partition_order_trade'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EngineCommand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('action', models.CharField(choices=[('place_order', 'Place an order'), ('cancel_orders', 'Cancel orders'), ('cancel_user_orders', "Cancel a user's orders")], max_length=30)),
+                ('payload', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed'), ('expired', 'Expired')], default='pending', max_length=10)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('market', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='engine_commands', to='market_app.market')),
+            ],
+            options={
+                'db_table': 'engine_command',
+                'indexes': [models.Index(condition=models.Q(('status', 'pending')), fields=['id'], name='engine_command_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-18 05:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market_app', '0010_engine_command'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EngineState',
+            fields=[
+                ('market', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='engine_state', serialize=False, to='market_app.market')),
+                ('applied_sequence', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'engine_state',
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2 on 2026-10-18 05:52
+
+from django.db import migrations, models
+
+from market_app.partitions import drop_partition_unique_indexes
+
+BATCH_SIZE = 1000
+
+
+def claim_client_order_ids(apps, schema_editor):
+    Order = apps.get_model('market_app', 'Order')
+    OrderClientId = apps.get_model('market_app', 'OrderClientId')
+    orders = (Order._base_manager.exclude(client_order_id=None).exclude(client_order_id='')
+              .order_by('pk').values_list('client_order_id', 'pk'))
+    claims = []
+    for client_order_id, order_id in orders.iterator(chunk_size=BATCH_SIZE):
+        claims.append(OrderClientId(client_order_id=client_order_id, order_id=order_id))
+        if len(claims) >= BATCH_SIZE:
+            # شناسه‌ای که در دو پارتیشن تکرار شده باشد برای سفارش قدیمی‌تر می‌ماند
+            OrderClientId.objects.bulk_create(claims, ignore_conflicts=True)
+            claims = []
+    OrderClientId.objects.bulk_create(claims, ignore_conflicts=True)
+
+
+def drop_client_order_id_indexes(apps, schema_editor):
+    # روی PostgreSQL پارتیشن‌شده، AlterField ایندکس‌های یکتای هر پارتیشن را نمی‌بیند
+    drop_partition_unique_indexes(apps.get_model('market_app', 'Order'), 'client_order_id', schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market_app', '0011_engine_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderClientId',
+            fields=[
+                ('client_order_id', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('order_id', models.BigIntegerField(db_index=True)),
+            ],
+            options={
+                'db_table': 'order_client_id',
+            },
+        ),
+        migrations.RunPython(claim_client_order_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='order',
+            name='client_order_id',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.RunPython(drop_client_order_id_indexes, migrations.RunPython.noop),
+    ]
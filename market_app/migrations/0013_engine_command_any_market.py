@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 06:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market_app', '0012_order_client_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='enginecommand',
+            name='market',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='engine_commands', to='market_app.market'),
+        ),
+    ]
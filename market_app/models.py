@@ -1,4 +1,5 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, transaction
 from core_app.models import CreateMixin, UpdateMixin, SoftDeleteMixin
 from decimal import Decimal
 
@@ -44,7 +45,24 @@ class Market(CreateMixin, UpdateMixin, SoftDeleteMixin):
                                                              blank=True)  # ساعت بین funding rateها
 
     def __str__(self):
-        return f"{self.base_currency.symbol}/{self.quote_currency.symbol} ({self.get_market_type_display()})"
+        from market_app import registry
+
+        # نماد ارزها، فعال یا غیرفعال، از رجیستری خوانده می‌شود تا لیست بازارها برای هر ردیف کوئری نزند
+        base = registry.get_symbol(self.base_currency_id) or self.base_currency.symbol
+        quote = registry.get_symbol(self.quote_currency_id) or self.quote_currency.symbol
+        return f"{base}/{quote} ({self.get_market_type_display()})"
+
+    def get_current_price(self):
+        """Last traded price, or the mark price for a market that has not traded yet."""
+        from market_app import prices
+
+        last_price = prices.get_last_price(self.pk)
+        return last_price if last_price is not None else prices.get_mark_price(self.pk)
+
+    def get_mark_price(self):
+        from market_app import prices
+
+        return prices.get_mark_price(self.pk)
 
     class Meta:
         db_table = 'market'
@@ -66,6 +84,13 @@ class Order(CreateMixin, UpdateMixin, SoftDeleteMixin):
         (TAKE_PROFIT_LIMIT, 'Take Profit Limit'),
         (TAKE_PROFIT_MARKET, 'Take Profit Market'),
     ]
+    # نوع سفارشی که سفارش شرطی بعد از رسیدن قیمت به stop_price به آن تبدیل می‌شود
+    TRIGGERED_TYPES = {
+        STOP_LIMIT: LIMIT,
+        STOP_MARKET: MARKET,
+        TAKE_PROFIT_LIMIT: LIMIT,
+        TAKE_PROFIT_MARKET: MARKET,
+    }
 
     BUY = 'buy'
     SELL = 'sell'
@@ -89,6 +114,15 @@ class Order(CreateMixin, UpdateMixin, SoftDeleteMixin):
         (EXPIRED, 'Expired'),
     ]
 
+    GTC = 'GTC'
+    IOC = 'IOC'
+    FOK = 'FOK'
+    TIME_IN_FORCE_CHOICES = [
+        (GTC, 'Good Till Cancel'),
+        (IOC, 'Immediate Or Cancel'),
+        (FOK, 'Fill Or Kill'),
+    ]
+
     user = models.ForeignKey("account_app.User", on_delete=models.PROTECT, related_name="user_orders")
     market = models.ForeignKey(Market, on_delete=models.PROTECT, related_name='orders')
     order_type = models.CharField(max_length=20, choices=ORDER_TYPES)
@@ -96,24 +130,75 @@ class Order(CreateMixin, UpdateMixin, SoftDeleteMixin):
     amount = models.DecimalField(max_digits=30, decimal_places=8)
     price = models.DecimalField(max_digits=30, decimal_places=8, null=True, blank=True)
     stop_price = models.DecimalField(max_digits=30, decimal_places=8, null=True, blank=True)
+    triggered_at = models.DateTimeField(null=True, blank=True)  # زمان فعال شدن سفارش شرطی
     filled_amount = models.DecimalField(max_digits=30, decimal_places=8, default=0)
     avg_fill_price = models.DecimalField(max_digits=30, decimal_places=8, null=True, blank=True)  # اضافه شده
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=OPEN)
-    time_in_force = models.CharField(max_length=10, default='GTC')  # Good Till Cancel, IOC, FOK
+    time_in_force = models.CharField(max_length=10, choices=TIME_IN_FORCE_CHOICES, default=GTC)
     reduce_only = models.BooleanField(default=False)  # فقط برای Futures
     close_position = models.BooleanField(default=False)  # فقط برای Futures
-    client_order_id = models.CharField(max_length=50, null=True, blank=True, unique=True)
+    # یکتایی در جدول OrderClientId نگه داشته می‌شود؛ جدول پارتیشن‌شده فقط یکتایی هر پارتیشن را می‌شناسد
+    client_order_id = models.CharField(max_length=50, null=True, blank=True)
     fee = models.DecimalField(max_digits=30, decimal_places=8, default=0)  # کارمزد پرداختی
     fee_currency = models.ForeignKey(Currency, on_delete=models.PROTECT, null=True, blank=True)
 
     class Meta:
         db_table = "order"
         ordering = ['-created_at']
+        # فقط سفارش‌های زنده در این ایندکس‌ها هستند و سفارش‌های بسته شده هزینه‌ای برایشان ندارند
+        indexes = [
+            models.Index(fields=('market', 'side', 'price'), name='order_live_book_idx',
+                         condition=models.Q(status__in=('open', 'partially_filled'), is_deleted=False)),
+            models.Index(fields=('user', 'market', 'side'), name='order_live_user_idx',
+                         condition=models.Q(status__in=('open', 'partially_filled'), is_deleted=False)),
+        ]
+
+    def validate_unique(self, exclude=None):
+        super().validate_unique(exclude)
+        if self.client_order_id and 'client_order_id' not in (exclude or ()):
+            claims = OrderClientId.objects.filter(client_order_id=self.client_order_id)
+            if self.pk is not None:
+                claims = claims.exclude(order_id=self.pk)
+            if claims.exists():
+                raise ValidationError({'client_order_id': "An order with this client order id already exists."})
+
+    def save(self, *args, **kwargs):
+        """Saves the order and claims its client_order_id in OrderClientId in the same transaction."""
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'client_order_id' not in update_fields:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            adding = self._state.adding
+            super().save(*args, **kwargs)
+            if adding:
+                if self.client_order_id:
+                    OrderClientId.objects.create(client_order_id=self.client_order_id, order_id=self.pk)
+                return
+            OrderClientId.objects.filter(order_id=self.pk).exclude(client_order_id=self.client_order_id).delete()
+            if self.client_order_id:
+                claim, _ = OrderClientId.objects.get_or_create(client_order_id=self.client_order_id,
+                                                               defaults={'order_id': self.pk})
+                if claim.order_id != self.pk:
+                    raise IntegrityError(f"client_order_id {self.client_order_id!r} belongs to order {claim.order_id}")
+
+
+class OrderClientId(models.Model):
+    """
+    The client order ids in use, one row per id. Order is partitioned by month on PostgreSQL and
+    a unique index there only covers one partition, so this table keeps them unique.
+    """
+    client_order_id = models.CharField(max_length=50, primary_key=True)
+    order_id = models.BigIntegerField(db_index=True)
+
+    class Meta:
+        db_table = 'order_client_id'
 
 
 class Trade(CreateMixin, UpdateMixin, SoftDeleteMixin):
     """مدل برای ثبت معاملات انجام شده (تسویه سفارشات)"""
-    order = models.ForeignKey(Order, on_delete=models.PROTECT, related_name='trades')
+    # ایندکس (order, created_at) جای ایندکس خود کلید خارجی را هم می‌گیرد. قید کلید خارجی فقط در
+    # PostgreSQL و هنگام پارتیشن‌بندی order برداشته می‌شود، چون کلید اصلی آن (id, created_at) می‌شود
+    order = models.ForeignKey(Order, on_delete=models.PROTECT, related_name='trades', db_index=False)
     price = models.DecimalField(max_digits=30, decimal_places=8)
     amount = models.DecimalField(max_digits=30, decimal_places=8)
     fee = models.DecimalField(max_digits=30, decimal_places=8)
@@ -122,6 +207,79 @@ class Trade(CreateMixin, UpdateMixin, SoftDeleteMixin):
 
     class Meta:
         db_table = 'trade'
+        indexes = [
+            # بدون شرط is_deleted تا کوئری‌هایی که از base manager می‌آیند هم از آن استفاده کنند
+            models.Index(fields=('order', 'created_at'), name='trade_order_created_idx'),
+        ]
+
+
+class Candle(models.Model):
+    """کندل‌های بسته شده OHLCV؛ کندل باز در حافظه پروسه موتور نگه داشته می‌شود"""
+    ONE_MINUTE = '1m'
+    FIVE_MINUTES = '5m'
+    FIFTEEN_MINUTES = '15m'
+    ONE_HOUR = '1h'
+    FOUR_HOURS = '4h'
+    ONE_DAY = '1d'
+    INTERVAL_CHOICES = [
+        (ONE_MINUTE, '1 Minute'),
+        (FIVE_MINUTES, '5 Minutes'),
+        (FIFTEEN_MINUTES, '15 Minutes'),
+        (ONE_HOUR, '1 Hour'),
+        (FOUR_HOURS, '4 Hours'),
+        (ONE_DAY, '1 Day'),
+    ]
+    INTERVAL_SECONDS = {
+        ONE_MINUTE: 60,
+        FIVE_MINUTES: 5 * 60,
+        FIFTEEN_MINUTES: 15 * 60,
+        ONE_HOUR: 60 * 60,
+        FOUR_HOURS: 4 * 60 * 60,
+        ONE_DAY: 24 * 60 * 60,
+    }
+
+    market = models.ForeignKey(Market, on_delete=models.PROTECT, related_name='candles')
+    interval = models.CharField(max_length=3, choices=INTERVAL_CHOICES)
+    open_time = models.DateTimeField()
+    open = models.DecimalField(max_digits=30, decimal_places=8)
+    high = models.DecimalField(max_digits=30, decimal_places=8)
+    low = models.DecimalField(max_digits=30, decimal_places=8)
+    close = models.DecimalField(max_digits=30, decimal_places=8)
+    volume = models.DecimalField(max_digits=30, decimal_places=8)
+    quote_volume = models.DecimalField(max_digits=30, decimal_places=8)
+    trade_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'candle'
+        unique_together = ('market', 'interval', 'open_time')
+
+
+class FeeTier(CreateMixin, UpdateMixin, SoftDeleteMixin):
+    """سطح کارمزد VIP بر اساس حجم معاملات ۳۰ روزه کاربر به ارز مظنه (فقط بازارهای استیبل کوین)"""
+    level = models.PositiveSmallIntegerField(unique=True)
+    name = models.CharField(max_length=50)
+    min_volume = models.DecimalField(max_digits=30, decimal_places=8)
+    maker_fee = models.DecimalField(max_digits=5, decimal_places=4)
+    taker_fee = models.DecimalField(max_digits=5, decimal_places=4)
+
+    def __str__(self):
+        return f"{self.name} (>= {self.min_volume})"
+
+    class Meta:
+        db_table = 'fee_tier'
+        ordering = ('level',)
+
+
+class UserDailyVolume(models.Model):
+    """جمع حجم معاملات هر کاربر در هر روز (UTC)، با رسیدن هر دسته معامله افزایش پیدا می‌کند"""
+    user = models.ForeignKey("account_app.User", on_delete=models.PROTECT, related_name='daily_volumes')
+    day = models.DateField()
+    quote_volume = models.DecimalField(max_digits=30, decimal_places=8, default=0)
+    trade_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'user_daily_volume'
+        unique_together = ('user', 'day')
 
 
 class FuturesPosition(CreateMixin, UpdateMixin, SoftDeleteMixin):
@@ -162,6 +320,10 @@ class FuturesPosition(CreateMixin, UpdateMixin, SoftDeleteMixin):
     class Meta:
         db_table = 'futures_position'
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=('market', 'liquidation_price'), condition=models.Q(status='open', is_deleted=False),
+                         name='position_open_liq_idx'),
+        ]
 
 
 class FundingRate(CreateMixin, UpdateMixin, SoftDeleteMixin):
@@ -169,12 +331,28 @@ class FundingRate(CreateMixin, UpdateMixin, SoftDeleteMixin):
     market = models.ForeignKey(Market, on_delete=models.PROTECT, related_name='funding_rates')
     rate = models.DecimalField(max_digits=10, decimal_places=8)
     next_funding_time = models.DateTimeField()
+    settled_at = models.DateTimeField(null=True, blank=True)  # زمان اتمام تسویه این نرخ روی همه پوزیشن‌ها
 
     class Meta:
         db_table = 'funding_rate'
         ordering = ('-created_at',)
 
 
+class FundingPayment(CreateMixin):
+    """پرداخت funding هر پوزیشن در هر دوره؛ مقدار مثبت یعنی صاحب پوزیشن پرداخت کرده است"""
+    position = models.ForeignKey(FuturesPosition, on_delete=models.PROTECT, related_name='funding_payments')
+    funding_rate = models.ForeignKey(FundingRate, on_delete=models.PROTECT, related_name='payments')
+    user = models.ForeignKey("account_app.User", on_delete=models.PROTECT, related_name='user_funding_payments')
+    currency = models.ForeignKey(Currency, on_delete=models.PROTECT, related_name='funding_payments')
+    rate = models.DecimalField(max_digits=10, decimal_places=8)
+    mark_price = models.DecimalField(max_digits=30, decimal_places=8)
+    amount = models.DecimalField(max_digits=30, decimal_places=8)
+
+    class Meta:
+        db_table = 'funding_payment'
+        unique_together = ('position', 'funding_rate')
+
+
 class Liquidation(CreateMixin, UpdateMixin, SoftDeleteMixin):
     """مدل برای ثبت معاملات Liquidation"""
     position = models.ForeignKey(FuturesPosition, on_delete=models.PROTECT, related_name='liquidations')
@@ -185,3 +363,60 @@ class Liquidation(CreateMixin, UpdateMixin, SoftDeleteMixin):
 
     class Meta:
         db_table = 'liquidation'
+
+
+class EngineCommand(CreateMixin, UpdateMixin):
+    """
+    A request to the matching engine of a market from a process that does not run it. The engine
+    process claims pending commands oldest first and stores their result; the sender waits for it
+    and deletes the row. A command without a market covers every market, like cancelling all
+    orders of a user.
+    """
+    PLACE_ORDER = 'place_order'
+    CANCEL_ORDERS = 'cancel_orders'
+    CANCEL_USER_ORDERS = 'cancel_user_orders'
+    ACTION_CHOICES = [
+        (PLACE_ORDER, 'Place an order'),
+        (CANCEL_ORDERS, 'Cancel orders'),
+        (CANCEL_USER_ORDERS, "Cancel a user's orders"),
+    ]
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    EXPIRED = 'expired'  # فرستنده قبل از اجرا منتظر ماندن را رها کرده است
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+        (EXPIRED, 'Expired'),
+    ]
+
+    market = models.ForeignKey(Market, on_delete=models.PROTECT, null=True, blank=True,
+                               related_name='engine_commands')
+    action = models.CharField(max_length=30, choices=ACTION_CHOICES)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        db_table = 'engine_command'
+        indexes = [
+            models.Index(fields=('id',), condition=models.Q(status='pending'), name='engine_command_pending_idx'),
+        ]
+
+
+class EngineState(models.Model):
+    """
+    What of a market's matching journal the database already holds. ``applied_sequence`` is
+    updated in the transaction that stores an input, so replaying the journal after a crash can
+    tell the inputs that were stored from those that were not.
+    """
+    market = models.OneToOneField(Market, on_delete=models.CASCADE, primary_key=True, related_name='engine_state')
+    applied_sequence = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'engine_state'
@@ -0,0 +1,226 @@
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection as default_connection, transaction
+from django.utils import timezone
+
+# چند ماه جلوتر از ماه جاری پارتیشن ساخته می‌شود؛ ردیفی که پارتیشن نداشته باشد درج نمی‌شود
+MONTHS_AHEAD = 3
+PARTITION_KEY = 'created_at'
+
+_UPPER_BOUND = re.compile(r"TO \('([^']+)'\)")
+
+
+def month_start(moment):
+    moment = moment.astimezone(dt_timezone.utc)
+    return datetime(moment.year, moment.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(model, month):
+    return f'{model._meta.db_table}_p{month:%Y%m}'
+
+
+def is_partitioned(model, connection=default_connection):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)',
+                       [connection.ops.quote_name(model._meta.db_table)])
+        return cursor.fetchone() is not None
+
+
+def list_partitions(model, connection=default_connection):
+    """``(name, upper bound)`` of every partition of ``model``'s table, oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i '
+            'JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass',
+            [connection.ops.quote_name(model._meta.db_table)])
+        rows = cursor.fetchall()
+    partitions = []
+    for name, bound in rows:
+        match = _UPPER_BOUND.search(bound)
+        upper = datetime.fromisoformat(match.group(1)).astimezone(dt_timezone.utc) if match else None
+        partitions.append((name, upper))
+    return sorted(partitions, key=lambda partition: (partition[1] is None, partition[1]))
+
+
+def _unique_columns(model):
+    # یکتایی روی جدول پارتیشن‌شده بدون created_at ممکن نیست و برای هر پارتیشن جدا نگه داشته می‌شود
+    return [field.column for field in model._meta.local_fields if field.unique and not field.primary_key]
+
+
+def create_partition(model, month, connection=default_connection):
+    """Create the partition of ``month`` unless it exists. Returns whether it was created."""
+    name = partition_name(model, month)
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s)', [quote(name)])
+        if cursor.fetchone()[0] is not None:
+            return False
+        cursor.execute(
+            f'CREATE TABLE {quote(name)} PARTITION OF {quote(model._meta.db_table)} FOR VALUES FROM (%s) TO (%s)',
+            [month, add_months(month, 1)])
+        for column in _unique_columns(model):
+            cursor.execute(f'CREATE UNIQUE INDEX {quote(f"{name}_{column}_key")} ON {quote(name)} ({quote(column)})')
+    return True
+
+
+def create_partitions(model, months_ahead=MONTHS_AHEAD, now=None, connection=default_connection):
+    """Make sure the current month and the next ``months_ahead`` have partitions; returns the new ones."""
+    current = month_start(now or timezone.now())
+    # ماه‌هایی که پارتیشن legacy هنوز پوشش می‌دهد پارتیشن جدا نمی‌خواهند
+    covered = max((upper for _, upper in list_partitions(model, connection) if upper is not None), default=None)
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if covered is not None and add_months(month, 1) <= covered:
+            continue
+        if create_partition(model, month, connection):
+            created.append(partition_name(model, month))
+    return created
+
+
+def partitioned_until(model, connection=default_connection):
+    """The end of the last partition of ``model``'s table, None when it is not partitioned."""
+    if not is_partitioned(model, connection):
+        return None
+    return max((upper for _, upper in list_partitions(model, connection) if upper is not None), default=None)
+
+
+def drop_partition_unique_indexes(model, column, connection=default_connection):
+    """
+    Drop the unique indexes, and the constraints behind them, on ``column`` alone of every
+    partition of ``model``'s table. Returns their names. Only runs on PostgreSQL.
+    """
+    if not is_partitioned(model, connection):
+        return []
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname, t.relname, con.conname FROM pg_inherits i '
+            'JOIN pg_index x ON x.indrelid = i.inhrelid JOIN pg_class c ON c.oid = x.indexrelid '
+            'JOIN pg_class t ON t.oid = i.inhrelid '
+            'JOIN pg_attribute a ON a.attrelid = i.inhrelid AND a.attnum = x.indkey[0] '
+            'LEFT JOIN pg_constraint con ON con.conindid = x.indexrelid AND con.conrelid = i.inhrelid '
+            'WHERE i.inhparent = %s::regclass AND x.indisunique AND NOT x.indisprimary AND x.indnatts = 1 '
+            'AND a.attname = %s',
+            [quote(model._meta.db_table), column])
+        indexes = cursor.fetchall()
+        for index, partition, constraint in indexes:
+            if constraint:
+                cursor.execute(f'ALTER TABLE {quote(partition)} DROP CONSTRAINT {quote(constraint)}')
+            else:
+                cursor.execute(f'DROP INDEX {quote(index)}')
+    return [index for index, _, _ in indexes]
+
+
+def detach_partitions(model, before, connection=default_connection):
+    """
+    Detach every partition holding only rows created before ``before``. The tables are kept, with
+    their data, for archiving; queries on the model no longer see them. Returns their names.
+    """
+    quote = connection.ops.quote_name
+    detached = []
+    with connection.cursor() as cursor:
+        for name, upper in list_partitions(model, connection):
+            if upper is None or upper > before:
+                continue
+            cursor.execute(f'ALTER TABLE {quote(model._meta.db_table)} DETACH PARTITION {quote(name)}')
+            detached.append(name)
+    return detached
+
+
+def partition_table(model, connection, months_ahead=MONTHS_AHEAD, now=None):
+    """
+    Turn ``model``'s table into a table partitioned by month on created_at without copying rows:
+    the existing table becomes the ``<table>_legacy`` partition for everything up to the end of
+    the current month and monthly partitions are created from there on. The primary key becomes
+    (id, created_at) and ids keep coming from one sequence. Foreign key constraints referencing the
+    table are dropped, since they could not point at the new primary key; the columns stay. Only
+    runs on PostgreSQL, outside a transaction.
+
+    The steps keep the ACCESS EXCLUSIVE lock short: the range constraint is added NOT VALID (a
+    moment's lock), validated while reads and writes go on (SHARE UPDATE EXCLUSIVE, one scan of the
+    table), and only the renames, the new parent and the attach, which does not scan again, run in
+    one transaction under the exclusive lock. Re-running after an interruption starts over cleanly.
+    """
+    if connection.vendor != 'postgresql' or is_partitioned(model, connection):
+        return
+    table = model._meta.db_table
+    legacy = f'{table}_legacy'
+    # مرز از ماه بعد است تا ردیف‌هایی که در طول migration درج می‌شوند قید را نقض نکنند
+    boundary = add_months(month_start(now or timezone.now()), 1)
+    quote = connection.ops.quote_name
+    check = quote(legacy + '_range')
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {quote(table)} DROP CONSTRAINT IF EXISTS {check}')
+        cursor.execute(f'ALTER TABLE {quote(table)} ADD CONSTRAINT {check} '
+                       f'CHECK ({quote(PARTITION_KEY)} < %s) NOT VALID', [boundary])
+        cursor.execute(f'ALTER TABLE {quote(table)} VALIDATE CONSTRAINT {check}')
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT conrelid::regclass::text, conname FROM pg_constraint '
+            'WHERE confrelid = %s::regclass AND contype = %s',
+            [quote(table), 'f'])
+        for referencing, name in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {referencing} DROP CONSTRAINT {quote(name)}')
+        cursor.execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(legacy)}')
+        # نام ایندکس‌ها و قیدها به جدول اصلی می‌رسد و جدول قدیمی پسوند legacy می‌گیرد
+        cursor.execute(
+            'SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint '
+            'WHERE conrelid = %s::regclass AND contype = %s',
+            [quote(legacy), 'f'])
+        foreign_keys = cursor.fetchall()
+        cursor.execute(
+            'SELECT c.relname, pg_get_indexdef(i.indexrelid), i.indisprimary, i.indisunique FROM pg_index i '
+            'JOIN pg_class c ON c.oid = i.indexrelid WHERE i.indrelid = %s::regclass',
+            [quote(legacy)])
+        indexes = cursor.fetchall()
+        for name, _ in foreign_keys:
+            cursor.execute(f'ALTER TABLE {quote(legacy)} RENAME CONSTRAINT {quote(name)} TO {quote(name + "_legacy")}')
+        for name, _, _, _ in indexes:
+            cursor.execute(f'ALTER INDEX {quote(name)} RENAME TO {quote(name + "_legacy")}')
+
+        # ستون identity روی پارتیشن مجاز نیست؛ ادامه شمارش به یک sequence معمولی سپرده می‌شود
+        cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [quote(legacy), 'id'])
+        sequence = cursor.fetchone()[0]
+        cursor.execute('SELECT attidentity FROM pg_attribute WHERE attrelid = %s::regclass AND attname = %s',
+                       [quote(legacy), 'id'])
+        if cursor.fetchone()[0]:
+            cursor.execute('SELECT nextval(%s)', [sequence])
+            next_id = cursor.fetchone()[0]
+            cursor.execute(f'ALTER TABLE {quote(legacy)} ALTER COLUMN id DROP IDENTITY')
+            sequence = f'{table}_id_seq'
+            cursor.execute(f'CREATE SEQUENCE {quote(sequence)} START WITH {int(next_id)}')
+            sequence = quote(sequence)
+        else:
+            cursor.execute(f'ALTER TABLE {quote(legacy)} ALTER COLUMN id DROP DEFAULT')
+
+        cursor.execute(
+            f'CREATE TABLE {quote(table)} (LIKE {quote(legacy)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS '
+            f'INCLUDING STORAGE) PARTITION BY RANGE ({quote(PARTITION_KEY)})')
+        # قید بازه فقط مال پارتیشن legacy است و LIKE آن را هم کپی کرده
+        cursor.execute(f'ALTER TABLE {quote(table)} DROP CONSTRAINT {check}')
+        cursor.execute(f'ALTER TABLE {quote(table)} ALTER COLUMN id SET DEFAULT nextval(%s)', [sequence])
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {quote(table)}.id')
+        cursor.execute(f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(table + "_pkey")} '
+                       f'PRIMARY KEY (id, {quote(PARTITION_KEY)})')
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}')
+        for name, definition, primary, unique in indexes:
+            if primary or unique:
+                # ایندکس یکتای جدول قدیمی فقط روی همان پارتیشن می‌ماند
+                continue
+            cursor.execute(f'CREATE INDEX {quote(name)} ON {quote(table)}{definition[definition.index(" USING "):]}')
+
+        # با قید معتبر شده، attach بدون اسکن دوباره کل جدول قدیمی انجام می‌شود
+        cursor.execute(f'ALTER TABLE {quote(table)} ATTACH PARTITION {quote(legacy)} '
+                       f'FOR VALUES FROM (MINVALUE) TO (%s)', [boundary])
+        create_partitions(model, months_ahead, now, connection)
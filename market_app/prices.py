@@ -0,0 +1,84 @@
+import time
+from decimal import Decimal
+
+from django.core.cache import cache
+
+from market_app.models import Trade
+
+LAST = 'last'
+MARK = 'mark'
+INDEX = 'index'
+LOCAL_TTL = 1.0
+NO_PRICE = ''
+
+# kind -> market_id -> (price, monotonic deadline or None for prices this process sets itself)
+_local = {LAST: {}, MARK: {}}
+
+
+def _cache_key(market_id, kind):
+    return f'market:{market_id}:{kind}_price'
+
+
+def set_price(market_id, kind, price):
+    _local[kind][market_id] = (price, None)
+    cache.set(_cache_key(market_id, kind), str(price), None)
+
+
+def get_price(market_id, kind):
+    """
+    Latest price of ``kind`` for a market. The process that sets a market's prices always answers
+    from memory; other processes keep what they read from the shared cache for LOCAL_TTL seconds.
+    """
+    entry = _local[kind].get(market_id)
+    if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+        return entry[0]
+    value = cache.get(_cache_key(market_id, kind))
+    if value is None and kind == LAST:
+        value = _seed_last_price(market_id)
+    price = Decimal(value) if value else None
+    _local[kind][market_id] = (price, time.monotonic() + LOCAL_TTL)
+    return price
+
+
+def _seed_last_price(market_id):
+    # فقط وقتی کش مشترک خالی است (مثلا بعد از ری‌استارت) یک بار از جدول معاملات خوانده می‌شود
+    price = Trade.objects.filter(order__market_id=market_id).order_by('-created_at').values_list(
+        'price', flat=True).first()
+    value = str(price) if price is not None else NO_PRICE
+    cache.add(_cache_key(market_id, LAST), value, None)
+    return value
+
+
+def set_last_price(market_id, price):
+    set_price(market_id, LAST, price)
+
+
+def set_mark_price(market_id, price):
+    set_price(market_id, MARK, price)
+
+
+def set_index_price(market_id, price):
+    """
+    Publish a futures market's index price for the engine process, which turns it into the mark
+    price. Each value carries the time it was published, so the engine applies it only once.
+    """
+    cache.set(_cache_key(market_id, INDEX), (str(price), time.time_ns()), None)
+
+
+def get_index_prices(market_ids):
+    """``market_id -> (index price, publish time)`` of the given markets that have one."""
+    keys = {_cache_key(market_id, INDEX): market_id for market_id in market_ids}
+    return {keys[key]: (Decimal(price), published) for key, (price, published) in cache.get_many(keys).items()}
+
+
+def get_last_price(market_id):
+    return get_price(market_id, LAST)
+
+
+def get_mark_price(market_id):
+    return get_price(market_id, MARK)
+
+
+def clear_local():
+    for prices in _local.values():
+        prices.clear()
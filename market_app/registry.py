@@ -0,0 +1,117 @@
+import threading
+import time
+from types import MappingProxyType
+
+from django.core.cache import cache
+
+from market_app.models import Currency, Market
+
+VERSION_KEY = 'market:registry_version'
+# هر پروسه حداکثر هر این چند ثانیه نسخه مشترک را از کش می‌خواند
+CHECK_INTERVAL = 1.0
+
+
+class Registry:
+    """
+    Read-only snapshot of the active currencies and markets, with the currencies of every market
+    already attached, and of the symbols of all currencies. Lookups never touch the database; the
+    objects are shared by every caller of the process and must not be modified.
+    """
+
+    def __init__(self, currencies, markets, symbols, version):
+        self.version = version
+        self.symbols = MappingProxyType(symbols)
+        self.currencies = MappingProxyType({currency.pk: currency for currency in currencies})
+        self.currencies_by_symbol = MappingProxyType({currency.symbol: currency for currency in currencies})
+        self.markets = MappingProxyType({market.pk: market for market in markets})
+        self.markets_by_pair = MappingProxyType({
+            (market.base_currency.symbol, market.quote_currency.symbol, market.market_type): market
+            for market in markets
+        })
+
+    @classmethod
+    def load(cls, version):
+        currencies = list(Currency.objects.filter(is_active=True))
+        by_id = {currency.pk: currency for currency in currencies}
+        markets = []
+        for market in Market.objects.filter(is_active=True).order_by('pk'):
+            base, quote = by_id.get(market.base_currency_id), by_id.get(market.quote_currency_id)
+            if base is None or quote is None:
+                # بازاری که یکی از ارزهایش غیرفعال است قابل معامله نیست
+                continue
+            market.base_currency, market.quote_currency = base, quote
+            markets.append(market)
+        symbols = dict(Currency._base_manager.values_list('pk', 'symbol'))
+        return cls(currencies, markets, symbols, version)
+
+
+_registry = None
+_checked_at = None
+_lock = threading.Lock()
+
+
+def _shared_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 0, None)
+        version = cache.get(VERSION_KEY, 0)
+    return version
+
+
+def get_registry():
+    """
+    The process's registry, rebuilt when another process (or a committed change in this one)
+    moved the shared version on. The version is looked up at most once per CHECK_INTERVAL.
+    """
+    global _registry, _checked_at
+    registry, now = _registry, time.monotonic()
+    if registry is not None and _checked_at is not None and now - _checked_at < CHECK_INTERVAL:
+        return registry
+    with _lock:
+        version = _shared_version()
+        if _registry is None or _registry.version != version:
+            # ساخت نسخه جدید کامل انجام می‌شود و بعد یک‌جا جایگزین می‌شود
+            _registry = Registry.load(version)
+        _checked_at = time.monotonic()
+        return _registry
+
+
+def invalidate():
+    """Move the shared version on, so every process rebuilds its registry; this one right away."""
+    global _checked_at
+    cache.add(VERSION_KEY, 0, None)
+    cache.incr(VERSION_KEY)
+    with _lock:
+        _checked_at = None
+
+
+def reset():
+    global _registry, _checked_at
+    with _lock:
+        _registry = None
+        _checked_at = None
+
+
+def get_currency(currency_id):
+    return get_registry().currencies.get(currency_id)
+
+
+def get_symbol(currency_id):
+    """Symbol of any currency, active or not; None for one created after the registry was built."""
+    return get_registry().symbols.get(currency_id)
+
+
+def get_currency_by_symbol(symbol):
+    return get_registry().currencies_by_symbol.get(symbol)
+
+
+def get_market(market_id):
+    return get_registry().markets.get(market_id)
+
+
+def get_market_by_pair(base_symbol, quote_symbol, market_type=Market.SPOT):
+    return get_registry().markets_by_pair.get((base_symbol, quote_symbol, market_type))
+
+
+def active_market_ids():
+    return list(get_registry().markets)
@@ -0,0 +1,51 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
+
+from market_app import candles, fees, prices, registry, ticker
+from market_app.engine import liquidation
+from market_app.models import Currency, Market, Trade, FuturesPosition, FeeTier
+
+# بعد از commit شدن هر دسته از معاملات موتور فرستاده می‌شود (market, trades, results)
+trades_persisted = Signal()
+
+
+@receiver(trades_persisted, sender=Trade)
+def update_last_price(sender, market, trades, **kwargs):
+    prices.set_last_price(market.pk, trades[-1].price)
+
+
+# قبل از کندل‌ها اجرا می‌شود؛ تیکر در اولین بار از کندل باز ۱ دقیقه ساخته می‌شود و نباید این دسته را دو بار بشمارد
+@receiver(trades_persisted, sender=Trade)
+def update_ticker(sender, market, trades, **kwargs):
+    ticker.record_trades(market.pk, trades)
+
+
+@receiver(trades_persisted, sender=Trade)
+def update_candles(sender, market, trades, **kwargs):
+    candles.record_trades(market.pk, trades)
+
+
+@receiver(post_save, sender=FeeTier)
+@receiver(post_delete, sender=FeeTier)
+def reset_fee_tiers(sender, **kwargs):
+    fees.reset_tiers()
+
+
+@receiver(post_save, sender=Currency)
+@receiver(post_delete, sender=Currency)
+@receiver(post_save, sender=Market)
+@receiver(post_delete, sender=Market)
+def invalidate_registry(sender, **kwargs):
+    # بعد از commit تا پروسه‌های دیگر نسخه جدید را با داده‌های commit نشده نسازند
+    transaction.on_commit(registry.invalidate)
+
+
+@receiver(post_save, sender=FuturesPosition)
+def sync_position_columns(sender, instance, **kwargs):
+    liquidation.sync_position(instance)
+
+
+@receiver(post_delete, sender=FuturesPosition)
+def remove_position_columns(sender, instance, **kwargs):
+    liquidation.remove_positions(instance.market_id, [instance.pk])
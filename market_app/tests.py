@@ -1,3 +1,1343 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from collections import deque
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal, ROUND_HALF_UP
+from io import StringIO
+from itertools import groupby
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.admin.sites import site
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from account_app import ledger
+from benchmarks.flow import CANCEL, PLACE, OrderFlow
+from benchmarks.matching import run_engine
+from account_app.models import LedgerEntry, User, Wallet
+from core_app import bulk_actions
+from core_app.models import BulkActionJob
+from market_app import archive, candles, fees, funding, partitions, prices, registry, ticker
+from market_app.checks import check_partitions_ahead, check_shared_cache
+from market_app.engine import holds, liquidation, mark, persistence, service
+from market_app.engine.book import BookOrder
+from market_app.engine.fixed import get_scale, market_scale
+from market_app.engine.journal import Journal, list_journals
+from market_app.engine.recovery import place_record
+from market_app.engine.snapshot import list_snapshots
+from market_app.models import (Candle, Currency, EngineCommand, EngineState, FeeTier, FundingPayment, FundingRate,
+                               FuturesPosition, Liquidation, Market, Order, OrderClientId, Trade, UserDailyVolume)
+from market_app.signals import trades_persisted
+
+LIVE = (Order.OPEN, Order.PARTIALLY_FILLED)
+
+
+def reset_process_state():
+    """Forget everything the engine process keeps in memory, as after a restart."""
+    service.reset_engines()
+    holds.reset_holds()
+    liquidation.reset_positions()
+    mark.reset_marks()
+    fees.reset_tiers()
+    registry.reset()
+    candles.reset_aggregators()
+    ticker.reset_tickers()
+    prices.clear_local()
+    cache.clear()
+
+
+class EngineTestCase(TestCase):
+    """
+    A BTC/USDT market served by an engine of this process, with its files in a temporary
+    directory. Both users get ``funds`` of each currency unless it is None.
+    """
+    market_type = Market.SPOT
+    funds = Decimal(10 ** 6)
+
+    def setUp(self):
+        reset_process_state()
+        self.addCleanup(reset_process_state)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        settings = override_settings(MATCHING_ENGINE_DIR=directory, MATCHING_SNAPSHOT_EVERY=10000,
+                                     MATCHING_ENGINE_OWNER=True)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.btc = Currency.objects.create(symbol='BTC', name='Bitcoin')
+        self.usdt = Currency.objects.create(symbol='USDT', name='Tether')
+        self.market = Market.objects.create(base_currency=self.btc, quote_currency=self.usdt,
+                                            market_type=self.market_type, min_order_amount=Decimal('0.0001'))
+        self.alice = User.objects.create(username='alice', phone='1')
+        self.bob = User.objects.create(username='bob', phone='2')
+        if self.funds is not None:
+            for user in (self.alice, self.bob):
+                for currency in (self.btc, self.usdt):
+                    ledger.deposit(user, currency, self.funds)
+
+    def order(self, user, side, amount, price=None, order_type=Order.LIMIT, **fields):
+        return Order.objects.create(
+            user=user, market=self.market, side=side, order_type=order_type, amount=Decimal(amount),
+            price=None if price is None else Decimal(price), **fields)
+
+    def place(self, user, side, amount, price=None, order_type=Order.LIMIT, **fields):
+        order = self.order(user, side, amount, price, order_type, **fields)
+        service.place_order(order)
+        order.refresh_from_db()
+        return order
+
+    def status(self, order):
+        order.refresh_from_db()
+        return order.status
+
+    def book(self):
+        return service.get_engine(self.market).engine.book
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from plan_nodes(child)
+
+
+def root_index(name):
+    """The index of the partitioned table an index of one of its partitions belongs to."""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT COALESCE(pg_partition_root(%s::regclass), %s::regclass)::text', [name, name])
+        return cursor.fetchone()[0]
+
+
+class MatchingTests(EngineTestCase):
+
+    def test_orders_match_by_price_then_time(self):
+        first = self.place(self.alice, Order.SELL, '1', '100')
+        cheaper = self.place(self.alice, Order.SELL, '1', '99')
+        second = self.place(self.alice, Order.SELL, '1', '100')
+
+        taker = self.place(self.bob, Order.BUY, '1.5', '101')
+
+        self.assertEqual(taker.status, Order.FILLED)
+        self.assertEqual(taker.avg_fill_price, Decimal('99.33333333'))
+        self.assertEqual((self.status(cheaper), self.status(first), self.status(second)),
+                         (Order.FILLED, Order.PARTIALLY_FILLED, Order.OPEN))
+        first.refresh_from_db()
+        self.assertEqual(first.filled_amount, Decimal('0.5'))
+        self.assertEqual(Trade.objects.filter(order=taker).count(), 2)
+        self.assertEqual(ledger.unbalanced_movements(), [])
+
+    def test_market_orders_expire_with_what_the_book_can_not_fill(self):
+        self.place(self.alice, Order.SELL, '0.5', '100')
+        order = self.place(self.bob, Order.BUY, '2', order_type=Order.MARKET)
+
+        self.assertEqual((order.status, order.filled_amount), (Order.EXPIRED, Decimal('0.5')))
+        self.assertEqual(len(self.book()), 0)
+
+    def test_the_book_is_rebuilt_after_a_restart(self):
+        resting = self.place(self.alice, Order.BUY, '1', '90')
+        self.place(self.alice, Order.SELL, '1', '100')
+        self.place(self.bob, Order.BUY, '1', '100')
+        reset_process_state()
+
+        self.assertEqual(list(self.book().orders), [resting.pk])
+        service.cancel_order(resting)
+        self.assertEqual(self.status(resting), Order.CANCELLED)
+        self.assertEqual(len(self.book()), 0)
+
+
+class TriggerTests(EngineTestCase):
+
+    def test_trades_set_off_stop_and_take_profit_orders(self):
+        for side, price in ((Order.SELL, '100'), (Order.SELL, '105'), (Order.BUY, '95'), (Order.BUY, '90')):
+            self.place(self.alice, side, '1', price)
+        stop_buy = self.place(self.bob, Order.BUY, '1', order_type=Order.STOP_MARKET, stop_price=Decimal(100))
+        take_profit = self.place(self.bob, Order.SELL, '1', '104', Order.TAKE_PROFIT_LIMIT, stop_price=Decimal(103))
+        stop_sell = self.place(self.bob, Order.SELL, '1', '80', Order.STOP_LIMIT, stop_price=Decimal(92))
+
+        # the trade at 100 sets off the stop buy, whose trade at 105 sets off the take profit
+        results = service.place_order(self.order(self.alice, Order.BUY, '1', '100'))
+
+        self.assertEqual(len(results), 3)
+        stop_buy.refresh_from_db()
+        take_profit.refresh_from_db()
+        self.assertEqual((stop_buy.status, stop_buy.avg_fill_price), (Order.FILLED, Decimal(105)))
+        self.assertIsNotNone(stop_buy.triggered_at)
+        self.assertEqual(take_profit.status, Order.OPEN)
+        self.assertIsNotNone(take_profit.triggered_at)
+
+        reset_process_state()
+        engine = service.get_engine(self.market).engine
+        self.assertIn(take_profit.pk, engine.book)
+        self.assertIn(stop_sell.pk, engine.triggers)
+
+        service.on_price_tick(self.market, Decimal(91))
+        stop_sell.refresh_from_db()
+        self.assertEqual((stop_sell.status, stop_sell.avg_fill_price), (Order.FILLED, Decimal(95)))
+
+
+class TimeInForceTests(EngineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.asks = [self.place(self.alice, Order.SELL, '1', '100'), self.place(self.alice, Order.SELL, '1', '101')]
+
+    def test_fill_or_kill_does_not_touch_the_book_when_it_can_not_fill(self):
+        order = self.place(self.bob, Order.BUY, '3', '101', time_in_force=Order.FOK)
+
+        self.assertEqual(order.status, Order.EXPIRED)
+        self.assertFalse(Trade.objects.exists())
+        self.assertEqual(len(self.book()), 2)
+        self.assertEqual(self.place(self.bob, Order.BUY, '2', '101', time_in_force=Order.FOK).status, Order.FILLED)
+
+    def test_immediate_or_cancel_expires_the_rest(self):
+        order = self.place(self.bob, Order.BUY, '2', '100', time_in_force=Order.IOC)
+
+        self.assertEqual((order.status, order.filled_amount), (Order.EXPIRED, Decimal(1)))
+        self.assertEqual(list(self.book().orders), [self.asks[1].pk])
+
+    def test_a_resting_order_writes_nothing(self):
+        # the first order of a user reads their balance and fee tier
+        self.place(self.bob, Order.BUY, '1', '98')
+        order = self.order(self.bob, Order.BUY, '2', '99')
+        with self.assertNumQueries(0):
+            service.place_order(order)
+
+
+class OrderFlowTests(TestCase):
+
+    def events(self, **options):
+        return [(kind, payload if kind == CANCEL else [getattr(payload, name) for name in payload.__slots__])
+                for kind, payload in OrderFlow(events=2000, **options)]
+
+    def test_a_seed_always_gives_the_same_flow(self):
+        self.assertEqual(self.events(seed=7), self.events(seed=7))
+        self.assertNotEqual(self.events(seed=7), self.events(seed=8))
+
+    def test_only_resting_orders_are_cancelled(self):
+        placed = {}
+        for kind, payload in OrderFlow(events=2000):
+            if kind == PLACE:
+                placed[payload.ref] = payload
+            else:
+                order = placed.pop(payload)
+                self.assertNotEqual(order.order_type, Order.MARKET)
+                self.assertEqual(order.time_in_force, Order.GTC)
+
+    def test_the_engine_benchmark_runs_every_event(self):
+        report = run_engine(OrderFlow(events=2000))
+        self.assertEqual((report.events, len(report.latencies)), (2000, 2000))
+
+
+class BatchPersistenceTests(EngineTestCase):
+
+    def sweep(self, levels):
+        for index in range(levels):
+            self.place(self.alice, Order.SELL, '1', str(100 + index))
+        taker = self.order(self.bob, Order.BUY, str(levels), '200')
+        with CaptureQueriesContext(connection) as queries:
+            service.place_order(taker)
+        taker.refresh_from_db()
+        # sqlite splits a bulk insert by its limit on query parameters; a split counts once
+        statements = (' '.join(query['sql'].split()[:3]) for query in queries.captured_queries)
+        statements = [key for key, _ in groupby(statements)]
+        return taker, [statement for statement in statements if 'SAVEPOINT' not in statement]
+
+    def test_a_sweep_is_stored_with_a_fixed_number_of_queries(self):
+        taker, few = self.sweep(2)
+        self.assertEqual(sum(statement.startswith('UPDATE "order"') for statement in few), 1)
+        self.assertEqual(taker.status, Order.FILLED)
+        Order.objects.update(status=Order.CANCELLED)
+        reset_process_state()
+
+        taker, many = self.sweep(20)
+
+        self.assertEqual(many, few)
+        self.assertEqual(taker.avg_fill_price, Decimal('109.5'))
+        self.assertEqual(Trade.objects.count(), 44)
+        self.assertEqual(Order.objects.filter(status=Order.FILLED).count(), 21)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "Query plans are only checked on PostgreSQL")
+class HotQueryPlanTests(TestCase):
+    """
+    The hot queries of the exchange must be served by an index. Sequential scans are disabled for
+    the test, so the planner only picks one when no index fits the query.
+    """
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = json.loads(queryset.explain(format='json'))[0]['Plan']
+        nodes = list(plan_nodes(plan))
+        scans = [node['Relation Name'] for node in nodes if node['Node Type'] == 'Seq Scan']
+        self.assertEqual(scans, [], f"Sequential scan on {scans} in {json.dumps(plan)}")
+        self.assertIn(index_name, [root_index(node['Index Name']) for node in nodes if 'Index Name' in node])
+
+    def test_book_side_by_price(self):
+        queryset = Order.objects.filter(market_id=1, side=Order.SELL, status__in=LIVE).order_by('price')
+        self.assertUsesIndex(queryset, 'order_live_book_idx')
+
+    def test_market_live_orders(self):
+        queryset = Order.objects.filter(market_id=1, status__in=LIVE).order_by('created_at', 'pk')
+        self.assertUsesIndex(queryset, 'order_live_book_idx')
+
+    def test_user_live_orders(self):
+        queryset = Order.objects.filter(user_id=1, market_id=1, side=Order.BUY, status__in=LIVE)
+        self.assertUsesIndex(queryset, 'order_live_user_idx')
+
+    def test_user_markets_with_live_orders(self):
+        queryset = Order.objects.filter(user_id=1, status__in=LIVE).values('market_id').distinct()
+        self.assertUsesIndex(queryset, 'order_live_user_idx')
+
+    def test_trades_of_order(self):
+        queryset = Trade.objects.filter(order_id=1).order_by('created_at')
+        self.assertUsesIndex(queryset, 'trade_order_created_idx')
+
+    def test_open_positions_by_liquidation_price(self):
+        queryset = FuturesPosition.objects.filter(
+            market_id=1, status=FuturesPosition.OPEN, liquidation_price__lte=100).order_by('liquidation_price')
+        self.assertUsesIndex(queryset, 'position_open_liq_idx')
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "Partitioning is only used on PostgreSQL")
+class PartitionTests(TestCase):
+
+    def test_tables_are_partitioned(self):
+        for model in (Order, Trade):
+            names = [name for name, _ in partitions.list_partitions(model)]
+            self.assertIn(f'{model._meta.db_table}_legacy', names)
+            # ماه جاری هنوز در پارتیشن legacy است
+            next_month = partitions.add_months(partitions.month_start(timezone.now()), 1)
+            self.assertIn(partitions.partition_name(model, next_month), names)
+
+    def test_recent_rows_only_touch_current_partitions(self):
+        next_month = partitions.add_months(partitions.month_start(timezone.now()), 1)
+        expected = {partitions.partition_name(Order, partitions.add_months(next_month, offset))
+                    for offset in range(partitions.MONTHS_AHEAD)}
+        plan = json.loads(Order.objects.filter(created_at__gte=next_month).explain(format='json'))[0]['Plan']
+        scanned = {node['Relation Name'] for node in plan_nodes(plan) if 'Relation Name' in node}
+        self.assertTrue(scanned)
+        self.assertLessEqual(scanned, expected)
+
+    def test_check_warns_before_partitions_run_out(self):
+        self.assertEqual(check_partitions_ahead(None, databases=['default']), [])
+        later = timezone.now() + timedelta(days=31 * partitions.MONTHS_AHEAD)
+        with mock.patch('market_app.checks.timezone.now', return_value=later):
+            self.assertEqual({warning.id for warning in check_partitions_ahead(None, databases=['default'])},
+                             {'market_app.W001'})
+
+
+class HoldTests(EngineTestCase):
+    funds = None
+
+    def setUp(self):
+        super().setUp()
+        ledger.deposit(self.alice, self.btc, Decimal(2))
+        ledger.deposit(self.bob, self.usdt, Decimal(150))
+
+    def account(self, user, currency):
+        account = holds.get_holds().account(user.pk, currency.pk)
+        return account.total, account.locked
+
+    def test_orders_reserve_what_they_can_spend(self):
+        self.place(self.alice, Order.SELL, '1.5', '100')
+        self.assertEqual(self.account(self.alice, self.btc), (Decimal(2), Decimal('1.5')))
+        self.assertEqual(self.place(self.alice, Order.SELL, '1', '100').status, Order.REJECTED)
+
+        # خرید با قیمت بهتر پر می‌شود و مابقی مبلغ رزرو شده آزاد می‌شود
+        self.place(self.bob, Order.BUY, '1', '101')
+        self.assertEqual(self.account(self.bob, self.usdt), (Decimal(50), Decimal(0)))
+        self.assertEqual(self.account(self.bob, self.btc), (Decimal('0.998'), Decimal(0)))
+        self.assertEqual(self.account(self.alice, self.btc), (Decimal(1), Decimal('0.5')))
+        self.assertEqual(self.account(self.alice, self.usdt), (Decimal('99.9'), Decimal(0)))
+
+        self.assertEqual(self.place(self.bob, Order.BUY, '1', order_type=Order.MARKET).status, Order.EXPIRED)
+        self.assertEqual(self.account(self.bob, self.usdt), (Decimal(0), Decimal(0)))
+
+        holds.flush_holds(force=True)
+        for user in (self.alice, self.bob):
+            for currency in (self.btc, self.usdt):
+                self.assertEqual(ledger.balance(user.pk, currency.pk), self.account(user, currency)[0])
+
+    def test_a_triggered_market_buy_spends_at_most_the_available_funds(self):
+        carol = User.objects.create(username='carol', phone='3')
+        ledger.deposit(carol, self.usdt, Decimal(100))
+        self.place(self.alice, Order.SELL, '0.5', '100')
+        self.place(self.alice, Order.SELL, '1.5', '300')
+        stop = self.place(self.bob, Order.BUY, '1', None, Order.STOP_MARKET, stop_price=Decimal(100))
+        self.assertEqual(self.account(self.bob, self.usdt), (Decimal(150), Decimal(105)))
+
+        # the buy fires after the cheap level is gone and only reaches 300
+        self.place(carol, Order.BUY, '0.5', '100')
+
+        stop.refresh_from_db()
+        self.assertEqual((stop.status, stop.filled_amount), (Order.EXPIRED, Decimal('0.5')))
+        self.assertEqual(self.account(self.bob, self.usdt), (Decimal(0), Decimal(0)))
+        holds.flush_holds(force=True)
+        self.assertEqual(ledger.balance(self.bob.pk, self.usdt.pk), Decimal(0))
+
+    def test_cancelling_releases_the_hold(self):
+        order = self.place(self.alice, Order.SELL, '0.5', '120')
+        self.assertEqual(self.account(self.alice, self.btc), (Decimal(2), Decimal('0.5')))
+        service.cancel_order(order)
+        self.assertEqual(self.account(self.alice, self.btc), (Decimal(2), Decimal(0)))
+
+    def test_holds_are_rebuilt_from_the_live_orders(self):
+        self.place(self.alice, Order.SELL, '0.25', '130')
+        holds.reset_holds()
+        self.assertEqual(self.account(self.alice, self.btc), (Decimal(2), Decimal('0.25')))
+
+        order = self.order(self.alice, Order.SELL, '0.75', '130')
+        holds.reset_holds()
+        service.place_order(order)
+        self.assertEqual(self.account(self.alice, self.btc), (Decimal(2), Decimal(1)))
+
+
+class LoadHoldTests(EngineTestCase):
+    funds = None
+
+    def test_orders_saved_while_the_engine_was_down_reserve_funds(self):
+        ledger.deposit(self.alice, self.usdt, Decimal(100))
+        ledger.deposit(self.bob, self.btc, Decimal(1))
+        first = self.order(self.alice, Order.BUY, '0.8', '100')
+        second = self.order(self.alice, Order.BUY, '0.8', '100')
+        broke = self.order(self.bob, Order.BUY, '1', '100')
+        seller = self.order(self.bob, Order.SELL, '0.5', '100')
+
+        self.assertEqual(service.place_order(first), [])
+
+        self.assertEqual(self.status(first), Order.PARTIALLY_FILLED)
+        self.assertEqual(self.status(second), Order.REJECTED)
+        self.assertEqual(self.status(broke), Order.REJECTED)
+        self.assertEqual(self.status(seller), Order.FILLED)
+        self.assertEqual(first.status, Order.PARTIALLY_FILLED)
+        account = holds.get_holds().account(self.alice.pk, self.usdt.pk)
+        self.assertEqual((account.total, account.locked), (Decimal(50), Decimal(30)))
+        self.assertEqual(list(self.book().orders), [first.pk])
+
+
+class ForceFillTests(EngineTestCase):
+
+    def test_filled_orders_leave_the_book_and_release_their_hold(self):
+        order = self.place(self.alice, Order.BUY, '1', '100')
+        self.assertEqual(holds.get_holds().account(self.alice.pk, self.usdt.pk).locked, Decimal(100))
+
+        job = bulk_actions.submit('market_app.force_fill_orders', Order.objects.filter(pk=order.pk))
+
+        self.assertEqual(job.affected, 1)
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.filled_amount, order.avg_fill_price),
+                         (Order.FILLED, Decimal(1), Decimal(100)))
+        self.assertEqual(len(self.book()), 0)
+        self.assertEqual(holds.get_holds().account(self.alice.pk, self.usdt.pk).locked, 0)
+
+
+class BulkActionTests(EngineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser(username='root', phone='9', password='x')
+        self.client.force_login(self.admin)
+        self.orders = [self.order(self.alice, Order.SELL, '1', 100 + i) for i in range(30)]
+
+    def test_small_selections_run_in_the_request(self):
+        response = self.client.post('/admin/market_app/order/', {
+            'action': 'force_fill_orders', '_selected_action': [order.pk for order in self.orders[:5]],
+        }, follow=True)
+
+        self.assertContains(response, '5 orders force filled')
+        self.assertEqual(Order.objects.filter(status=Order.FILLED).count(), 5)
+
+    def test_large_selections_run_in_chunks(self):
+        with mock.patch.object(bulk_actions, 'CHUNK_SIZE', 4):
+            job = bulk_actions.submit('market_app.force_fill_orders', Order.objects.filter(status=Order.OPEN),
+                                      self.admin, background=False)
+        self.assertEqual(job.status, BulkActionJob.PENDING)
+        self.assertEqual(job.pks, [order.pk for order in self.orders])
+
+        call_command('run_bulk_actions', '--chunk-size', '7', stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.affected), (BulkActionJob.DONE, 30, 30))
+        self.assertEqual(Order.objects.filter(status=Order.FILLED).count(), 30)
+        self.assertEqual(self.client.get('/admin/core_app/bulkactionjob/').status_code, 200)
+        self.assertEqual(self.client.get(f'/admin/core_app/bulkactionjob/{job.pk}/change/').status_code, 200)
+
+
+class AdminListTests(EngineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser(username='root', phone='9', password='x'))
+        self.orders = [self.order(self.alice, Order.SELL, '1', 100 + i) for i in range(60)]
+
+    def test_large_tables_list(self):
+        for model in ('order', 'trade', 'futuresposition', 'liquidation', 'fundingpayment', 'market'):
+            self.assertEqual(self.client.get(f'/admin/market_app/{model}/').status_code, 200, model)
+        self.assertEqual(self.client.get('/admin/account_app/ledgerentry/').status_code, 200)
+
+    def test_orders_page_by_id_instead_of_offset(self):
+        response = self.client.get('/admin/market_app/order/')
+        next_url = response.context['cl'].next_keyset_url
+        self.assertContains(response, 'Older')
+
+        response = self.client.get('/admin/market_app/order/' + next_url)
+        self.assertContains(response, 'Newest')
+        self.assertEqual([order.pk for order in response.context['cl'].result_list],
+                         [order.pk for order in reversed(self.orders[:10])])
+
+
+class TradeSignalTests(EngineTestCase):
+
+    def test_failing_receivers_are_logged(self):
+        def broken(sender, **kwargs):
+            raise ValueError('broken receiver')
+
+        trades_persisted.connect(broken, sender=Trade)
+        self.addCleanup(trades_persisted.disconnect, broken, sender=Trade)
+        self.place(self.alice, Order.SELL, '1', '100')
+        with self.assertLogs('market_app.engine.persistence', 'ERROR') as logs, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.place(self.bob, Order.BUY, '1', '100')
+
+        self.assertIn('broken receiver', logs.output[0])
+        # the other receivers still ran
+        self.assertEqual(prices.get_last_price(self.market.pk), Decimal(100))
+
+
+class FeeVolumeTests(EngineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        Currency.objects.filter(pk=self.usdt.pk).update(is_stable_coin=True)
+        registry.reset()
+        FeeTier.objects.create(level=1, name='VIP1', min_volume=Decimal(150), maker_fee=Decimal('0.0005'),
+                               taker_fee=Decimal('0.001'))
+
+    def trade(self, price='100'):
+        with self.captureOnCommitCallbacks(execute=True):
+            maker = self.place(self.alice, Order.SELL, '1', price)
+            taker = self.place(self.bob, Order.BUY, '1', price)
+        maker.refresh_from_db()
+        return maker, taker
+
+    def test_volume_moves_users_up_a_tier(self):
+        self.trade()
+        self.assertEqual(UserDailyVolume.objects.get(user=self.alice).quote_volume, Decimal(100))
+        self.assertIsNone(fees.get_user_tier(self.bob.pk))
+
+        self.trade()
+        volume = UserDailyVolume.objects.get(user=self.bob)
+        self.assertEqual((volume.quote_volume, volume.trade_count), (Decimal(200), 2))
+        self.assertEqual(fees.get_user_tier(self.bob.pk).name, 'VIP1')
+        maker, taker = self.trade()
+        self.assertEqual((maker.fee, taker.fee), (Decimal('0.05'), Decimal('0.001')))
+
+    def test_volume_is_stored_with_the_trades(self):
+        self.place(self.alice, Order.SELL, '1', '100')
+        with mock.patch.object(EngineState.objects, 'filter', side_effect=RuntimeError('database down')):
+            with self.assertRaises(RuntimeError):
+                self.place(self.bob, Order.BUY, '1', '100')
+
+        self.assertFalse(Trade.objects.exists())
+        self.assertFalse(UserDailyVolume.objects.exists())
+
+
+class MassCancelTests(EngineTestCase):
+
+    def test_cancel_all_removes_the_orders_from_the_book(self):
+        asks = [self.place(self.alice, Order.SELL, '1', str(100 + index)) for index in range(3)]
+        bid = self.place(self.alice, Order.BUY, '1', '50')
+        stop = self.place(self.alice, Order.BUY, '1', '300', Order.STOP_LIMIT, stop_price=Decimal(200))
+        other = self.place(self.bob, Order.SELL, '1', '500')
+        self.place(self.bob, Order.BUY, '0.5', '100')
+        self.client.force_login(self.alice)
+
+        response = self.client.post('/market/orders/cancel-all/', {'market': self.market.pk, 'side': Order.SELL})
+        self.assertEqual(sorted(response.json()['cancelled']), [order.pk for order in asks])
+        response = self.client.post('/market/orders/cancel-all/')
+        self.assertEqual(sorted(response.json()['cancelled']), [bid.pk, stop.pk])
+
+        self.assertEqual({self.status(order) for order in asks + [bid, stop]}, {Order.CANCELLED})
+        self.assertEqual(list(self.book().orders), [other.pk])
+        self.assertEqual(len(service.get_engine(self.market).engine.triggers), 0)
+        self.assertEqual(holds.get_holds().account(self.alice.pk, self.usdt.pk).locked, 0)
+
+    def test_other_processes_send_one_command_for_every_market(self):
+        eth = Currency.objects.create(symbol='ETH', name='Ether')
+        eth_market = Market.objects.create(base_currency=eth, quote_currency=self.usdt,
+                                           min_order_amount=Decimal('0.0001'))
+        orders = [self.place(self.alice, Order.BUY, '1', '100')]
+        orders.append(Order.objects.create(user=self.alice, market=eth_market, side=Order.BUY,
+                                           order_type=Order.LIMIT, amount=Decimal(1), price=Decimal(10)))
+        service.place_order(orders[-1])
+
+        with override_settings(MATCHING_ENGINE_OWNER=False), \
+                mock.patch.object(service, 'send_command', return_value=[]) as send_command:
+            service.cancel_user_orders(self.alice.pk)
+        send_command.assert_called_once_with(None, EngineCommand.CANCEL_USER_ORDERS,
+                                             {'user_id': self.alice.pk, 'side': None})
+
+        command = EngineCommand.objects.create(action=EngineCommand.CANCEL_USER_ORDERS,
+                                               payload={'user_id': self.alice.pk, 'side': None})
+        self.assertEqual(service.run_commands(), 1)
+        command.refresh_from_db()
+        self.assertEqual(sorted(command.result), [order.pk for order in orders])
+        self.assertEqual({self.status(order) for order in orders}, {Order.CANCELLED})
+
+    def test_orders_missing_from_the_book_are_cancelled_too(self):
+        placed = self.place(self.alice, Order.SELL, '1', '100')
+        # saved while the engine was running, never handed to it
+        service.get_engine(self.market)
+        unplaced = self.order(self.alice, Order.SELL, '1', '101')
+
+        cancelled = service.cancel_orders(self.market, [placed.pk, unplaced.pk])
+
+        self.assertEqual(sorted(cancelled), [placed.pk, unplaced.pk])
+        self.assertEqual((self.status(placed), self.status(unplaced)), (Order.CANCELLED, Order.CANCELLED))
+
+
+class TradeLedgerTests(EngineTestCase):
+    funds = None
+
+    def test_fills_move_balances_and_fees_through_the_ledger(self):
+        ledger.deposit(self.alice, self.btc, Decimal(5))
+        ledger.deposit(self.bob, self.usdt, Decimal(1000))
+        self.place(self.alice, Order.SELL, '1', '100')
+        self.place(self.bob, Order.BUY, '0.5', '100')
+
+        # خریدار کارمزد را به ارز پایه و فروشنده به ارز مظنه می‌دهد
+        self.assertEqual(ledger.balance(self.alice.pk, self.btc.pk), Decimal('4.5'))
+        self.assertEqual(ledger.balance(self.alice.pk, self.usdt.pk), Decimal('49.95'))
+        self.assertEqual(ledger.balance(self.bob.pk, self.btc.pk), Decimal('0.499'))
+        self.assertEqual(ledger.balance(self.bob.pk, self.usdt.pk), Decimal(950))
+        self.assertEqual(ledger.balance(None, self.btc.pk, LedgerEntry.FEES), Decimal('0.001'))
+        self.assertEqual(ledger.balance(None, self.usdt.pk, LedgerEntry.FEES), Decimal('0.05'))
+        self.assertEqual(ledger.unbalanced_movements(), [])
+
+
+class TrailingFlushTests(EngineTestCase):
+
+    def locked(self, user, currency):
+        return Wallet.objects.get(user=user, currency=currency).locked
+
+    @override_settings(HOLDS_FLUSH_INTERVAL=1000)
+    def test_held_back_holds_are_written_on_close(self):
+        self.place(self.alice, Order.BUY, '1', '100')
+        self.place(self.alice, Order.BUY, '1', '100')
+        self.assertEqual(self.locked(self.alice, self.usdt), Decimal(100))
+
+        self.assertEqual(holds.flush_holds(), 0)
+        service.reset_engines()
+        self.assertEqual(self.locked(self.alice, self.usdt), Decimal(200))
+
+    def test_held_back_holds_are_written_after_the_interval(self):
+        with override_settings(HOLDS_FLUSH_INTERVAL=1000):
+            self.place(self.alice, Order.SELL, '1', '100')
+            self.place(self.alice, Order.SELL, '1', '100')
+        self.assertEqual(self.locked(self.alice, self.btc), Decimal(1))
+
+        with override_settings(HOLDS_FLUSH_INTERVAL=0):
+            self.assertEqual(holds.flush_holds(), 1)
+        self.assertEqual(self.locked(self.alice, self.btc), Decimal(2))
+
+
+class EngineOwnerTests(EngineTestCase):
+
+    def test_a_second_process_can_not_open_a_running_engine(self):
+        handle = service.get_engine(self.market)
+        with self.assertRaises(service.EngineBusy):
+            service._lock_directory(handle.directory)
+        service.reset_engines()
+        service._lock_directory(handle.directory).close()
+
+    def test_other_processes_only_queue_commands(self):
+        order = self.place(self.alice, Order.BUY, '1', '100')
+        service.reset_engines()
+        with override_settings(MATCHING_ENGINE_OWNER=False):
+            with self.assertRaises(service.EngineUnavailable):
+                service.get_engine(self.market)
+            with self.assertRaises(RuntimeError):
+                service.cancel_orders(self.market, [order.pk])
+
+    def test_the_owner_runs_queued_commands(self):
+        order = self.place(self.alice, Order.BUY, '1', '100')
+        command = EngineCommand.objects.create(market=self.market, action=EngineCommand.CANCEL_ORDERS,
+                                               payload={'order_ids': [order.pk]})
+
+        self.assertEqual(service.run_commands(), 1)
+
+        command.refresh_from_db()
+        self.assertEqual((command.status, command.result), (EngineCommand.DONE, [order.pk]))
+        self.assertEqual(self.status(order), Order.CANCELLED)
+        self.assertEqual(service.run_commands(), 0)
+
+    def test_other_processes_read_the_published_depth(self):
+        self.place(self.alice, Order.BUY, '1', '100')
+        handle = service.get_engine(self.market)
+        self.assertTrue(service.publish_depth(handle))
+        self.assertFalse(service.publish_depth(handle))
+        sequence = handle.engine.book.sequence
+
+        with override_settings(MATCHING_ENGINE_OWNER=False):
+            depth = service.depth_snapshot(self.market, 5)
+            self.assertEqual(depth['sequence'], sequence)
+            self.assertEqual(len(depth['bids']), 1)
+            self.assertEqual(service.depth_deltas(self.market, sequence), [])
+            self.assertIsNone(service.depth_deltas(self.market, sequence - 1))
+
+    def test_other_processes_serve_the_published_deltas(self):
+        handle = service.get_engine(self.market)
+        self.place(self.alice, Order.BUY, '1', '100')
+        service.publish_depth(handle)
+        sequence = handle.engine.book.sequence
+        self.place(self.alice, Order.BUY, '2', '100')
+        self.place(self.alice, Order.SELL, '1', '101')
+        service.publish_depth(handle)
+
+        with override_settings(MATCHING_ENGINE_OWNER=False):
+            self.assertEqual(service.depth_deltas(self.market, sequence), [
+                [sequence + 1, Order.BUY, '100.00', '3.000000'], [sequence + 2, Order.SELL, '101.00', '1.000000']])
+            self.assertEqual(service.depth_deltas(self.market, sequence + 1),
+                             [[sequence + 2, Order.SELL, '101.00', '1.000000']])
+            self.assertIsNone(service.depth_deltas(self.market, sequence + 3))
+
+        # فقط آخرین تغییر منتشر می‌شود
+        handle.published_deltas = deque(maxlen=1)
+        self.place(self.alice, Order.BUY, '1', '99')
+        self.place(self.alice, Order.BUY, '1', '98')
+        service.publish_depth(handle)
+        with override_settings(MATCHING_ENGINE_OWNER=False):
+            self.assertIsNone(service.depth_deltas(self.market, sequence + 2))
+            self.assertEqual(len(service.depth_deltas(self.market, sequence + 3)), 1)
+
+
+class ReplayTests(EngineTestCase):
+
+    def restart(self):
+        service.reset_engines()
+        holds.reset_holds()
+        return service.get_engine(self.market)
+
+    def test_an_input_stored_before_the_crash_is_not_stored_again(self):
+        maker = self.place(self.alice, Order.SELL, '1', '100')
+        taker = self.order(self.bob, Order.BUY, '1', '100')
+        with mock.patch.object(service, 'commit_record', side_effect=RuntimeError('crash')):
+            with self.assertRaises(RuntimeError):
+                service.place_order(taker)
+        sequence = EngineState.objects.get(pk=self.market.pk).applied_sequence
+
+        handle = self.restart()
+
+        self.assertEqual(Trade.objects.count(), 2)
+        self.assertEqual((self.status(maker), self.status(taker)), (Order.FILLED, Order.FILLED))
+        self.assertEqual(ledger.unbalanced_movements(), [])
+        self.assertEqual(len(handle.engine.book), 0)
+        self.assertEqual(EngineState.objects.get(pk=self.market.pk).applied_sequence, sequence)
+        self.assertEqual(ledger.balance(self.bob.pk, self.usdt.pk), self.funds - 100)
+
+    def test_a_journal_behind_the_database_is_rebuilt_from_it(self):
+        resting = self.place(self.alice, Order.SELL, '1', '100')
+        self.place(self.bob, Order.BUY, '0.5', '100')
+        EngineState.objects.filter(pk=self.market.pk).update(applied_sequence=10 ** 6)
+
+        handle = self.restart()
+
+        self.assertEqual(list(handle.engine.book.orders), [resting.pk])
+        self.assertEqual(handle.engine.book.orders[resting.pk].remaining, handle.engine.scale.amount('0.5'))
+        self.assertEqual(EngineState.objects.get(pk=self.market.pk).applied_sequence, handle.journal.sequence)
+
+    def test_a_failed_store_discards_the_engine(self):
+        maker = self.place(self.alice, Order.SELL, '1', '100')
+        taker = self.order(self.bob, Order.BUY, '1', '100')
+        handle = service.get_engine(self.market)
+        with mock.patch('market_app.engine.recovery.persist', side_effect=RuntimeError('database down')):
+            with self.assertRaises(RuntimeError):
+                service.place_order(taker)
+        self.assertTrue(handle.closed)
+
+        self.assertIsNot(service.get_engine(self.market), handle)
+        self.assertEqual((self.status(maker), self.status(taker)), (Order.FILLED, Order.FILLED))
+        self.assertEqual(Trade.objects.count(), 2)
+
+    def test_snapshots_rotate_the_journal(self):
+        handle = service.get_engine(self.market)
+        with override_settings(MATCHING_SNAPSHOT_EVERY=3):
+            orders = [self.place(self.alice, Order.SELL, '1', str(100 + index)) for index in range(30)]
+        snapshots = list_snapshots(handle.directory)
+        self.assertEqual(len(snapshots), 5)
+        self.assertLessEqual(len(list_journals(handle.directory)), 6)
+        self.assertLessEqual(list_journals(handle.directory)[0][0], snapshots[0][0])
+
+        handle = self.restart()
+
+        self.assertEqual(sorted(handle.engine.book.orders), sorted(order.pk for order in orders))
+
+    def test_a_torn_journal_tail_is_dropped(self):
+        path = os.path.join(tempfile.mkdtemp(dir=settings.MATCHING_ENGINE_DIR), 'journal.log')
+        journal = Journal(path, capacity=64)
+        for index in range(50):
+            journal.append({'index': index, 'padding': 'x' * index})
+        journal.close()
+
+        journal = Journal(path)
+        self.assertEqual(journal.sequence, 50)
+        self.assertEqual([record['index'] for _, record in journal.read(45)], [45, 46, 47, 48, 49])
+        journal._map[journal.offset - 3] ^= 0xFF
+        journal.close()
+        self.assertEqual(Journal(path).sequence, 49)
+
+    def test_a_journaled_input_that_was_never_applied_is_replayed(self):
+        for index in range(10):
+            self.place(self.alice, Order.SELL, '1', str(100 + index))
+        handle = service.get_engine(self.market)
+        taker = self.order(self.bob, Order.BUY, '3', '105')
+        handle.journal.append(place_record(BookOrder.from_order(taker, handle.engine.scale)))
+        handle.journal.sync()
+
+        handle = self.restart()
+
+        self.assertEqual(self.status(taker), Order.FILLED)
+        self.assertEqual(Trade.objects.count(), 6)
+        self.assertEqual(len(handle.engine.book), 7)
+        output = StringIO()
+        call_command('replay_journal', self.market.pk, stdout=output)
+        self.assertIn('0 mismatches', output.getvalue())
+
+    def test_a_lost_engine_directory_is_rebuilt_from_the_database(self):
+        self.place(self.alice, Order.SELL, '1', '100')
+        service.reset_engines()
+        shutil.rmtree(settings.MATCHING_ENGINE_DIR)
+
+        self.assertEqual(self.place(self.bob, Order.BUY, '1', '200').status, Order.FILLED)
+
+
+class SharedStateTests(TestCase):
+
+    def test_market_names_do_not_query_inactive_currencies(self):
+        btc = Currency.objects.create(symbol='BTC', name='Bitcoin', is_active=False)
+        usdt = Currency.objects.create(symbol='USDT', name='Tether')
+        market = Market.objects.create(base_currency=btc, quote_currency=usdt, min_order_amount=Decimal('0.0001'))
+        registry.reset()
+        registry.get_registry()
+        market = Market.objects.get(pk=market.pk)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(str(market), 'BTC/USDT (Spot)')
+
+    def test_check_requires_a_shared_cache(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(CACHES=locmem):
+            self.assertEqual([error.id for error in check_shared_cache(None)], ['market_app.E001'])
+        self.assertEqual(check_shared_cache(None), [])
+
+
+class CandleTests(EngineTestCase):
+
+    def test_larger_candles_are_built_from_smaller_ones(self):
+        aggregator = candles.CandleAggregator(self.market.pk)
+        start = 1_700_000_000 // 86400 * 86400
+        trades = [(start + i * 37, Decimal(100 + i * 7 % 21 - 10), Decimal(1)) for i in range(3000)]
+        for timestamp, price, amount in trades:
+            aggregator.add_trade(timestamp, price, amount)
+        aggregator.advance(start + 2 * 86400)
+
+        self.assertEqual({candle.interval for candle in aggregator.closed}, set(Candle.INTERVAL_SECONDS))
+        for candle in aggregator.closed:
+            open_time = int(candle.open_time.timestamp())
+            inside = [trade for trade in trades
+                      if open_time <= trade[0] < open_time + Candle.INTERVAL_SECONDS[candle.interval]]
+            self.assertEqual(
+                (candle.open, candle.high, candle.low, candle.close, candle.volume),
+                (inside[0][1], max(trade[1] for trade in inside), min(trade[1] for trade in inside),
+                 inside[-1][1], len(inside)))
+
+    def test_the_running_candle_includes_open_children(self):
+        aggregator = candles.CandleAggregator(self.market.pk)
+        start = 1_700_000_000 // 3600 * 3600
+        for i in range(10):
+            aggregator.add_trade(start + i * 60 + 1, Decimal(100 + i), Decimal(1))
+
+        bar = aggregator.current(Candle.ONE_HOUR)
+        self.assertEqual((bar.open_time, bar.open, bar.close, bar.volume), (start, 100, 109, 10))
+        bar = aggregator.current(Candle.FIVE_MINUTES)
+        self.assertEqual((bar.open_time, bar.open, bar.volume), (start + 300, 105, 5))
+
+    def test_the_open_candle_is_served_with_the_stored_ones(self):
+        self.place(self.alice, Order.SELL, '1', '100')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.place(self.bob, Order.BUY, '1', '100')
+
+        response = self.client.get(f'/market/{self.market.pk}/candles/', {'interval': Candle.ONE_HOUR})
+        [candle] = response.json()['candles']
+        self.assertEqual([Decimal(value) for value in candle[1:6]], [100, 100, 100, 100, 1])
+        self.assertEqual(candle[7], 1)
+        response = self.client.get(f'/market/{self.market.pk}/candles/', {'interval': '2h'})
+        self.assertEqual(response.status_code, 400)
+
+
+class TickerTests(EngineTestCase):
+
+    def test_the_window_matches_the_trades_inside_it(self):
+        rolling = ticker.RollingTicker(self.market.pk)
+        timestamp, trades = 1_700_000_000, []
+        for i in range(5000):
+            # بیشتر معاملات نزدیک هم هستند و گاهی بازار بیش از یک روز معامله ندارد
+            timestamp += 90000 if i % 1000 == 999 else (1, 5, 30, 200, 3000)[i % 5]
+            price, amount = Decimal(50 + i * 13 % 101), Decimal(1 + i % 5)
+            trades.append((timestamp, price, amount))
+            rolling.add_trade(timestamp, price, amount)
+            if i % 97 == 0:
+                snapshot = rolling.snapshot(timestamp)
+                oldest = (timestamp // 60 - ticker.WINDOW + 1) * 60
+                window = [trade for trade in trades if trade[0] >= oldest]
+                self.assertEqual(
+                    (Decimal(snapshot['volume']), snapshot['count'], Decimal(snapshot['high']),
+                     Decimal(snapshot['low']), Decimal(snapshot['open']), Decimal(snapshot['last'])),
+                    (sum(trade[2] for trade in window), len(window), max(trade[1] for trade in window),
+                     min(trade[1] for trade in window), window[0][1], price))
+
+        snapshot = rolling.snapshot(timestamp + 2 * 86400)
+        self.assertEqual((snapshot['count'], snapshot['high'], snapshot['volume']), (0, None, '0.00000000'))
+
+    def test_tickers_are_published_and_rebuilt_from_candles(self):
+        self.place(self.alice, Order.SELL, '1', '100')
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.place(self.bob, Order.BUY, '0.5', '100')
+
+        [published] = self.client.get('/market/tickers/').json()['tickers']
+        self.assertEqual((published['count'], published['volume']), (2, '1.00000000'))
+        ticker.reset_tickers()
+        ticker.refresh(self.market.pk)
+        self.assertEqual(self.client.get(f'/market/{self.market.pk}/ticker/').json(), published)
+
+
+class PriceTests(EngineTestCase):
+
+    def test_the_last_price_is_shared_through_the_cache(self):
+        self.assertIsNone(self.market.get_current_price())
+        self.place(self.alice, Order.SELL, '1', '100')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.place(self.bob, Order.BUY, '1', '100')
+        self.assertEqual(self.market.get_current_price(), Decimal(100))
+
+        prices.clear_local()
+        self.assertEqual(self.market.get_current_price(), Decimal(100))
+        cache.clear()
+        prices.clear_local()
+        self.assertEqual(self.market.get_current_price(), Decimal(100))
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                self.assertEqual(self.market.get_current_price(), Decimal(100))
+
+
+class RegistryTests(EngineTestCase):
+
+    def test_lookups_do_not_query(self):
+        registry.get_registry()
+        market = Market.objects.get(pk=self.market.pk)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(str(market), 'BTC/USDT (Spot)')
+            self.assertEqual(registry.get_market_by_pair('BTC', 'USDT').pk, self.market.pk)
+            self.assertEqual(registry.get_currency_by_symbol('BTC').pk, self.btc.pk)
+
+    def test_saved_changes_reload_the_registry(self):
+        loaded = registry.get_registry()
+        with self.captureOnCommitCallbacks(execute=True):
+            eth = Currency.objects.create(symbol='ETH', name='Ether')
+        self.assertIsNot(registry.get_registry(), loaded)
+        self.assertEqual(registry.get_currency_by_symbol('ETH').pk, eth.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.market.is_active = False
+            self.market.save()
+        self.assertIsNone(registry.get_market(self.market.pk))
+        self.assertEqual(self.client.get(f'/market/{self.market.pk}/depth/').status_code, 404)
+
+    def test_changes_of_other_processes_are_seen_after_the_interval(self):
+        loaded = registry.get_registry()
+        cache.incr(registry.VERSION_KEY)
+        self.assertIs(registry.get_registry(), loaded)
+
+        registry._checked_at -= registry.CHECK_INTERVAL + 1
+        self.assertIsNot(registry.get_registry(), loaded)
+
+
+class LiquidationColumnsTests(EngineTestCase):
+    market_type = Market.FUTURES
+    funds = None
+
+    def position(self, side=FuturesPosition.LONG, liquidation_price='90'):
+        return FuturesPosition.objects.create(
+            user=self.alice, market=self.market, side=side, amount=Decimal(2), entry_price=Decimal(100),
+            liquidation_price=Decimal(liquidation_price), margin=Decimal(10), initial_margin=Decimal(10),
+            maintenance_margin=Decimal(1), mark_price=Decimal(100))
+
+    def test_mark_prices_liquidate_crossed_positions(self):
+        long = self.position()
+        short = self.position(FuturesPosition.SHORT, '110')
+        columns = liquidation.get_positions(self.market.pk)
+        self.assertEqual(len(columns), 2)
+
+        service.on_mark_price(self.market, Decimal(90))
+
+        long.refresh_from_db()
+        self.assertEqual((long.status, long.realized_pnl), (FuturesPosition.LIQUIDATED, Decimal(-20)))
+        self.assertEqual(self.status(short), FuturesPosition.OPEN)
+        self.assertEqual(list(columns.rows), [short.pk])
+        self.assertEqual(Liquidation.objects.count(), 1)
+
+    def test_the_scan_finds_what_checking_each_position_finds(self):
+        columns = liquidation.PositionColumns(self.market.pk, 4)
+        positions = {}
+        for index in range(3000):
+            position = FuturesPosition(
+                id=index + 1, side=FuturesPosition.LONG if index % 2 else FuturesPosition.SHORT, amount=Decimal(1),
+                entry_price=Decimal(100), liquidation_price=Decimal(5000 + index * 7919 % 10000) / 100,
+                maintenance_margin=Decimal(1), unrealized_pnl=Decimal(0))
+            columns.upsert(position)
+            positions[position.id] = position
+        for position_id in range(1, 3001, 3):
+            columns.remove(position_id)
+            del positions[position_id]
+
+        price = Decimal('93.5')
+        self.assertEqual(set(columns.crossed(price).tolist()),
+                         {pk for pk, position in positions.items() if liquidation.is_crossed(position, price)})
+
+    def test_pnl_is_the_same_as_with_decimals(self):
+        columns = liquidation.PositionColumns(self.market.pk, 4)
+        positions = []
+        # نیمه‌های دقیق، مقادیر خیلی بزرگ و خیلی کوچک هم باید مثل Decimal گرد شوند
+        for index, (amount, entry_price) in enumerate([
+                ('0.5', '100'), ('0.5', '100.00000002'), ('1.5', '99.99999999'), ('0.00000001', '12345.6789'),
+                ('900000', '99999.99999999'), ('123.45678901', '0.00000001'), ('0.33333333', '100.00000003')]):
+            for side in (FuturesPosition.LONG, FuturesPosition.SHORT):
+                position = FuturesPosition(
+                    id=len(positions) + 1, side=side, amount=Decimal(amount), entry_price=Decimal(entry_price),
+                    liquidation_price=0, maintenance_margin=0, unrealized_pnl=0)
+                columns.upsert(position)
+                positions.append(position)
+
+        mark = Decimal('100.00000001')
+        ids, pnl = columns.pnl_changes(mark)
+        changed = dict(zip(ids.tolist(), pnl.tolist()))
+        for position in positions:
+            direction = 1 if position.side == FuturesPosition.LONG else -1
+            expected = (direction * (mark - position.entry_price) * position.amount).quantize(
+                Decimal('0.00000001'), ROUND_HALF_UP)
+            self.assertEqual(Decimal(changed.get(position.id, 0)).scaleb(-8), expected, position.id)
+
+    def test_changes_of_other_processes_reload_the_columns(self):
+        position = self.position()
+        columns = liquidation.get_positions(self.market.pk)
+        self.assertEqual(list(columns.crossed(Decimal(95))), [])
+
+        # another process moves the liquidation price with a set-based update and publishes it
+        with self.captureOnCommitCallbacks(execute=True):
+            FuturesPosition.objects.filter(pk=position.pk).update(liquidation_price=Decimal(96))
+            liquidation.publish_change(self.market.pk, applied=False)
+
+        self.assertEqual(list(liquidation.get_positions(self.market.pk).crossed(Decimal(95))), [position.pk])
+
+    def test_own_changes_keep_the_columns(self):
+        columns = liquidation.get_positions(self.market.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            position = self.position()
+
+        self.assertIs(liquidation.get_positions(self.market.pk), columns)
+        self.assertEqual(list(columns.rows), [position.pk])
+
+    def test_closing_positions_in_the_admin_drops_them(self):
+        position = self.position()
+        liquidation.get_positions(self.market.pk)
+        admin = site._registry[FuturesPosition]
+        request = RequestFactory().post('/')
+        with mock.patch.object(admin, 'message_user'), self.captureOnCommitCallbacks(execute=True):
+            admin.close_positions(request, FuturesPosition.objects.filter(pk=position.pk))
+
+        self.assertEqual(self.status(position), FuturesPosition.CLOSED)
+        self.assertEqual(len(liquidation.get_positions(self.market.pk)), 0)
+
+    def test_forced_liquidations_drop_positions_once_committed(self):
+        position = self.position()
+        columns = liquidation.get_positions(self.market.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            bulk_actions.submit('market_app.force_liquidate', FuturesPosition.objects.filter(pk=position.pk))
+        self.assertEqual(list(columns.rows), [position.pk])
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.status(position), FuturesPosition.LIQUIDATED)
+        self.assertEqual(len(liquidation.get_positions(self.market.pk)), 0)
+
+    @override_settings(MARK_PNL_FLUSH_INTERVAL=1)
+    def test_the_last_held_back_mark_is_written_later(self):
+        position = self.position()
+        self.assertEqual(mark.refresh_pnl(self.market, Decimal(101), now=0), 1)
+        self.assertEqual(mark.refresh_pnl(self.market, Decimal(102), now=0.5), 0)
+        self.assertEqual(mark.refresh_pnl(self.market, Decimal(103), now=0.6), 0)
+
+        self.assertEqual(mark.flush_pending_pnl(now=0.9), 0)
+        self.assertEqual(mark.flush_pending_pnl(now=1.5), 1)
+        position.refresh_from_db()
+        self.assertEqual((position.mark_price, position.unrealized_pnl), (Decimal(103), Decimal(6)))
+        self.assertEqual(mark.flush_pending_pnl(now=5), 0)
+
+
+class IndexPriceFeedTests(EngineTestCase):
+    market_type = Market.FUTURES
+    funds = None
+
+    def position(self, liquidation_price):
+        return FuturesPosition.objects.create(
+            user=self.alice, market=self.market, side=FuturesPosition.LONG, amount=Decimal(2),
+            entry_price=Decimal(100), liquidation_price=Decimal(liquidation_price), margin=Decimal(10),
+            initial_margin=Decimal(10), maintenance_margin=Decimal(1), mark_price=Decimal(100))
+
+    def run_engine_once(self):
+        # حلقه موتور بعد از اولین دور بیکار متوقف می‌شود
+        with mock.patch('time.sleep', side_effect=KeyboardInterrupt):
+            call_command('run_matching_engine', stdout=StringIO())
+
+    def test_fed_index_prices_move_the_mark_price_in_the_engine_process(self):
+        risky, safe = self.position('90'), self.position('80')
+        self.place(self.alice, Order.BUY, '1', '99')
+        self.place(self.bob, Order.SELL, '1', '101')
+        service.reset_engines()
+
+        errors = StringIO()
+        call_command('feed_index_prices', stdin=StringIO(f'{self.market.pk}=98\nnonsense\n'), stderr=errors)
+        self.assertIn('nonsense', errors.getvalue())
+        self.run_engine_once()
+
+        # بازه اول با وسط دفتر (100) شروع می‌شود
+        self.assertEqual(prices.get_mark_price(self.market.pk), Decimal(100))
+        self.assertEqual(self.status(risky), FuturesPosition.OPEN)
+
+        call_command('feed_index_prices', f'{self.market.pk}=87')
+        self.run_engine_once()
+
+        # بازه هموار شده تقریبا همان 2 می‌ماند و قیمت نشان از 90 پایین‌تر می‌رود
+        mark_price = prices.get_mark_price(self.market.pk)
+        self.assertTrue(Decimal(89) < mark_price < Decimal('89.01'), mark_price)
+        self.assertEqual(self.status(risky), FuturesPosition.LIQUIDATED)
+        safe.refresh_from_db()
+        self.assertEqual((safe.status, safe.mark_price, safe.unrealized_pnl),
+                         (FuturesPosition.OPEN, mark_price, (mark_price - 100) * 2))
+
+    def test_only_active_futures_markets_take_index_prices(self):
+        spot = Market.objects.create(base_currency=self.usdt, quote_currency=self.btc,
+                                     min_order_amount=Decimal('0.0001'))
+        registry.reset()
+        for entry in (f'{spot.pk}=1', f'{self.market.pk}=0', f'{self.market.pk}'):
+            with self.assertRaises(CommandError):
+                call_command('feed_index_prices', entry)
+        self.assertEqual(prices.get_index_prices([spot.pk, self.market.pk]), {})
+
+
+class FundingTests(EngineTestCase):
+    market_type = Market.FUTURES
+    funds = None
+
+    def test_settling_charges_margin_and_posts_ledger_rows(self):
+        FuturesPosition.objects.bulk_create([FuturesPosition(
+            user=self.alice if index % 2 else self.bob, market=self.market,
+            side=FuturesPosition.LONG if index % 3 else FuturesPosition.SHORT, amount=Decimal(2),
+            entry_price=Decimal(100), liquidation_price=Decimal(50), margin=Decimal(100), initial_margin=Decimal(100),
+            maintenance_margin=Decimal(1), mark_price=Decimal(100)) for index in range(10)])
+        rate = FundingRate.objects.create(market=self.market, rate=Decimal('0.0001'), next_funding_time=timezone.now())
+        bounds = list(funding.chunk_bounds(rate, 3))
+        # a run cut short after its first chunk
+        funding.settle_chunk(rate, *bounds[0])
+
+        self.assertEqual(funding.settle(rate, 3), 7)
+        self.assertEqual(funding.settle_chunk(rate, 0, 10 ** 9), 0)
+
+        self.assertEqual(FundingPayment.objects.count(), 10)
+        for position in FuturesPosition.objects.all():
+            charge = Decimal('0.02') if position.side == FuturesPosition.LONG else Decimal('-0.02')
+            self.assertEqual(position.margin, 100 - charge)
+        paid = {user.pk: -sum(payment.amount for payment in FundingPayment.objects.filter(user=user))
+                for user in (self.alice, self.bob)}
+        for user_id, amount in paid.items():
+            self.assertEqual(ledger.balance(user_id, self.usdt.pk, LedgerEntry.MARGIN), amount)
+        self.assertEqual(ledger.balance(None, self.usdt.pk, LedgerEntry.FUNDING), -sum(paid.values()))
+        self.assertEqual(ledger.unbalanced_movements(), [])
+        self.assertEqual(list(funding.due_rates()), [])
+
+
+class FixedPointTests(TestCase):
+
+    def test_fees_are_rounded_to_the_currency_decimals(self):
+        scale = get_scale(2, 4, 8, 2)
+        # 1.5 * 1234.56 * 0.001 = 1.85184 in the quote currency, which has two decimals
+        notional = scale.price('1234.56') * scale.amount('1.5')
+        self.assertEqual(scale.to_fee(scale.sell_fee(notional, scale.rate('0.001'))), Decimal('1.85'))
+        self.assertEqual(scale.to_fee(scale.buy_fee(scale.amount('1.2345'), scale.rate('0.001'))),
+                         Decimal('0.00123450'))
+
+    def test_market_scale_reads_the_currency_decimals(self):
+        btc = Currency.objects.create(symbol='BTC', name='Bitcoin', decimals=8)
+        irt = Currency.objects.create(symbol='IRT', name='Toman', decimals=0)
+        market = Market.objects.create(base_currency=btc, quote_currency=irt, min_order_amount=Decimal('0.0001'))
+        self.assertEqual(market_scale(market).as_tuple(), (market.price_precision, market.amount_precision, 8, 0))
+
+    def test_unrealized_pnl_is_exact(self):
+        columns = liquidation.PositionColumns(0)
+        columns.upsert(FuturesPosition(id=1, side=FuturesPosition.SHORT, amount=Decimal('123456.12345678'),
+                                       entry_price=Decimal('98765.43210987'), liquidation_price=0,
+                                       maintenance_margin=0, unrealized_pnl=0))
+        ids, pnl = columns.pnl_changes(Decimal('98765.43210988'))
+        expected = (-(Decimal('0.00000001') * Decimal('123456.12345678'))).quantize(Decimal('0.00000001'))
+        self.assertEqual(list(ids), [1])
+        self.assertEqual(Decimal(int(pnl[0])).scaleb(-8), expected)
+        self.assertEqual(len(columns.pnl_changes(Decimal('98765.43210988'))[0]), 0)
+
+
+class PrecisionChangeTests(EngineTestCase):
+
+    def test_precision_can_not_change_while_the_engine_runs(self):
+        service.get_engine(self.market)
+        admin = site._registry[Market]
+        # the form of one row of the editable changelist
+        form_class = admin.get_changelist_formset(RequestFactory().get('/')).form
+        data = {'is_active': True, 'price_precision': self.market.price_precision + 1,
+                'amount_precision': self.market.amount_precision}
+        self.assertFalse(form_class(data, instance=self.market).is_valid())
+
+        service.reset_engines()
+        self.assertTrue(form_class(data, instance=Market.objects.get(pk=self.market.pk)).is_valid())
+
+    def test_a_new_precision_rebuilds_the_book(self):
+        order = self.place(self.alice, Order.BUY, '1', '100.5')
+        service.reset_engines()
+        Market.objects.filter(pk=self.market.pk).update(price_precision=self.market.price_precision + 1)
+        self.market.refresh_from_db()
+
+        handle = service.get_engine(self.market)
+
+        self.assertEqual(handle.engine.scale.price_places, self.market.price_precision)
+        self.assertEqual(list(handle.engine.book.orders), [order.pk])
+
+    def test_a_partly_filled_order_is_cancelled_not_rejected(self):
+        order = self.order(self.alice, Order.BUY, '1', '100', status=Order.PARTIALLY_FILLED,
+                           filled_amount=Decimal('0.5'))
+        persistence.persist_reject(order.pk)
+        self.assertEqual(self.status(order), Order.CANCELLED)
+
+
+class DepthDeltaTests(EngineTestCase):
+
+    def test_deltas_follow_the_book_sequence(self):
+        self.place(self.alice, Order.BUY, '1', '100')
+        book = self.book()
+        sequence = book.sequence
+        self.place(self.alice, Order.BUY, '2', '100')
+
+        self.assertEqual(service.depth_deltas(self.market, book.sequence), [])
+        self.assertEqual(service.depth_deltas(self.market, sequence),
+                         [[book.sequence, Order.BUY, '100.00', '3.000000']])
+        self.assertIsNone(service.depth_deltas(self.market, book.sequence + 1))
+
+    def test_snapshots_and_deltas_over_http(self):
+        for side, amount, price in ((Order.SELL, '1', '100'), (Order.SELL, '2', '100'), (Order.SELL, '1', '101'),
+                                    (Order.BUY, '3', '99'), (Order.BUY, '1', '98')):
+            self.place(self.alice, side, amount, price)
+        snapshot = service.depth_snapshot(self.market, 2)
+        self.assertEqual(snapshot, {
+            'sequence': 5,
+            'bids': [['99.00', '3.000000'], ['98.00', '1.000000']],
+            'asks': [['100.00', '3.000000'], ['101.00', '1.000000']],
+        })
+        self.place(self.bob, Order.BUY, '1.5', '100')
+
+        url = f'/market/{self.market.pk}/depth/'
+        self.assertEqual(self.client.get(url, {'limit': 1}).json(),
+                         {'sequence': 7, 'bids': [['99.00', '3.000000']], 'asks': [['100.00', '1.500000']]})
+        self.assertEqual(self.client.get(url, {'since': snapshot['sequence']}).json(),
+                         {'deltas': [[6, Order.SELL, '100.00', '2.000000'], [7, Order.SELL, '100.00', '1.500000']]})
+
+
+class ArchiveTests(EngineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        settings = override_settings(ARCHIVE_DIR=directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        for index in range(4):
+            self.place(self.alice, Order.SELL, '1', str(100 + index))
+            self.place(self.bob, Order.BUY, '1', str(100 + index))
+        self.live = self.place(self.alice, Order.SELL, '1', '500')
+        self.closed_at = datetime(2025, 3, 10, tzinfo=dt_timezone.utc)
+        Order.objects.exclude(pk=self.live.pk).update(created_at=self.closed_at, updated_at=self.closed_at)
+        Trade.objects.update(created_at=datetime(2025, 4, 1, 0, 0, 1, tzinfo=dt_timezone.utc))
+
+    def test_history_is_the_same_after_archiving(self):
+        orders = archive.order_history(self.alice.pk)
+        trades = archive.trade_history(self.alice.pk)
+
+        self.assertEqual(archive.archive_closed_orders(timezone.now(), batch_size=3), (8, 8))
+
+        self.assertEqual(list(Order.objects.all()), [self.live])
+        self.assertEqual(archive.order_history(self.alice.pk), orders)
+        self.assertEqual(archive.trade_history(self.alice.pk), trades)
+        # هر دسته فایل‌های جدای خودش را دارد
+        self.assertEqual(len(archive._archived_files(self.market.pk, archive.ORDERS)), 3)
+        april = datetime(2025, 4, 1, tzinfo=dt_timezone.utc)
+        self.assertEqual(len(archive.read_archive(archive.TRADES, self.alice.pk, start=april)), 4)
+        self.assertEqual(archive.read_archive(archive.ORDERS, end=self.closed_at), [])
+
+    def test_rows_archived_twice_are_listed_once(self):
+        closed = Order.objects.exclude(pk=self.live.pk)
+        rows = archive._order_rows(closed)
+        path = archive.archive_path(self.market.pk, self.closed_at, archive.ORDERS, 1)
+        # بایگانی‌ای که پیش از پاک کردن ردیف‌ها قطع شده است
+        archive.write_archive(path, archive.ORDERS, rows)
+        closed.filter(user=self.alice).update(status=Order.CANCELLED)
+
+        history = archive.order_history(self.alice.pk)
+
+        self.assertEqual(len(history), 5)
+        self.assertEqual({row['status'] for row in history if row['id'] != self.live.pk}, {Order.CANCELLED})
+
+        archive.archive_closed_orders(timezone.now())
+        self.assertEqual(len(archive.read_archive(archive.ORDERS)), 8)
+
+
+class ClientOrderIdTests(EngineTestCase):
+
+    def test_client_order_ids_are_unique_across_months(self):
+        order = self.order(self.alice, Order.BUY, '1', '100', client_order_id='abc')
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=62))
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.order(self.bob, Order.BUY, '1', '100', client_order_id='abc')
+        with self.assertRaises(ValidationError):
+            Order(user=self.bob, market=self.market, side=Order.BUY, order_type=Order.LIMIT, amount=Decimal(1),
+                  client_order_id='abc').validate_unique()
+        self.assertEqual(list(OrderClientId.objects.values_list('client_order_id', 'order_id')), [('abc', order.pk)])
+
+    def test_changing_the_client_order_id_moves_the_claim(self):
+        order = self.order(self.alice, Order.BUY, '1', '100', client_order_id='abc')
+        order.client_order_id = 'def'
+        order.save()
+        self.order(self.bob, Order.BUY, '1', '100', client_order_id='abc')
+
+        self.assertEqual(OrderClientId.objects.get(order_id=order.pk).client_order_id, 'def')
@@ -0,0 +1,216 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.core.cache import cache
+
+from market_app import candles
+from market_app.models import Candle
+
+WINDOW = 24 * 60
+ZERO = Decimal(0)
+# مثل ستون‌های Candle و Trade
+QUANT = Decimal('0.00000001')
+
+_tickers = {}
+_tickers_lock = threading.Lock()
+
+
+class Bucket:
+    __slots__ = ('minute', 'open', 'high', 'low', 'close', 'volume', 'quote_volume', 'count')
+
+    def __init__(self, minute, open, high, low, close, volume, quote_volume, count):
+        self.minute = minute
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        self.quote_volume = quote_volume
+        self.count = count
+
+
+class RollingTicker:
+    """
+    24h statistics of one market over a ring of one-minute buckets.
+
+    Volume, quote volume and trade count are running sums: a trade adds to them and a bucket
+    leaving the window subtracts its totals. High and low come from monotonic queues of
+    ``(minute, price)``, so every update is amortized O(1) and no read walks the window.
+    """
+
+    def __init__(self, market_id):
+        self.market_id = market_id
+        self.buckets = [None] * WINDOW
+        self.first_minute = None
+        self.last_minute = None
+        self.last = None
+        self.volume = ZERO
+        self.quote_volume = ZERO
+        self.count = 0
+        self.highs = deque()
+        self.lows = deque()
+
+    @classmethod
+    def from_candles(cls, market_id, now=None):
+        """Rebuild the window from the 1m candles, stored and still open, e.g. after a restart."""
+        ticker = cls(market_id)
+        now = time.time() if now is None else now
+        since = datetime.fromtimestamp((int(now) // 60 - WINDOW + 1) * 60, dt_timezone.utc)
+        rows = Candle.objects.filter(
+            market_id=market_id, interval=Candle.ONE_MINUTE, open_time__gte=since,
+        ).order_by('open_time').values_list('open_time', 'open', 'high', 'low', 'close', 'volume', 'quote_volume',
+                                            'trade_count')
+        for open_time, open_, high, low, close, volume, quote_volume, count in rows:
+            ticker.add_bucket(Bucket(int(open_time.timestamp()) // 60, open_, high, low, close, volume, quote_volume,
+                                     count))
+        bar = candles.open_candle(market_id, Candle.ONE_MINUTE)
+        if bar is not None and (ticker.last_minute is None or bar.open_time // 60 > ticker.last_minute):
+            ticker.add_bucket(Bucket(bar.open_time // 60, bar.open, bar.high, bar.low, bar.close, bar.volume,
+                                     bar.quote_volume, bar.trade_count))
+        return ticker
+
+    def add_trade(self, timestamp, price, amount):
+        minute = int(timestamp) // 60
+        self.expire(minute)
+        bucket = self.buckets[minute % WINDOW]
+        if bucket is None or bucket.minute != minute:
+            self._start(Bucket(minute, price, price, price, price, amount, price * amount, 1))
+        else:
+            if price > bucket.high:
+                bucket.high = price
+            if price < bucket.low:
+                bucket.low = price
+            bucket.close = price
+            bucket.volume += amount
+            bucket.quote_volume += price * amount
+            bucket.count += 1
+            self.volume += amount
+            self.quote_volume += price * amount
+            self.count += 1
+            self._push_extremes(minute, price, price)
+        self.last = price
+        self.last_minute = max(minute, self.last_minute or minute)
+
+    def add_bucket(self, bucket):
+        self.expire(bucket.minute)
+        self._start(bucket)
+        self.last = bucket.close
+        self.last_minute = max(bucket.minute, self.last_minute or bucket.minute)
+
+    def expire(self, minute):
+        """Drop the buckets that fell out of the 24h window ending at ``minute``."""
+        oldest = minute - WINDOW + 1
+        if self.first_minute is None or self.first_minute >= oldest:
+            return
+        if oldest - self.first_minute >= WINDOW:
+            self.buckets = [None] * WINDOW
+            self.volume, self.quote_volume, self.count = ZERO, ZERO, 0
+            self.first_minute = None
+        else:
+            for old_minute in range(self.first_minute, oldest):
+                bucket = self.buckets[old_minute % WINDOW]
+                if bucket is not None and bucket.minute == old_minute:
+                    self.volume -= bucket.volume
+                    self.quote_volume -= bucket.quote_volume
+                    self.count -= bucket.count
+                    self.buckets[old_minute % WINDOW] = None
+            self.first_minute = self._next_filled(oldest, minute)
+        while self.highs and self.highs[0][0] < oldest:
+            self.highs.popleft()
+        while self.lows and self.lows[0][0] < oldest:
+            self.lows.popleft()
+
+    def snapshot(self, now=None):
+        now = time.time() if now is None else now
+        self.expire(int(now) // 60)
+        open_price = None
+        if self.first_minute is not None:
+            open_price = self.buckets[self.first_minute % WINDOW].open
+        change = None
+        if open_price and self.last is not None:
+            change = (self.last - open_price) / open_price * 100
+        return {
+            'market_id': self.market_id,
+            'last': _text(self.last),
+            'open': _text(open_price),
+            'high': _text(self.highs[0][1] if self.highs else None),
+            'low': _text(self.lows[0][1] if self.lows else None),
+            'volume': _text(self.volume),
+            'quote_volume': _text(self.quote_volume),
+            'change_percent': str(change.quantize(Decimal('0.01'))) if change is not None else None,
+            'count': self.count,
+        }
+
+    def _start(self, bucket):
+        self.buckets[bucket.minute % WINDOW] = bucket
+        if self.first_minute is None or bucket.minute < self.first_minute:
+            self.first_minute = bucket.minute
+        self.volume += bucket.volume
+        self.quote_volume += bucket.quote_volume
+        self.count += bucket.count
+        self._push_extremes(bucket.minute, bucket.high, bucket.low)
+
+    def _push_extremes(self, minute, high, low):
+        while self.highs and self.highs[-1][1] <= high:
+            self.highs.pop()
+        self.highs.append((minute, high))
+        while self.lows and self.lows[-1][1] >= low:
+            self.lows.pop()
+        self.lows.append((minute, low))
+
+    def _next_filled(self, start, end):
+        for minute in range(start, end + 1):
+            bucket = self.buckets[minute % WINDOW]
+            if bucket is not None and bucket.minute == minute:
+                return minute
+        return None
+
+
+def _text(value):
+    return format(value.quantize(QUANT), 'f') if value is not None else None
+
+
+def _cache_key(market_id):
+    return f'market:{market_id}:ticker'
+
+
+def get_ticker(market_id):
+    ticker = _tickers.get(market_id)
+    if ticker is None:
+        with _tickers_lock:
+            ticker = _tickers.get(market_id)
+            if ticker is None:
+                ticker = _tickers[market_id] = RollingTicker.from_candles(market_id)
+    return ticker
+
+
+def record_trades(market_id, trades):
+    """Feed persisted trades (taker rows only, one per fill) to the ticker and publish it."""
+    ticker = get_ticker(market_id)
+    with _tickers_lock:
+        for trade in trades:
+            if not trade.is_maker:
+                ticker.add_trade(trade.created_at.timestamp(), trade.price, trade.amount)
+        cache.set(_cache_key(market_id), ticker.snapshot(), None)
+
+
+def reset_tickers():
+    with _tickers_lock:
+        _tickers.clear()
+
+
+def refresh(market_id, now=None):
+    """
+    Republish a market's ticker rebuilt from its candles, so buckets leave the window even when
+    the market is quiet. Meant to run periodically outside the process that records the trades.
+    """
+    cache.set(_cache_key(market_id), RollingTicker.from_candles(market_id, now).snapshot(now), None)
+
+
+def read_tickers(market_ids):
+    """Published tickers of several markets with a single cache round trip."""
+    found = cache.get_many([_cache_key(market_id) for market_id in market_ids])
+    return [found[_cache_key(market_id)] for market_id in market_ids if _cache_key(market_id) in found]
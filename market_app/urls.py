@@ -0,0 +1,13 @@
+from django.urls import path
+
+from market_app import views
+
+app_name = 'market_app'
+
+urlpatterns = [
+    path('orders/cancel-all/', views.cancel_all_orders, name='cancel_all_orders'),
+    path('tickers/', views.market_tickers, name='tickers'),
+    path('<int:market_id>/ticker/', views.market_ticker, name='ticker'),
+    path('<int:market_id>/depth/', views.order_book_depth, name='depth'),
+    path('<int:market_id>/candles/', views.market_candles, name='candles'),
+]
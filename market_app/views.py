@@ -1,3 +1,88 @@
-from django.shortcuts import render
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_POST
 
-# Create your views here.
+from market_app import candles, registry, ticker
+from market_app.engine import service
+from market_app.models import Candle, Order
+
+MAX_CANDLES = 1500
+
+
+def get_active_market(market_id):
+    market = registry.get_market(market_id)
+    if market is None:
+        raise Http404("No active market matches the given query.")
+    return market
+
+
+def engine_unavailable(error):
+    return JsonResponse({'error': str(error)}, status=503)
+
+
+def order_book_depth(request, market_id):
+    market = get_active_market(market_id)
+    since = request.GET.get('since')
+    limit = request.GET.get('limit', '20')
+    limit = min(int(limit), service.DEPTH_LEVELS) if limit.isdigit() else 20
+    try:
+        if since is not None and since.isdigit():
+            deltas = service.depth_deltas(market, int(since))
+            if deltas is not None:
+                return JsonResponse({'deltas': deltas})
+        return JsonResponse(service.depth_snapshot(market, limit))
+    except service.EngineUnavailable as error:
+        return engine_unavailable(error)
+
+
+def market_candles(request, market_id):
+    market = get_active_market(market_id)
+    interval = request.GET.get('interval', Candle.ONE_MINUTE)
+    if interval not in Candle.INTERVAL_SECONDS:
+        return JsonResponse({'error': f"Unknown interval {interval!r}."}, status=400)
+    limit = request.GET.get('limit', '500')
+    limit = min(int(limit), MAX_CANDLES) if limit.isdigit() else 500
+
+    rows = Candle.objects.filter(market=market, interval=interval).order_by('-open_time').values_list(
+        'open_time', 'open', 'high', 'low', 'close', 'volume', 'quote_volume', 'trade_count')[:limit]
+    data = [
+        [int(open_time.timestamp()) * 1000, str(open_), str(high), str(low), str(close), str(volume),
+         str(quote_volume), trade_count]
+        for open_time, open_, high, low, close, volume, quote_volume, trade_count in reversed(rows)
+    ]
+    bar = candles.open_candle(market.pk, interval)
+    if bar is not None and (not data or bar.open_time * 1000 > data[-1][0]):
+        data.append(bar.to_list())
+        data = data[-limit:]
+    return JsonResponse({'interval': interval, 'candles': data})
+
+
+def market_tickers(request):
+    return JsonResponse({'tickers': ticker.read_tickers(registry.active_market_ids())})
+
+
+def market_ticker(request, market_id):
+    market = get_active_market(market_id)
+    data = ticker.read_tickers([market.pk])
+    if not data:
+        return JsonResponse({'error': 'No ticker published for this market yet.'}, status=404)
+    return JsonResponse(data[0])
+
+
+@require_POST
+def cancel_all_orders(request):
+    """Cancel every live order of the user, optionally only on one ``market`` and/or ``side``."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required.'}, status=401)
+    market = request.POST.get('market')
+    if market is not None:
+        if not market.isdigit():
+            return JsonResponse({'error': f"Invalid market {market!r}."}, status=400)
+        market = get_active_market(int(market))
+    side = request.POST.get('side')
+    if side is not None and side not in (Order.BUY, Order.SELL):
+        return JsonResponse({'error': f"Unknown side {side!r}."}, status=400)
+    try:
+        cancelled = service.cancel_user_orders(request.user.pk, market, side)
+    except service.EngineUnavailable as error:
+        return engine_unavailable(error)
+    return JsonResponse({'cancelled': cancelled})
@@ -1,4 +1,8 @@
 from django.contrib import admin
+from django.utils import timezone
+
+from core_app import bulk_actions
+from core_app.admin import background_action
 from .models import NewsletterCategory, NewsletterSubscription, Newsletter, NewsletterRecipient
 
 
@@ -60,13 +64,14 @@ class NewsletterAdmin(admin.ModelAdmin):
             obj.created_by = request.user
         super().save_model(request, obj, form, change)
 
-    def send_newsletter(self, request, queryset):
-        for newsletter in queryset:
-            if newsletter.status == Newsletter.DRAFT:
-                newsletter.status = Newsletter.SCHEDULED
-                newsletter.save()
-                self.message_user(request, f"Newsletter '{newsletter.title}' scheduled for sending.")
-    send_newsletter.short_description = "Send selected newsletters"
+    send_newsletter = background_action('newsletter_app.send_newsletter', "Send selected newsletters",
+                                        '{} newsletters scheduled for sending.')
+
+
+@bulk_actions.register('newsletter_app.send_newsletter')
+def schedule_newsletters(queryset):
+    return queryset.filter(status=Newsletter.DRAFT).update(status=Newsletter.SCHEDULED,
+                                                                 updated_at=timezone.now())
 
 
 @admin.register(NewsletterRecipient)
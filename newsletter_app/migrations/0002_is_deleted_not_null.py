@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-18 04:57
+
+from django.db import migrations, models
+
+from core_app.migration_helpers import backfill_is_deleted
+
+
+class Migration(migrations.Migration):
+    # تکه‌های backfill هر کدام جدا commit می‌شوند
+    atomic = False
+
+    dependencies = [
+        ('newsletter_app', '0001_initial'),
+    ]
+
+    operations = [
+        backfill_is_deleted(
+            'newsletter_app', 'newsletter', 'newslettercategory', 'newsletterrecipient', 'newslettersubscription',
+        ),
+        migrations.AlterField(
+            model_name='newsletter',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='newslettercategory',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='newsletterrecipient',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='newslettersubscription',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]